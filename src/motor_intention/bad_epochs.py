@@ -0,0 +1,140 @@
+"""Indexed table of bad epochs of all recordings.
+
+Bad epochs are annotated in one ``<basename>_bad_epochs.csv`` file per
+recording in ``DATA/bad_epochs``. The table here consolidates them once,
+indexed by recording basename and event id, so that stages look up bad
+epochs of a recording by binary search and match them with epoch
+selections in a vectorized way, instead of reading and scanning one file
+per recording.
+
+Every annotated recording has a placeholder row with event id
+``NO_EVENT``, so that recordings whose file lists no bad epochs are still
+known to be annotated.
+"""
+from __future__ import annotations
+
+import functools
+import pathlib
+
+import mne_bids
+import numpy as np
+import pandas as pd
+
+import motor_intention.project_constants as constants
+import motor_intention.result_loaders
+
+BAD_EPOCHS_DIR = constants.DATA / "bad_epochs"
+BAD_EPOCHS_TABLE = constants.DERIVATIVES / "bad_epochs" / "bad_epochs.csv"
+SUFFIX = "_bad_epochs.csv"
+INDEX = ["basename", "event_id"]
+# Event ids of epochs (``epochs.selection``) are never negative
+NO_EVENT = -1
+
+
+def recording_key(filename: str | pathlib.Path | mne_bids.BIDSPath) -> str:
+    """Return basename of recording without datatype suffix and extension.
+
+    E.g. ``sub-EL002_..._run-1_ieeg.vhdr`` and
+    ``sub-EL002_..._run-1_bad_epochs.csv`` both map to ``sub-EL002_..._run-1``.
+    """
+    if isinstance(filename, mne_bids.BIDSPath):
+        filename = filename.basename
+    name = pathlib.Path(filename).name.removesuffix(SUFFIX)
+    return name.split(".")[0].removesuffix("_ieeg")
+
+
+def build_table(bad_epochs_dir: pathlib.Path = BAD_EPOCHS_DIR) -> pd.DataFrame:
+    """Read bad epochs files of all recordings into one indexed table."""
+    if not bad_epochs_dir.is_dir():
+        msg = f"Directory not found: {bad_epochs_dir}"
+        raise ValueError(msg)
+    files = sorted(bad_epochs_dir.glob(f"*{SUFFIX}"))
+    tables = motor_intention.result_loaders.load_files(
+        files=files, load_file=_read_file
+    )
+    if not tables:
+        tables = [
+            pd.DataFrame(
+                {
+                    "basename": pd.Series(dtype=str),
+                    "event_id": pd.Series(dtype=np.int64),
+                }
+            )
+        ]
+    return pd.concat(tables).set_index(INDEX).sort_index()
+
+
+def write_table(table: pd.DataFrame, path: pathlib.Path) -> None:
+    """Write bad epochs table to CSV."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table.to_csv(path)
+
+
+def read_table(path: pathlib.Path = BAD_EPOCHS_TABLE) -> pd.DataFrame:
+    """Read bad epochs table, reusing it within a process until modified."""
+    return _read_table(str(path.resolve()), path.stat().st_mtime_ns)
+
+
+@functools.cache
+def _read_table(path: str, mtime_ns: int) -> pd.DataFrame:
+    return (
+        pd.read_csv(path, dtype={"basename": str, "event_id": np.int64})
+        .set_index(INDEX)
+        .sort_index()
+    )
+
+
+def _read_file(file: pathlib.Path) -> pd.DataFrame:
+    try:
+        data = pd.read_csv(file)
+    except pd.errors.EmptyDataError:
+        data = pd.DataFrame({"event_id": pd.Series(dtype=np.int64)})
+    data = data.drop(columns=data.columns[data.columns.str.match("Unnamed")])
+    data = pd.concat(
+        [pd.DataFrame({"event_id": [NO_EVENT]}), data], ignore_index=True
+    )
+    data["event_id"] = data["event_id"].astype(np.int64)
+    data.insert(0, "basename", recording_key(file))
+    return data
+
+
+def has_recording(
+    table: pd.DataFrame, filename: str | pathlib.Path | mne_bids.BIDSPath
+) -> bool:
+    """Return True if bad epochs were annotated for recording."""
+    return recording_key(filename) in table.index.get_level_values(0)
+
+
+def get_event_ids(
+    table: pd.DataFrame, filename: str | pathlib.Path | mne_bids.BIDSPath
+) -> np.ndarray:
+    """Return event ids of bad epochs of recording.
+
+    Recordings without annotated bad epochs have none.
+    """
+    key = recording_key(filename)
+    try:
+        rows = table.index.get_loc(key)
+    except KeyError:
+        return np.array([], dtype=np.int64)
+    event_ids = table.index[rows].get_level_values("event_id").to_numpy()
+    return event_ids[event_ids != NO_EVENT]
+
+
+def bad_mask(
+    table: pd.DataFrame,
+    filename: str | pathlib.Path | mne_bids.BIDSPath,
+    selection: np.ndarray,
+) -> np.ndarray:
+    """Return boolean mask of bad epochs in epoch selection of recording.
+
+    Parameters
+    ----------
+    table : pd.DataFrame
+        Bad epochs table as returned by ``read_table``.
+    filename : str | pathlib.Path | mne_bids.BIDSPath
+        Recording the epochs were created from.
+    selection : np.ndarray
+        Event ids of epochs, e.g. ``epochs.selection``.
+    """
+    return np.isin(selection, get_event_ids(table=table, filename=filename))
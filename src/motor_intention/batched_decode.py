@@ -0,0 +1,511 @@
+"""Batched LDA decoding of feature files with permutation importance.
+
+``pte_decode`` fits one model per cross-validation fold (and channel, for
+single-channel decoding) and computes feature importance by re-predicting
+once per permuted column. For the LDA pipelines of the decode task, the
+models of all folds and channels are fitted here at once with
+``lda_batch``, or with ``lag_features`` if preceding samples are used
+(``use_times`` > 1). The out-of-fold decision function of these models is
+saved with the balanced accuracy of every fold. The permutation importance
+of the same fold models on the same test folds is computed with
+``feature_importance.fold_importances``, so it belongs to these scores and
+not to those of ``pte_decode``. Models of current samples are saved with
+``decoders``, together with the name of the predictions file and the hash
+of the feature file they were fitted on, so that the fold decoders can be
+checked against the saved out-of-fold predictions.
+
+Trials and labels are derived from the label channel of a feature file. A
+trial starts at a rising edge of the label channel. Samples from
+``target_begin`` up to the trial onset are labeled as movement intention,
+samples from ``rest_begin`` to ``rest_end`` as rest (both relative to the
+onset, in seconds). Trials whose rest period starts less than ``dist_end``
+after the end of the previous trial, and bad epochs, are excluded. Every
+trial is one cross-validation fold.
+"""
+from __future__ import annotations
+
+import functools
+import pathlib
+import re
+from collections.abc import Sequence
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+
+import motor_intention.bad_epochs
+import motor_intention.decoders
+import motor_intention.decoding_times_helpers
+import motor_intention.feature_importance
+import motor_intention.feature_store
+import motor_intention.lag_features
+import motor_intention.lda_batch
+import motor_intention.project_constants as constants
+
+SUFFIX = "_FEATURES.csv"
+IMPORTANCE_SUFFIX = "_FeatureImportance.csv"
+PREDICTIONS_SUFFIX = "_BatchedPredictions.csv"
+BATCHED_SCORES_SUFFIX = "_BatchedScores.csv"
+DECODERS_SUFFIX = "_Decoders.npz"
+CHANNEL_TYPES = {"ecog": "ECOG", "dbs": "LFP"}
+# Equal priors, as balanced class weights of the decode task
+PRIORS = np.array([0.5, 0.5])
+
+
+def select_channels(
+    columns: Sequence[str],
+    subject: str,
+    types_used: Literal["ecog", "dbs"],
+    keywords: Sequence[str],
+) -> dict[str, list[str]]:
+    """Return feature columns of contralateral channels, by channel.
+
+    Channels are named ``<type>_<hemisphere>_...``, where the hemisphere
+    contralateral to the movement is that of ``ECOG_HEMISPHERES``.
+    """
+    prefix = (
+        f"{CHANNEL_TYPES[types_used]}_{constants.ECOG_HEMISPHERES[subject]}_"
+    )
+    metadata = motor_intention.feature_store.column_metadata(columns)
+    picks = metadata[
+        metadata["channel"].str.startswith(prefix)
+        & metadata["column"].map(
+            lambda column: any(keyword in column for keyword in keywords)
+        )
+    ]
+    return {
+        str(channel): group["column"].tolist()
+        for channel, group in picks.groupby("channel", sort=False)
+    }
+
+
+def trial_labels(
+    label: np.ndarray,
+    times: np.ndarray,
+    target_begin: float,
+    rest_begin: float,
+    rest_end: float,
+    dist_end: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return label and trial of every sample.
+
+    Parameters
+    ----------
+    label : np.ndarray
+        Label channel of shape (samples,). Movement is where it is above 0.
+    times : np.ndarray
+        Times of samples in seconds.
+    target_begin, rest_begin, rest_end : float
+        Begin of target period and rest period relative to trial onsets.
+    dist_end : float
+        Minimum time between end of a trial and begin of rest of the next.
+
+    Returns
+    -------
+    labels : np.ndarray
+        Boolean labels of shape (samples,), True in target periods.
+    trials : np.ndarray
+        Trial of every sample, of shape (samples,). Trials are numbered by
+        onset, counting excluded trials, in the same way as event ids of
+        bad epochs. Samples outside of target and rest periods, and samples
+        of excluded trials, are -1.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    edges = np.diff((np.asarray(label) > 0).astype(np.int8), prepend=0)
+    onsets = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    labels = np.zeros(len(times), dtype=bool)
+    trials = np.full(len(times), -1, dtype=np.int64)
+    end_previous = -np.inf
+    for trial, onset in enumerate(onsets):
+        time_onset = times[onset]
+        if (
+            time_onset + rest_begin >= times[0]
+            and time_onset + rest_begin >= end_previous + dist_end
+        ):
+            target = (times >= time_onset + target_begin) & (
+                times < time_onset
+            )
+            rest = (times >= time_onset + rest_begin) & (
+                times <= time_onset + rest_end
+            )
+            labels[target] = True
+            trials[target | rest] = trial
+        ends_trial = ends[ends > onset]
+        end_previous = times[ends_trial[0] if ends_trial.size else -1]
+    return labels, trials
+
+
+def decode_file(
+    file: pathlib.Path,
+    out_root: pathlib.Path,
+    channels_used: Literal["all", "single"],
+    types_used: Literal["ecog", "dbs"],
+    feature_keywords: Sequence[str],
+    label_channels: Sequence[str],
+    target_begin: float,
+    rest_begin: float,
+    rest_end: float,
+    dist_end: float,
+    use_times: int = 1,
+    normalization_mode: motor_intention.lag_features.NormalizationMode = None,
+    bad_epochs: pd.DataFrame | None = None,
+    feature_importance: bool = True,
+    save_decoders: bool = True,
+    importance_by: Literal["column", "band", "channel"] = "column",
+    n_repeats: int = 5,
+    random_state: int | None = 0,
+) -> pd.DataFrame | None:
+    """Fit LDA models of all folds and save their predictions.
+
+    Parameters
+    ----------
+    file : pathlib.Path
+        Feature file (``FEATURES.csv``) as projected for the decode task.
+        Time is in milliseconds, as written by ``pte_neuromodulation``.
+    out_root : pathlib.Path
+        Output directory of the decoding pipeline. Files are saved to
+        ``<out_root>/<feature folder>/<basename>_use_times-<use_times>``
+        with the suffixes ``_BatchedPredictions.csv`` (time in seconds,
+        trial, label and out-of-fold decision function of every channel of
+        used samples), ``_BatchedScores.csv`` (balanced accuracy of every
+        channel and fold) and ``_FeatureImportance.csv``. If ``use_times``
+        is 1, decoders of all folds and of all samples are saved to
+        ``<basename>_<channel>_Decoders.npz`` in the same folder.
+    channels_used : {"all", "single"}
+        Whether one model is fitted on all channels of the type, or one
+        model per channel.
+    types_used : {"ecog", "dbs"}
+        Channel type.
+    feature_keywords : Sequence[str]
+        Feature columns containing any of these keywords are used.
+    label_channels : Sequence[str]
+        Candidate label channels. The first one found in the file is used.
+    target_begin, rest_begin, rest_end, dist_end : float
+        Trial definition in seconds, see ``trial_labels``.
+    use_times : int
+        Number of samples used per time point. If > 1, models of every
+        channel are fitted on lagged features with ``lag_features``.
+    normalization_mode : {"by_latest_sample", None}
+        Normalization of preceding samples if ``use_times`` > 1.
+    bad_epochs : pd.DataFrame | None
+        Bad epochs table as returned by ``bad_epochs.read_table``.
+    feature_importance : bool
+        Whether the permutation importance of the fold models is computed.
+    save_decoders : bool
+        Whether decoders are saved if ``use_times`` is 1.
+    importance_by : {"column", "band", "channel"}
+        Feature columns permuted together, see
+        ``feature_importance.feature_groups``.
+    n_repeats : int
+        Number of permutations per group and fold.
+    random_state : int | None
+        Seed of permutations.
+
+    Returns
+    -------
+    pd.DataFrame | None
+        Importance of every group of feature columns, fold and channel, or
+        None if ``feature_importance`` is False.
+    """
+    basename = file.name.removesuffix(SUFFIX)
+    match = re.search(r"sub-([^_]+)", basename)
+    if match is None:
+        msg = f"Subject not found in file name: {file.name}."
+        raise ValueError(msg)
+    features = pd.read_csv(file)
+    label_channel = next(
+        (channel for channel in label_channels if channel in features), None
+    )
+    if label_channel is None:
+        msg = f"None of the label channels {label_channels} found in {file}."
+        raise ValueError(msg)
+    channels = select_channels(
+        columns=features.columns,
+        subject=match[1],
+        types_used=types_used,
+        keywords=feature_keywords,
+    )
+    if not channels:
+        msg = f"No {types_used} feature columns found in {file}."
+        raise ValueError(msg)
+    if channels_used == "all":
+        channels = {
+            "all": [
+                column for columns in channels.values() for column in columns
+            ]
+        }
+
+    labels, trials = trial_labels(
+        label=features[label_channel].to_numpy(),
+        times=features[motor_intention.feature_store.TIME].to_numpy() / 1000,
+        target_begin=target_begin,
+        rest_begin=rest_begin,
+        rest_end=rest_end,
+        dist_end=dist_end,
+    )
+    if bad_epochs is not None:
+        bad = motor_intention.bad_epochs.get_event_ids(
+            table=bad_epochs, filename=basename
+        )
+        trials[np.isin(trials, bad)] = -1
+    if use_times == 1:
+        models = _fit_current(
+            features=features, channels=channels, labels=labels, trials=trials
+        )
+    else:
+        models = _fit_lagged(
+            features=features,
+            channels=channels,
+            labels=labels,
+            trials=trials,
+            use_times=use_times,
+            normalization_mode=normalization_mode,
+        )
+    out_dir = out_root / file.parent.name
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"{basename}_use_times-{use_times}"
+    _save_predictions(
+        path=out_dir / f"{stem}{PREDICTIONS_SUFFIX}",
+        times=features[motor_intention.feature_store.TIME].to_numpy() / 1000,
+        trials=trials,
+        labels=labels,
+        models=models,
+        use_times=use_times,
+    )
+    # Decoders predict from named feature columns, which lagged models don't
+    if save_decoders and use_times == 1:
+        metadata = {
+            "feature_file": file.name,
+            "feature_hash": motor_intention.decoding_times_helpers.hash_file(
+                file
+            ),
+            "predictions": f"{stem}{PREDICTIONS_SUFFIX}",
+            "label_channel": label_channel,
+            "target_begin": target_begin,
+            "rest_begin": rest_begin,
+            "rest_end": rest_end,
+            "dist_end": dist_end,
+        }
+        for channel, model in models.items():
+            motor_intention.decoders.save_decoders(
+                path=out_dir / f"{basename}_{channel}{DECODERS_SUFFIX}",
+                decoders=_decoders(columns=channels[channel], model=model),
+                metadata=metadata | {"channel": channel},
+            )
+    if not feature_importance:
+        return None
+    importances = []
+    for channel, (X, y, folds, coef, intercept, _) in models.items():
+        groups = motor_intention.feature_importance.feature_groups(
+            channels[channel], by=importance_by
+        )
+        # Lags of a column are permuted together
+        n_columns = len(channels[channel])
+        groups = {
+            name: (columns[:, None] + n_columns * np.arange(use_times)).ravel()
+            for name, columns in groups.items()
+        }
+        importance = motor_intention.feature_importance.fold_importances(
+            X=X,
+            y=y,
+            folds=folds,
+            coef=coef,
+            intercept=intercept,
+            groups=groups,
+            n_repeats=n_repeats,
+            random_state=random_state,
+            n_jobs=1,
+        )
+        importances.append(importance.assign(channel=channel))
+    importance = pd.concat(importances, ignore_index=True)
+    importance.to_csv(out_dir / f"{stem}{IMPORTANCE_SUFFIX}", index=False)
+    return importance
+
+
+def _save_predictions(
+    path: pathlib.Path,
+    times: np.ndarray,
+    trials: np.ndarray,
+    labels: np.ndarray,
+    models: dict[str, tuple[np.ndarray, ...]],
+    use_times: int,
+) -> None:
+    """Save out-of-fold decision function and balanced accuracy per fold."""
+    # Samples without all preceding samples are not decoded
+    trials = trials.copy()
+    trials[: use_times - 1] = -1
+    used = trials >= 0
+    predictions = pd.DataFrame(
+        {
+            "time": times[used],
+            "trial": trials[used],
+            "label": labels[used],
+            **{channel: model[-1] for channel, model in models.items()},
+        }
+    )
+    predictions.to_csv(path, index=False)
+    scores = [
+        {
+            "channel": channel,
+            "fold": fold,
+            "balanced_accuracy": (
+                motor_intention.feature_importance.balanced_accuracy(
+                    group["label"], group[channel] > 0
+                )
+            ),
+        }
+        for channel in models
+        for fold, group in predictions.groupby("trial")
+    ]
+    pd.DataFrame(scores).to_csv(
+        path.with_name(
+            path.name.replace(PREDICTIONS_SUFFIX, BATCHED_SCORES_SUFFIX)
+        ),
+        index=False,
+    )
+
+
+def _decoders(
+    columns: Sequence[str], model: tuple[np.ndarray, ...]
+) -> dict[str, motor_intention.decoders.LinearDecoder]:
+    """Return decoders of all folds and of all used samples of channel."""
+    X, y, folds, coef, intercept, _ = model
+    coef_full, intercept_full = motor_intention.lda_batch.fit(
+        X=X[None], y=y, train=np.ones((1, len(y)), dtype=bool), priors=PRIORS
+    )
+    names = [f"fold_{fold}" for fold in np.unique(folds)]
+    names.append(motor_intention.decoders.FULL)
+    return {
+        name: motor_intention.decoders.LinearDecoder(
+            columns=tuple(columns),
+            coef=coef_name,
+            intercept=float(intercept_name),
+        )
+        for name, coef_name, intercept_name in zip(
+            names,
+            [*coef, coef_full[0, 0]],
+            [*intercept, intercept_full[0, 0]],
+            strict=True,
+        )
+    }
+
+
+def _fit_current(
+    features: pd.DataFrame,
+    channels: dict[str, list[str]],
+    labels: np.ndarray,
+    trials: np.ndarray,
+) -> dict[str, tuple[np.ndarray, ...]]:
+    """Fit models of all folds of all channels in one batch.
+
+    Returns features, labels, folds, coefficients, intercepts and the
+    out-of-fold decision function of the used samples of every channel.
+    """
+    n_columns = {
+        channel: len(columns) for channel, columns in channels.items()
+    }
+    if len(set(n_columns.values())) > 1:
+        msg = (
+            "All channels must have the same number of feature columns. Got:"
+            f" {n_columns}."
+        )
+        raise ValueError(msg)
+    used = trials >= 0
+    labels, trials = labels[used], trials[used]
+    X = np.stack(
+        [
+            features.loc[used, columns].to_numpy(dtype=np.float64)
+            for columns in channels.values()
+        ]
+    )
+    (
+        predictions,
+        coef,
+        intercept,
+    ) = motor_intention.lda_batch.cross_val_decision_function(
+        X=X, y=labels, folds=trials, priors=PRIORS, return_models=True
+    )
+    return {
+        channel: (
+            X[idx],
+            labels,
+            trials,
+            coef[idx],
+            intercept[idx],
+            predictions[idx],
+        )
+        for idx, channel in enumerate(channels)
+    }
+
+
+def _fit_lagged(
+    features: pd.DataFrame,
+    channels: dict[str, list[str]],
+    labels: np.ndarray,
+    trials: np.ndarray,
+    use_times: int,
+    normalization_mode: motor_intention.lag_features.NormalizationMode,
+) -> dict[str, tuple[np.ndarray, ...]]:
+    """Fit models of all folds of every channel on lagged features.
+
+    Lags reach into samples outside of trials, so all samples are passed
+    to ``lag_features`` and only the rows of used samples are selected.
+    Instead of the design matrix, models hold a function returning the rows
+    of a boolean mask of used samples.
+    """
+    # Row i of the design matrix is sample i + use_times - 1
+    labels, trials = labels[use_times - 1 :], trials[use_times - 1 :]
+    used = trials >= 0
+    fold_ids = np.unique(trials[used])
+    train = used[None, :] & (trials[None, :] != fold_ids[:, None])
+    models = {}
+    for channel, columns in channels.items():
+        values = features[columns].to_numpy(dtype=np.float64)
+        coef, intercept = motor_intention.lag_features.fit_lda(
+            features=values,
+            y=labels,
+            train=train,
+            use_times=use_times,
+            normalization_mode=normalization_mode,
+            priors=PRIORS,
+        )
+        # Rows of used samples are only copied per fold, not all at once
+        design = functools.partial(
+            _design_rows,
+            features=values,
+            rows=np.flatnonzero(used),
+            use_times=use_times,
+            normalization_mode=normalization_mode,
+        )
+        predictions = np.empty(used.sum())
+        for fold_idx, fold in enumerate(fold_ids):
+            test = trials[used] == fold
+            predictions[test] = (
+                design(test) @ coef[fold_idx] + intercept[fold_idx]
+            )
+        models[channel] = (
+            design,
+            labels[used],
+            trials[used],
+            coef,
+            intercept,
+            predictions,
+        )
+    return models
+
+
+def _design_rows(
+    mask: np.ndarray,
+    features: np.ndarray,
+    rows: np.ndarray,
+    use_times: int,
+    normalization_mode: motor_intention.lag_features.NormalizationMode,
+) -> np.ndarray:
+    """Return lagged design matrix rows of mask of used samples."""
+    return motor_intention.lag_features.design_rows(
+        features=features,
+        rows=rows[mask],
+        use_times=use_times,
+        normalization_mode=normalization_mode,
+    )
@@ -0,0 +1,223 @@
+"""Linear decoders that predict from named feature columns.
+
+Fitted decoders are saved as sets, e.g. the models of all cross-validation
+folds and the model fitted on all data, in one ``.npz`` file. A set stores
+the feature columns its models were fitted on (the schema), so that
+predicting on new feature files only loads these columns. Files carry a
+format version and are rejected by readers of another version.
+"""
+from __future__ import annotations
+
+import dataclasses
+import json
+import pathlib
+from collections.abc import Mapping, Sequence
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+import motor_intention.feature_store
+import motor_intention.lda_batch
+
+FORMAT_VERSION = 1
+FULL = "full"
+
+
+@dataclasses.dataclass(frozen=True)
+class LinearDecoder:
+    """Linear decoder, e.g. a fitted binary LDA.
+
+    Parameters
+    ----------
+    columns : tuple[str, ...]
+        Names of the feature columns the decoder was fitted on.
+    coef : np.ndarray
+        Coefficients of shape (features,).
+    intercept : float
+        Intercept of the decision function.
+    """
+
+    columns: tuple[str, ...]
+    coef: np.ndarray
+    intercept: float
+
+    def decision_function(
+        self, features: pd.DataFrame | pd.Series
+    ) -> np.ndarray | float:
+        """Return decision function of feature rows (or a single row)."""
+        values = features[list(self.columns)].to_numpy(dtype=np.float64)
+        return values @ self.coef + self.intercept
+
+    def save(self, path: pathlib.Path) -> None:
+        """Save decoder to ``.npz`` file as set with a single model."""
+        save_decoders(path=path, decoders={FULL: self})
+
+
+def fit_lda(
+    features: pd.DataFrame,
+    columns: Sequence[str],
+    labels: np.ndarray,
+    folds: np.ndarray | None = None,
+    priors: np.ndarray | None = None,
+) -> dict[str, LinearDecoder]:
+    """Fit binary LDA decoders of all cross-validation folds and all data.
+
+    Parameters
+    ----------
+    features : pd.DataFrame
+        Features of shape (samples, columns).
+    columns : Sequence[str]
+        Feature columns to fit on.
+    labels : np.ndarray
+        Binary labels of shape (samples,).
+    folds : np.ndarray | None
+        Fold of every sample, of shape (samples,). The model of a fold is
+        fitted on all other folds. Samples with a negative fold are always
+        used for training. If None, only the full-data model is fitted.
+    priors : np.ndarray | None
+        Class priors of shape (2,). If None, class proportions are used.
+
+    Returns
+    -------
+    dict[str, LinearDecoder]
+        Decoders named ``fold_<fold>`` and ``full``.
+    """
+    X = features[list(columns)].to_numpy(dtype=np.float64)[None]
+    names, train = [], []
+    if folds is not None:
+        folds = np.asarray(folds)
+        for fold in np.unique(folds[folds >= 0]):
+            names.append(f"fold_{fold}")
+            train.append(folds != fold)
+    names.append(FULL)
+    train.append(np.ones(len(X[0]), dtype=bool))
+    coef, intercept = motor_intention.lda_batch.fit(
+        X=X, y=labels, train=np.stack(train), priors=priors
+    )
+    return {
+        name: LinearDecoder(
+            columns=tuple(columns),
+            coef=coef[0, idx],
+            intercept=float(intercept[0, idx]),
+        )
+        for idx, name in enumerate(names)
+    }
+
+
+def save_decoders(
+    path: pathlib.Path,
+    decoders: Mapping[str, LinearDecoder],
+    metadata: Mapping[str, Any] | None = None,
+) -> None:
+    """Save set of decoders sharing the same feature columns.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        ``.npz`` file to write.
+    decoders : Mapping[str, LinearDecoder]
+        Decoders by name, e.g. as returned by ``fit_lda``.
+    metadata : Mapping[str, Any] | None
+        JSON-serializable information stored with the decoders, e.g. the
+        feature file and decoding parameters.
+    """
+    if not decoders:
+        msg = "At least one decoder must be given."
+        raise ValueError(msg)
+    columns = {decoder.columns for decoder in decoders.values()}
+    if len(columns) > 1:
+        msg = "All decoders of a set must use the same feature columns."
+        raise ValueError(msg)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        path,
+        version=FORMAT_VERSION,
+        columns=np.array(columns.pop()),
+        names=np.array(list(decoders)),
+        coef=np.stack([decoder.coef for decoder in decoders.values()]),
+        intercept=np.array(
+            [decoder.intercept for decoder in decoders.values()]
+        ),
+        metadata=json.dumps(dict(metadata or {})),
+    )
+
+
+def load_decoders(
+    path: pathlib.Path,
+) -> tuple[dict[str, LinearDecoder], dict[str, Any]]:
+    """Load set of decoders and its metadata saved with ``save_decoders``."""
+    with np.load(path) as npz:
+        version = int(npz["version"]) if "version" in npz else None
+        if version != FORMAT_VERSION:
+            msg = (
+                f"Unsupported decoder format version: {version}. Expected:"
+                f" {FORMAT_VERSION}. Refit and save decoders of {path}."
+            )
+            raise ValueError(msg)
+        columns = tuple(npz["columns"].tolist())
+        decoders = {
+            name: LinearDecoder(
+                columns=columns, coef=coef, intercept=float(intercept)
+            )
+            for name, coef, intercept in zip(
+                npz["names"].tolist(),
+                npz["coef"],
+                npz["intercept"],
+                strict=True,
+            )
+        }
+        metadata = json.loads(str(npz["metadata"]))
+    return decoders, metadata
+
+
+def load_decoder(path: pathlib.Path, name: str = FULL) -> LinearDecoder:
+    """Load single decoder of set, by default the full-data model."""
+    decoders, _ = load_decoders(path)
+    if name not in decoders:
+        msg = f"Decoder {name} not found in {path}. Got: {list(decoders)}."
+        raise ValueError(msg)
+    return decoders[name]
+
+
+def predict_file(
+    path: pathlib.Path,
+    decoders: Mapping[str, LinearDecoder],
+) -> pd.DataFrame:
+    """Predict with stored decoders on feature file without refitting.
+
+    Only time and the feature columns of the decoders are loaded from
+    binary (``FEATURES.npz``) or projected (``FEATURES.csv``) feature files.
+
+    Returns
+    -------
+    pd.DataFrame
+        Time and decision function of every decoder, one column per name.
+    """
+    columns = {decoder.columns for decoder in decoders.values()}
+    if len(columns) != 1:
+        msg = "All decoders must use the same feature columns."
+        raise ValueError(msg)
+    columns = list(columns.pop())
+    time = motor_intention.feature_store.TIME
+    if path.suffix == ".npz":
+        features = motor_intention.feature_store.read_features(
+            path=path, keywords=[], columns=[time, *columns]
+        )
+    else:
+        features = pd.read_csv(
+            path, usecols=lambda column: column in {time, *columns}
+        )
+    missing = [column for column in columns if column not in features]
+    if missing:
+        msg = f"Feature columns of decoders not found in {path}: {missing}."
+        raise ValueError(msg)
+    X = features[columns].to_numpy(dtype=np.float64)
+    coef = np.stack([decoder.coef for decoder in decoders.values()], axis=1)
+    intercept = np.array([decoder.intercept for decoder in decoders.values()])
+    predictions = pd.DataFrame(
+        X @ coef + intercept, columns=list(decoders), index=features.index
+    )
+    if time in features:
+        predictions.insert(0, time, features[time])
+    return predictions
@@ -0,0 +1,852 @@
+"""Helper functions for calculating earliest decoding times."""
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import hashlib
+import json
+import pathlib
+import tempfile
+from collections.abc import Hashable, Iterable, Iterator, Mapping
+from typing import Any
+
+import numpy as np
+from joblib import Parallel, delayed
+
+
+@contextlib.contextmanager
+def shared_array(
+    array: np.ndarray, temp_dir: pathlib.Path | str | None = None
+) -> Iterator[pathlib.Path]:
+    """Publish array once to a temporary file that workers can memory-map.
+
+    Workers only receive the yielded path and open the array with
+    ``load_shared_array``, so the array is not pickled for every task. The
+    file is removed when the context exits.
+    """
+    with tempfile.TemporaryDirectory(dir=temp_dir) as tmp:
+        path = pathlib.Path(tmp) / "array.npy"
+        np.save(path, np.ascontiguousarray(array))
+        yield path
+
+
+def load_shared_array(path: pathlib.Path | str) -> np.ndarray:
+    """Open array published with ``shared_array`` as read-only memory-map."""
+    return np.load(path, mmap_mode="r")
+
+
+def earliest_timepoints_adaptive(
+    data: np.ndarray,
+    tolerance: float,
+    max_iterations: int,
+    min_iterations: int = 100,
+    check_interval: int = 50,
+    n_jobs: int = 1,
+    chunk_size: int = 10,
+    rng: np.random.Generator | int | None = None,
+    temp_dir: pathlib.Path | str | None = None,
+    **kwargs,
+) -> tuple[np.ndarray, int]:
+    """Run iterations until the mean earliest timepoint converged.
+
+    Convergence is checked after ``min_iterations`` and then after every
+    further ``check_interval`` iterations. Iterations stop once the standard
+    error of the running mean is at most ``tolerance`` or ``max_iterations``
+    is reached. The iterations up to each check are split into chunks of
+    ``chunk_size`` that are shared by the workers. Every chunk has its own
+    seed drawn from ``rng``, so results do not depend on ``n_jobs``. The
+    length of the returned timepoints is the number of iterations used.
+    """
+    ((_, timepoints, trials_used),) = schedule_timepoints(
+        recordings={None: (data, {})},
+        n_iterations=max_iterations,
+        chunk_size=chunk_size,
+        n_jobs=n_jobs,
+        rng=rng,
+        temp_dir=temp_dir,
+        tolerance=tolerance,
+        min_iterations=min_iterations,
+        check_interval=check_interval,
+        **kwargs,
+    )
+    return timepoints, trials_used
+
+
+def schedule_timepoints(
+    recordings: Mapping[Hashable, tuple[np.ndarray, dict[str, Any]]],
+    n_iterations: int,
+    chunk_size: int = 50,
+    n_jobs: int = -1,
+    rng: np.random.Generator | int | None = None,
+    temp_dir: pathlib.Path | str | None = None,
+    checkpoint_dir: pathlib.Path | None = None,
+    index_bank_seed: int | None = None,
+    tolerance: float | None = None,
+    min_iterations: int = 100,
+    check_interval: int | None = None,
+    **kwargs,
+) -> Iterator[tuple[Hashable, np.ndarray, int]]:
+    """Compute earliest timepoints of many recordings on one work queue.
+
+    Every recording is split into chunks of iterations, and the chunks of all
+    recordings are submitted to a single worker pool, most expensive first.
+    Recordings are yielded as ``(key, timepoints, trials_used)`` as soon as
+    all of their chunks are done, so callers can write results early.
+
+    Parameters
+    ----------
+    recordings : Mapping
+        Maps a key to the predictions of shape (n_trials, n_times) and the
+        keyword arguments specific to this recording (e.g. ``times``). A
+        recording-specific ``rng`` seed takes precedence over ``rng``, and
+        a ``checkpoint_name`` enables checkpoints for this recording.
+    n_iterations : int
+        Number of iterations per recording. Maximum number of iterations if
+        ``tolerance`` is given.
+    chunk_size : int
+        Number of iterations per unit of work.
+    n_jobs : int
+        Number of workers.
+    rng : np.random.Generator | int | None
+        Random number generator or seed. Seeds of all chunks are drawn in the
+        order of ``recordings``, so results do not depend on scheduling.
+    temp_dir : pathlib.Path | str | None
+        Directory for the shared prediction arrays.
+    checkpoint_dir : pathlib.Path | None
+        If given, finished chunks of recordings with a ``checkpoint_name``
+        are saved to ``checkpoint_dir / f"{checkpoint_name}.json"`` and
+        chunks found there are not computed again. Checkpoints are removed
+        once the recording was consumed by the caller.
+    index_bank_seed : int | None
+        If given, random indices are taken from banks built once per shape
+        with ``get_index_bank`` and shared by all recordings with the same
+        number of trials, instead of being drawn from ``rng``. A bank is
+        built when the first chunk using it is submitted, published once to
+        the workers, and released when the last recording using it is
+        complete.
+    tolerance : float | None
+        If given, a recording is complete once the standard error of its mean
+        earliest timepoint is at most ``tolerance``. Only the chunks up to
+        the next convergence check of a recording are submitted at a time,
+        together with those of all other recordings. Chunks keep their
+        seeds, so the timepoints are the first iterations of the same run
+        without ``tolerance``.
+    min_iterations : int
+        Number of iterations before the first convergence check.
+    check_interval : int | None
+        Number of iterations between further convergence checks. Defaults to
+        ``chunk_size``.
+    **kwargs
+        Keyword arguments passed to ``earliest_timepoints_batched`` for all
+        recordings.
+    """
+    rng = np.random.default_rng(rng)
+    if check_interval is None:
+        check_interval = chunk_size
+    units: dict[Hashable, list[tuple[int, Hashable, int, int, dict]]] = {}
+    finished: dict[Hashable, dict[int, np.ndarray]] = {}
+    trials_used: dict[Hashable, int] = {}
+    checkpoints: dict[Hashable, pathlib.Path] = {}
+    # Arguments of index banks and recordings with chunks using them
+    bank_args: dict[tuple[int, ...], dict[str, int]] = {}
+    bank_users: dict[tuple[int, ...], set[Hashable]] = {}
+    recordings = {
+        key: (data, kwargs_rec.copy())
+        for key, (data, kwargs_rec) in recordings.items()
+    }
+    for key, (data, kwargs_rec) in recordings.items():
+        rng_rec = (
+            np.random.default_rng(kwargs_rec.pop("rng"))
+            if "rng" in kwargs_rec
+            else rng
+        )
+        checkpoint_name = kwargs_rec.pop("checkpoint_name", None)
+        finished[key] = {}
+        if checkpoint_dir is not None and checkpoint_name is not None:
+            checkpoints[key] = checkpoint_dir / f"{checkpoint_name}.json"
+            finished[key], trials = load_checkpoint(checkpoints[key])
+            if trials is not None:
+                trials_used[key] = trials
+        kwargs_all = {**kwargs, **kwargs_rec}
+        n_samples = data.shape[0]
+        resample_trials = kwargs_all.get("resample_trials")
+        if resample_trials is not None:
+            n_samples = min(n_samples, resample_trials)
+        n_perm = kwargs_all.get("n_perm", 1000)
+        cost = n_samples * data.shape[-1] * n_perm
+        starts = range(0, n_iterations, chunk_size)
+        if index_bank_seed is None:
+            seeds = rng_rec.integers(0, 2**63, size=len(starts))
+            kwargs_units = [{"rng": seed} for seed in seeds]
+        else:
+            args = {
+                "n_trials": data.shape[0],
+                "n_samples": n_samples,
+                "n_times": data.shape[-1],
+                "n_perm": n_perm,
+                "n_iterations": n_iterations,
+                "seed": index_bank_seed,
+            }
+            bank_key = tuple(args.values())
+            bank_args[bank_key] = args
+            kwargs_units = [
+                {"index_bank": bank_key, "iteration_offset": start}
+                for start in starts
+            ]
+        units[key] = [
+            (
+                min(chunk_size, n_iterations - start) * cost,
+                key,
+                chunk_idx,
+                min(chunk_size, n_iterations - start),
+                kwargs_unit,
+            )
+            for chunk_idx, (start, kwargs_unit) in enumerate(
+                zip(starts, kwargs_units, strict=True)
+            )
+        ]
+
+    def _n_done(key: Hashable) -> int:
+        """Number of leading chunks of recording that are finished."""
+        return next(
+            (
+                chunk_idx
+                for chunk_idx in range(len(units[key]))
+                if chunk_idx not in finished[key]
+            ),
+            len(units[key]),
+        )
+
+    def _next_chunks(key: Hashable) -> list[int] | None:
+        """Chunks to compute next, or None if recording is complete."""
+        n_chunks = len(units[key])
+        if tolerance is None:
+            missing = [
+                chunk_idx
+                for chunk_idx in range(n_chunks)
+                if chunk_idx not in finished[key]
+            ]
+            return missing or None
+        n_done = _n_done(key)
+        if n_done == n_chunks:
+            return None
+        iterations_done = n_done * chunk_size
+        if iterations_done >= max(min_iterations, 2):
+            timepoints = np.concatenate(
+                [finished[key][chunk_idx] for chunk_idx in range(n_done)]
+            )
+            sem = np.std(timepoints, ddof=1) / np.sqrt(timepoints.size)
+            if sem <= tolerance:
+                return None
+        target = max(min_iterations, iterations_done + check_interval)
+        return [
+            chunk_idx
+            for chunk_idx in range(
+                n_done, min(-(-target // chunk_size), n_chunks)
+            )
+            if chunk_idx not in finished[key]
+        ]
+
+    def _complete(key: Hashable) -> tuple[Hashable, np.ndarray, int]:
+        timepoints = np.concatenate(
+            [finished[key][chunk_idx] for chunk_idx in range(_n_done(key))]
+        )
+        del finished[key]
+        return key, timepoints, trials_used[key]
+
+    # Recordings that were completely restored from checkpoints
+    pending: dict[Hashable, list[int]] = {}
+    for key in list(finished):
+        chunk_idxs = _next_chunks(key)
+        if chunk_idxs is not None:
+            pending[key] = chunk_idxs
+            continue
+        yield _complete(key)
+        if key in checkpoints:
+            checkpoints.pop(key).unlink(missing_ok=True)
+
+    with contextlib.ExitStack() as stack:
+        tmp = None
+        if n_jobs != 1:
+            tmp = stack.enter_context(
+                tempfile.TemporaryDirectory(dir=temp_dir)
+            )
+        banks: dict[tuple[int, ...], IndexBank] = {}
+        bank_stacks: dict[tuple[int, ...], contextlib.ExitStack] = {}
+
+        def _bank(bank_key: tuple[int, ...]) -> IndexBank:
+            """Build bank on first use, and publish it once to workers."""
+            if bank_key not in banks:
+                bank = get_index_bank(**bank_args[bank_key])
+                if tmp is not None:
+                    bank_stacks[bank_key] = stack.enter_context(
+                        contextlib.ExitStack()
+                    )
+                    bank = bank.share(bank_stacks[bank_key], temp_dir=tmp)
+                banks[bank_key] = bank
+            return banks[bank_key]
+
+        def _release(key: Hashable) -> None:
+            """Release banks that no pending recording uses anymore."""
+            for bank_key, users in list(bank_users.items()):
+                users.discard(key)
+                if not users:
+                    del bank_users[bank_key]
+                    banks.pop(bank_key, None)
+                    if bank_key in bank_stacks:
+                        bank_stacks.pop(bank_key).close()
+
+        def _unit_kwargs(kwargs_unit: dict[str, Any]) -> dict[str, Any]:
+            if "index_bank" not in kwargs_unit:
+                return kwargs_unit
+            return {
+                **kwargs_unit,
+                "index_bank": _bank(kwargs_unit["index_bank"]),
+            }
+
+        sources: dict[Hashable, np.ndarray | pathlib.Path] = {
+            key: recordings[key][0] for key in pending
+        }
+        if n_jobs != 1:
+            sources = {
+                key: stack.enter_context(shared_array(data, temp_dir=tmp))
+                for key, data in sources.items()
+            }
+        # Recordings are submitted up to their next convergence check, so
+        # without tolerance all chunks are submitted in the first round.
+        while pending:
+            wave = sorted(
+                (
+                    units[key][chunk_idx]
+                    for key, chunk_idxs in pending.items()
+                    for chunk_idx in chunk_idxs
+                ),
+                key=lambda unit: unit[0],
+                reverse=True,
+            )
+            n_outstanding = {
+                key: len(chunk_idxs) for key, chunk_idxs in pending.items()
+            }
+            pending = {}
+            for _, key, _, _, kwargs_unit in wave:
+                if "index_bank" in kwargs_unit:
+                    bank_users.setdefault(
+                        kwargs_unit["index_bank"], set()
+                    ).add(key)
+            if n_jobs == 1:
+                results: Iterable = (
+                    _schedule_unit(
+                        key=key,
+                        chunk_idx=chunk_idx,
+                        source=sources[key],
+                        n_iterations=n_chunk,
+                        chunk_size=n_chunk,
+                        **_unit_kwargs(kwargs_unit),
+                        **kwargs,
+                        **recordings[key][1],
+                    )
+                    for _, key, chunk_idx, n_chunk, kwargs_unit in wave
+                )
+            else:
+                results = Parallel(
+                    n_jobs=n_jobs, verbose=0, return_as="generator_unordered"
+                )(
+                    delayed(_schedule_unit)(
+                        key=key,
+                        chunk_idx=chunk_idx,
+                        source=sources[key],
+                        n_iterations=n_chunk,
+                        chunk_size=n_chunk,
+                        **_unit_kwargs(kwargs_unit),
+                        **kwargs,
+                        **recordings[key][1],
+                    )
+                    for _, key, chunk_idx, n_chunk, kwargs_unit in wave
+                )
+            for key, chunk_idx, timepoints, trials in results:
+                finished[key][chunk_idx] = timepoints
+                trials_used[key] = trials
+                n_outstanding[key] -= 1
+                chunk_idxs = (
+                    _next_chunks(key) if n_outstanding[key] == 0 else []
+                )
+                if chunk_idxs is not None:
+                    if chunk_idxs:
+                        pending[key] = chunk_idxs
+                    if key in checkpoints:
+                        save_checkpoint(
+                            checkpoints[key], finished[key], trials_used[key]
+                        )
+                    continue
+                _release(key)
+                yield _complete(key)
+                if key in checkpoints:
+                    checkpoints.pop(key).unlink(missing_ok=True)
+
+
+def _schedule_unit(
+    key: Hashable,
+    chunk_idx: int,
+    source: np.ndarray | pathlib.Path,
+    **kwargs,
+) -> tuple[Hashable, int, np.ndarray, int]:
+    if isinstance(source, pathlib.Path):
+        source = load_shared_array(source)
+    timepoints, trials_used = earliest_timepoints_batched(
+        data=source, **kwargs
+    )
+    return key, chunk_idx, timepoints, trials_used
+
+
+@dataclasses.dataclass(frozen=True)
+class IndexBank:
+    """Precomputed random indices for ``earliest_timepoints_batched``.
+
+    Arrays may be given as paths of shared arrays (see ``share``), which are
+    memory-mapped by ``load``.
+    """
+
+    n_trials: int
+    trials: np.ndarray | pathlib.Path  # (n_iterations, n_samples)
+    sign_seeds: np.ndarray | pathlib.Path  # (n_iterations,)
+    clusters: np.ndarray | pathlib.Path  # (n_iterations, n_perm, n_times)
+
+    @property
+    def shape(self) -> tuple[int, int, int, int]:
+        """Shape (n_iterations, n_samples, n_perm, n_times) of the bank."""
+        bank = self.load()
+        n_iterations, n_samples = bank.trials.shape
+        return n_iterations, n_samples, *bank.clusters.shape[1:]
+
+    def load(self) -> IndexBank:
+        """Return bank with shared arrays opened as memory-maps."""
+        return IndexBank(
+            n_trials=self.n_trials,
+            trials=_as_array(self.trials),
+            sign_seeds=_as_array(self.sign_seeds),
+            clusters=_as_array(self.clusters),
+        )
+
+    def share(self, stack: contextlib.ExitStack, temp_dir: str) -> IndexBank:
+        """Publish arrays with ``shared_array`` for the lifetime of stack."""
+        return IndexBank(
+            n_trials=self.n_trials,
+            **{
+                name: stack.enter_context(
+                    shared_array(getattr(self, name), temp_dir=temp_dir)
+                )
+                for name in ("trials", "sign_seeds", "clusters")
+            },
+        )
+
+
+def _as_array(array: np.ndarray | pathlib.Path) -> np.ndarray:
+    if isinstance(array, pathlib.Path):
+        return load_shared_array(array)
+    return array
+
+
+def get_index_bank(
+    n_trials: int,
+    n_samples: int,
+    n_times: int,
+    n_perm: int,
+    n_iterations: int,
+    seed: int,
+) -> IndexBank:
+    """Build index bank of trial resamples, sign flips and cluster indices.
+
+    The bank only depends on its shape and ``seed``, so recordings with the
+    same number of trials get identical banks, which keeps results
+    reproducible independent of the order of recordings. Sign flips
+    are stored as one seed per iteration, because signs drawn independently
+    for every timepoint would take ``n_times`` times more memory than the
+    predictions they permute.
+    """
+    rng = np.random.default_rng(
+        [seed, n_trials, n_samples, n_times, n_perm, n_iterations]
+    )
+    trials = resample_indices(
+        rng=rng,
+        n_trials=n_trials,
+        n_samples=n_samples,
+        n_iterations=n_iterations,
+    ).astype(np.int32)
+    sign_seeds = rng.integers(0, 2**63, size=n_iterations, dtype=np.uint64)
+    clusters = rng.integers(
+        0, n_times, size=(n_iterations, n_perm, n_times), dtype=np.int16
+    )
+    for array in (trials, sign_seeds, clusters):
+        array.flags.writeable = False
+    return IndexBank(
+        n_trials=n_trials,
+        trials=trials,
+        sign_seeds=sign_seeds,
+        clusters=clusters,
+    )
+
+
+def earliest_timepoints_batched(
+    data: np.ndarray,
+    times: np.ndarray,
+    n_iterations: int,
+    threshold: int | float = 0,
+    n_perm: int = 1000,
+    alpha: float = 0.05,
+    correction_method: str = "cluster_pvals",
+    min_cluster_size: int = 1,
+    resample_trials: int | None = None,
+    default_value: int | float | None = None,
+    chunk_size: int = 50,
+    rng: np.random.Generator | int | None = None,
+    index_bank: IndexBank | None = None,
+    iteration_offset: int = 0,
+) -> tuple[np.ndarray, int]:
+    """Calculate earliest significant timepoints for many iterations at once.
+
+    Vectorized equivalent of calling ``pte_decode.get_earliest_timepoint``
+    ``n_iterations`` times. All trial resamples and cluster permutations of
+    one chunk of iterations are computed as a single array of shape
+    (iterations, permutations, times). As in
+    ``pte_stats.permutation_1d_onesample``, sign flips are drawn
+    independently for every timepoint, in chunks of permutations that bound
+    peak memory.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Predictions of shape (n_trials, n_times).
+    times : np.ndarray
+        Times corresponding to the last axis of ``data``.
+    n_iterations : int
+        Number of resampling iterations.
+    threshold : int | float
+        Value against which predictions are tested (one-tailed).
+    n_perm : int
+        Number of sign-flip and cluster permutations.
+    alpha : float
+        Significance level.
+    correction_method : str
+        One of "cluster_pvals" or "fdr".
+    min_cluster_size : int
+        Minimum number of consecutive significant samples.
+    resample_trials : int | None
+        Number of trials drawn without replacement in each iteration. If
+        None or larger than the number of trials, all trials are used.
+    default_value : int | float | None
+        Timepoint returned for iterations without significant cluster.
+        Defaults to the last timepoint.
+    chunk_size : int
+        Number of iterations computed at once. Bounds peak memory.
+    rng : np.random.Generator | int | None
+        Random number generator or seed. Not used if ``index_bank`` is given.
+    index_bank : IndexBank | None
+        Precomputed random indices (see ``get_index_bank``). Must match the
+        number of trials, trials used, times and permutations of ``data``.
+    iteration_offset : int
+        Row of ``index_bank`` used for the first iteration.
+
+    Returns
+    -------
+    timepoints : np.ndarray
+        Earliest timepoint of each iteration, shape (n_iterations,).
+    trials_used : int
+        Number of trials used in each iteration.
+    """
+    if correction_method not in ("cluster_pvals", "fdr"):
+        msg = (
+            "`correction_method` must be one of either `cluster_pvals` or"
+            f" `fdr`. Got: {correction_method}."
+        )
+        raise ValueError(msg)
+    rng = np.random.default_rng(rng)
+    if default_value is None:
+        default_value = times[-1]
+    n_trials = data.shape[0]
+    trials_used = (
+        n_trials if resample_trials is None else min(resample_trials, n_trials)
+    )
+    zeroed = np.asarray(data, dtype=np.float64) - threshold
+
+    if index_bank is not None:
+        index_bank = index_bank.load()
+        expected = (trials_used, n_perm, data.shape[-1])
+        if index_bank.shape[1:] != expected or (
+            index_bank.n_trials != n_trials
+        ):
+            msg = (
+                "`index_bank` does not match data. Got bank of shape"
+                f" {index_bank.shape} for {index_bank.n_trials} trials,"
+                f" expected {expected} for {n_trials} trials."
+            )
+            raise ValueError(msg)
+
+    timepoints = np.empty(n_iterations)
+    for start in range(0, n_iterations, chunk_size):
+        n_chunk = min(chunk_size, n_iterations - start)
+        if index_bank is None:
+            trial_idx = resample_indices(
+                rng=rng,
+                n_trials=n_trials,
+                n_samples=trials_used,
+                n_iterations=n_chunk,
+            )
+            sign_seeds = rng.integers(0, 2**63, size=n_chunk)
+            perm_idx = None
+        else:
+            rows = slice(
+                iteration_offset + start, iteration_offset + start + n_chunk
+            )
+            trial_idx = index_bank.trials[rows]
+            sign_seeds = index_bank.sign_seeds[rows]
+            perm_idx = index_bank.clusters[rows]
+        p_vals = _pvals_onesample(
+            zeroed=zeroed[trial_idx], sign_seeds=sign_seeds, n_perm=n_perm
+        )
+        timepoints[start : start + n_chunk] = _earliest_from_pvals(
+            p_vals=p_vals,
+            times=times,
+            alpha=alpha,
+            n_perm=n_perm,
+            correction_method=correction_method,
+            min_cluster_size=min_cluster_size,
+            default_value=default_value,
+            rng=rng,
+            perm_idx=perm_idx,
+        )
+    return timepoints, trials_used
+
+
+def resample_indices(
+    rng: np.random.Generator,
+    n_trials: int,
+    n_samples: int,
+    n_iterations: int,
+) -> np.ndarray:
+    """Draw trial indices without replacement for each iteration."""
+    if n_samples >= n_trials:
+        return np.broadcast_to(np.arange(n_trials), (n_iterations, n_trials))
+    keys = rng.random((n_iterations, n_trials))
+    return np.argpartition(keys, n_samples - 1, axis=1)[:, :n_samples]
+
+
+def _pvals_onesample(
+    zeroed: np.ndarray,
+    sign_seeds: np.ndarray,
+    n_perm: int,
+    max_elements: int = 2**22,
+) -> np.ndarray:
+    """One-tailed sign-flip p-values of shape (iterations, times).
+
+    Follows ``pte_stats.permutation_1d_onesample`` with
+    ``two_tailed=False``: every permutation draws its own signs for every
+    timepoint. Signs of iteration ``i`` are drawn from ``sign_seeds[i]``, in
+    chunks of permutations of at most ``max_elements`` signs.
+    """
+    n_iterations, n_trials, n_times = zeroed.shape
+    z = zeroed.mean(axis=1)
+    tol = np.maximum(1e-14, np.abs(z) * 1e-14)
+    perm_chunk = max(1, max_elements // (n_trials * n_times))
+    n_larger = np.zeros((n_iterations, n_times), dtype=np.int64)
+    for idx, seed in enumerate(sign_seeds):
+        rng = np.random.default_rng(int(seed))
+        for start in range(0, n_perm, perm_chunk):
+            n_chunk = min(perm_chunk, n_perm - start)
+            # Mean of signed values from the sum of values with positive sign
+            positive = rng.integers(
+                0, 2, size=(n_chunk, n_times, n_trials), dtype=np.int8
+            )
+            perm = (
+                2 * np.einsum("pts,st->pt", positive, zeroed[idx])
+                - zeroed[idx].sum(axis=0)
+            ) / n_trials
+            n_larger[idx] += np.sum(perm - z[idx] >= tol[idx], axis=0)
+    return (n_larger + 1) / (n_perm + 1)
+
+
+def _earliest_from_pvals(
+    p_vals: np.ndarray,
+    times: np.ndarray,
+    alpha: float,
+    n_perm: int,
+    correction_method: str,
+    min_cluster_size: int,
+    default_value: int | float,
+    rng: np.random.Generator,
+    perm_idx: np.ndarray | None = None,
+) -> np.ndarray:
+    """Return earliest timepoint of first significant cluster per row.
+
+    Follows ``pte_stats.clusters_from_pvals`` for a batch of p-values.
+    """
+    signif = p_vals <= alpha
+    n_signif = signif.sum(axis=-1)
+    if correction_method == "cluster_pvals":
+        signif_corr = _cluster_correct(
+            p_vals=p_vals,
+            signif=signif,
+            alpha=alpha,
+            n_perm=n_perm,
+            rng=rng,
+            perm_idx=perm_idx,
+        )
+    else:
+        signif_corr = _fdr_correct(p_vals=p_vals, alpha=alpha)
+    _, run_lengths = run_totals(signif_corr, signif_corr)
+    clusters = signif_corr & (run_lengths >= max(min_cluster_size, 1))
+    has_cluster = (
+        (n_signif > 1) & (signif_corr.sum(axis=-1) > 1) & clusters.any(axis=-1)
+    )
+    first = np.argmax(clusters, axis=-1)
+    timepoints = np.where(has_cluster, times[first], default_value)
+    return np.where(n_signif == p_vals.shape[-1], times[0], timepoints)
+
+
+def _cluster_correct(
+    p_vals: np.ndarray,
+    signif: np.ndarray,
+    alpha: float,
+    n_perm: int,
+    rng: np.random.Generator,
+    perm_idx: np.ndarray | None = None,
+) -> np.ndarray:
+    """Cluster-based correction of p-values of shape (iterations, times).
+
+    Follows ``pte_stats.cluster_analysis_1d_from_pvals``: the null
+    distribution is the maximum cluster sum of (1 - p) over random
+    resamples of the p-values of each row. Resampling indices are drawn
+    from ``rng`` unless given as ``perm_idx``.
+    """
+    n_rows, n_times = p_vals.shape
+    if perm_idx is None:
+        perm_idx = rng.integers(0, n_times, size=(n_rows, n_perm, n_times))
+    p_perm = np.take_along_axis(p_vals[:, None, :], perm_idx, axis=-1)
+    null_distr = max_run_totals(p_perm <= alpha, 1 - p_perm)
+    cluster_sums, _ = run_totals(signif, 1 - p_vals)
+    n_exceeded = np.sum(
+        cluster_sums[..., None] >= null_distr[:, None, :], axis=-1
+    )
+    cluster_pvals = (n_perm - n_exceeded + 1) / n_perm
+    return signif & (cluster_pvals <= alpha)
+
+
+def _fdr_correct(p_vals: np.ndarray, alpha: float) -> np.ndarray:
+    """Benjamini-Hochberg correction of p-values of shape (rows, times)."""
+    n_times = p_vals.shape[-1]
+    order = np.argsort(p_vals, axis=-1)
+    p_sorted = np.take_along_axis(p_vals, order, axis=-1)
+    below = p_sorted <= alpha * np.arange(1, n_times + 1) / n_times
+    n_rejected = np.where(
+        below.any(axis=-1), n_times - np.argmax(below[..., ::-1], axis=-1), 0
+    )
+    rejected_sorted = np.arange(n_times) < n_rejected[..., None]
+    rejected = np.empty_like(rejected_sorted)
+    np.put_along_axis(rejected, order, rejected_sorted, axis=-1)
+    return rejected
+
+
+def run_totals(
+    mask: np.ndarray, values: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Sum and length of the run of True values each element belongs to.
+
+    Runs are consecutive True values along the last axis. Results for
+    elements outside of runs are undefined.
+    """
+    n_times = mask.shape[-1]
+    starts = mask.copy()
+    starts[..., 1:] &= ~mask[..., :-1]
+    labels = np.cumsum(starts, axis=-1) * mask
+    offsets = np.arange(labels.size // n_times).reshape(mask.shape[:-1])
+    ids = (labels + offsets[..., None] * (n_times + 1)).ravel()
+    n_bins = (labels.size // n_times) * (n_times + 1)
+    weights = np.broadcast_to(values, mask.shape).ravel().astype(np.float64)
+    sums = np.bincount(ids, weights=weights, minlength=n_bins)
+    lengths = np.bincount(ids, minlength=n_bins)
+    return sums[ids].reshape(mask.shape), lengths[ids].reshape(mask.shape)
+
+
+def max_run_totals(mask: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Maximum sum of non-negative ``values`` over runs of True in ``mask``.
+
+    Returns 0 for rows without any run.
+    """
+    masked = np.where(mask, values, 0.0)
+    cumsum = np.cumsum(masked, axis=-1)
+    reset = np.maximum.accumulate(np.where(mask, 0.0, cumsum), axis=-1)
+    return np.max(cumsum - reset, axis=-1)
+
+
+def hash_file(path: pathlib.Path | str) -> str:
+    """Return SHA-256 hex digest of file contents."""
+    sha = hashlib.sha256()
+    with pathlib.Path(path).open("rb") as file:
+        for block in iter(lambda: file.read(2**20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def cache_key(file_hash: str, parameters: Mapping[str, Any]) -> str:
+    """Return cache key from hash of input file and analysis parameters."""
+    parameters_str = json.dumps(parameters, sort_keys=True, default=str)
+    return hashlib.sha256(f"{file_hash}{parameters_str}".encode()).hexdigest()
+
+
+def load_cached(
+    cache_dir: pathlib.Path, key: str
+) -> dict[str, float | int] | None:
+    """Load cached result of single recording. Return None if not cached."""
+    fname = cache_dir / f"{key}.json"
+    if not fname.is_file():
+        return None
+    with fname.open(encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_cached(
+    cache_dir: pathlib.Path, key: str, result: Mapping[str, float | int]
+) -> None:
+    """Save result of single recording to cache."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fname = cache_dir / f"{key}.json"
+    # Write to temporary file first so that aborted runs leave no partial file
+    fname_tmp = fname.with_suffix(".tmp")
+    with fname_tmp.open("w", encoding="utf-8") as file:
+        json.dump(result, file)
+    fname_tmp.replace(fname)
+
+
+def load_checkpoint(
+    path: pathlib.Path,
+) -> tuple[dict[int, np.ndarray], int | None]:
+    """Load finished chunks of iterations of single recording.
+
+    Returns an empty dictionary and None if no checkpoint exists.
+    """
+    if not path.is_file():
+        return {}, None
+    with path.open(encoding="utf-8") as file:
+        checkpoint = json.load(file)
+    chunks = {
+        int(chunk_idx): np.array(timepoints)
+        for chunk_idx, timepoints in checkpoint["chunks"].items()
+    }
+    return chunks, checkpoint["trials_used"]
+
+
+def save_checkpoint(
+    path: pathlib.Path, chunks: Mapping[int, np.ndarray], trials_used: int
+) -> None:
+    """Save finished chunks of iterations of single recording."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    checkpoint = {
+        "trials_used": int(trials_used),
+        "chunks": {
+            str(chunk_idx): timepoints.tolist()
+            for chunk_idx, timepoints in chunks.items()
+        },
+    }
+    path_tmp = path.with_suffix(".tmp")
+    with path_tmp.open("w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+    path_tmp.replace(path)
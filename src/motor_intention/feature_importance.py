@@ -0,0 +1,193 @@
+"""Batched permutation feature importance of decoders.
+
+Permutation importance is the drop in score when a feature column, or a
+group of columns (e.g. all columns of a frequency band or a channel), is
+shuffled across samples. Instead of re-predicting once per permuted column,
+the predictions of all permuted columns of a fold are computed in one
+stacked call. For linear decoders the stacked prediction needs no copies of
+the features: shuffling a column changes the decision function by the
+coefficient times the change of that column.
+"""
+from __future__ import annotations
+
+from collections.abc import Callable, Sequence
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+import motor_intention.feature_store
+
+
+def feature_groups(
+    columns: Sequence[str],
+    by: Literal["column", "band", "channel"] = "column",
+) -> dict[str, np.ndarray]:
+    """Return indices of columns permuted together, by group name."""
+    metadata = motor_intention.feature_store.column_metadata(columns)
+    if by == "column":
+        keys = metadata["column"]
+    elif by in ("band", "channel"):
+        keys = metadata[by]
+    else:
+        msg = f"Unknown grouping: {by}. Must be 'column', 'band' or 'channel'."
+        raise ValueError(msg)
+    return {
+        str(key): np.flatnonzero(keys.to_numpy() == key)
+        for key in pd.unique(keys)
+    }
+
+
+def balanced_accuracy(y: np.ndarray, predictions: np.ndarray) -> np.ndarray:
+    """Return balanced accuracy of binary predictions along last axis."""
+    y = np.asarray(y).astype(bool)
+    predictions = np.asarray(predictions).astype(bool)
+    sensitivity = (predictions & y).sum(axis=-1) / y.sum()
+    specificity = (~predictions & ~y).sum(axis=-1) / (~y).sum()
+    return (sensitivity + specificity) / 2
+
+
+def permutation_importance(
+    X: np.ndarray,
+    y: np.ndarray,
+    groups: dict[str, np.ndarray],
+    coef: np.ndarray | None = None,
+    intercept: float = 0.0,
+    decision_function: Callable[[np.ndarray], np.ndarray] | None = None,
+    n_repeats: int = 5,
+    random_state: int | None = None,
+) -> pd.DataFrame:
+    """Return permutation importance of groups of feature columns.
+
+    Parameters
+    ----------
+    X : np.ndarray
+        Test features of shape (samples, features).
+    y : np.ndarray
+        Binary labels of shape (samples,).
+    groups : dict[str, np.ndarray]
+        Indices of columns permuted together, e.g. from ``feature_groups``.
+    coef, intercept : np.ndarray | None, float
+        Coefficients of shape (features,) and intercept of a linear decoder.
+    decision_function : Callable | None
+        Decision function of any other decoder. It is called once per repeat
+        with the permuted features of all groups stacked along the first
+        axis, of shape (groups * samples, features). Used if coef is None.
+    n_repeats : int
+        Number of permutations per group.
+    random_state : int | None
+        Seed of permutations.
+
+    Returns
+    -------
+    pd.DataFrame
+        Mean and standard deviation of the score decrease of every group,
+        scored as balanced accuracy of the sign of the decision function.
+    """
+    if coef is None and decision_function is None:
+        msg = "Either coef or decision_function must be given."
+        raise ValueError(msg)
+    X = np.asarray(X)
+    y = np.asarray(y).astype(bool)
+    names = list(groups)
+    # Membership of columns in groups, of shape (features, groups)
+    membership = np.zeros((X.shape[1], len(names)))
+    for idx, name in enumerate(names):
+        membership[groups[name], idx] = 1.0
+    rng = np.random.default_rng(random_state)
+
+    if coef is not None:
+        coef = np.asarray(coef, dtype=np.float64)
+        baseline = X @ coef + intercept
+    else:
+        baseline = decision_function(X)
+    baseline_score = balanced_accuracy(y, baseline > 0)
+
+    decreases = np.empty((n_repeats, len(names)))
+    for repeat in range(n_repeats):
+        # Columns of a group share a permutation, so they stay aligned
+        permuted = X[rng.permutation(len(X))]
+        if coef is not None:
+            delta = (permuted - X) * coef
+            decisions = (baseline[:, None] + delta @ membership).T
+        else:
+            stacked = np.repeat(X[None], len(names), axis=0)
+            mask = membership.T.astype(bool)[:, None, :]
+            stacked = np.where(mask, permuted[None], stacked)
+            decisions = np.asarray(
+                decision_function(stacked.reshape(-1, X.shape[1]))
+            ).reshape(len(names), len(X))
+        decreases[repeat] = baseline_score - balanced_accuracy(
+            y, decisions > 0
+        )
+    return pd.DataFrame(
+        {
+            "group": names,
+            "importance_mean": decreases.mean(axis=0),
+            "importance_std": decreases.std(axis=0),
+        }
+    )
+
+
+def fold_importances(
+    X: np.ndarray | Callable[[np.ndarray], np.ndarray],
+    y: np.ndarray,
+    folds: np.ndarray,
+    coef: np.ndarray,
+    intercept: np.ndarray,
+    groups: dict[str, np.ndarray],
+    n_repeats: int = 5,
+    random_state: int | None = None,
+    n_jobs: int = -1,
+) -> pd.DataFrame:
+    """Return permutation importance of linear decoders of all folds.
+
+    Parameters
+    ----------
+    X : np.ndarray | Callable[[np.ndarray], np.ndarray]
+        Features of shape (samples, features), or a function returning the
+        features of the samples of a boolean mask of shape (samples,), so
+        that only the samples of the evaluated folds are held in memory.
+    y : np.ndarray
+        Binary labels of shape (samples,).
+    folds : np.ndarray
+        Fold of every sample, of shape (samples,). The decoder of a fold is
+        evaluated on the samples of that fold.
+    coef : np.ndarray
+        Coefficients of decoders of shape (folds, features), in order of
+        ascending fold.
+    intercept : np.ndarray
+        Intercepts of decoders of shape (folds,).
+    groups : dict[str, np.ndarray]
+        Indices of columns permuted together, e.g. from ``feature_groups``.
+    n_repeats : int
+        Number of permutations per group and fold.
+    random_state : int | None
+        Seed of permutations. Every fold gets its own stream of the seed.
+    n_jobs : int
+        Number of folds evaluated in parallel.
+    """
+    folds = np.asarray(folds)
+    fold_ids = np.unique(folds[folds >= 0])
+    seeds = np.random.SeedSequence(random_state).spawn(len(fold_ids))
+    rows = X if callable(X) else X.__getitem__
+    results = Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(permutation_importance)(
+            X=rows(folds == fold),
+            y=np.asarray(y)[folds == fold],
+            groups=groups,
+            coef=coef[idx],
+            intercept=float(intercept[idx]),
+            n_repeats=n_repeats,
+            random_state=np.random.default_rng(seeds[idx]).integers(2**32),
+        )
+        for idx, fold in enumerate(fold_ids)
+    )
+    return pd.concat(
+        [
+            result.assign(fold=fold)
+            for fold, result in zip(fold_ids, results, strict=True)
+        ],
+        ignore_index=True,
+    )
@@ -0,0 +1,46 @@
+"""Size-aware scheduling of feature computation across files."""
+from __future__ import annotations
+
+import heapq
+from collections.abc import Sequence
+from typing import Literal
+
+import mne
+import mne_bids
+import numpy as np
+
+
+def estimate_cost(
+    fname: mne_bids.BIDSPath,
+    stimulation: Literal["Off", "On"],
+    notch_cost: float = 1.0,
+) -> float:
+    """Estimate cost of computing features of a file from its header.
+
+    The cost is the number of samples times the number of channels. For
+    stimulation "On", notch filtering of ECoG and DBS channels is added,
+    weighted by ``notch_cost`` relative to feature computation.
+    """
+    raw = mne_bids.read_raw_bids(fname, extra_params={"verbose": 0})
+    cost = raw.n_times * len(raw.ch_names)
+    if stimulation == "On":
+        n_filtered = len(mne.pick_types(raw.info, ecog=True, dbs=True))
+        cost += notch_cost * raw.n_times * n_filtered
+    return float(cost)
+
+
+def longest_first(costs: Sequence[float]) -> np.ndarray:
+    """Return order of jobs from most to least expensive."""
+    return np.argsort(-np.asarray(costs, dtype=float), kind="stable")
+
+
+def makespan(costs: Sequence[float], n_workers: int) -> float:
+    """Return makespan of submitting jobs in the given order to workers.
+
+    Every job starts on the worker that becomes free first, as jobs are
+    dispatched by ``joblib.Parallel``.
+    """
+    loads = [0.0] * max(1, n_workers)
+    for cost in costs:
+        heapq.heappush(loads, heapq.heappop(loads) + cost)
+    return max(loads)
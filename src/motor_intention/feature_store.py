@@ -0,0 +1,201 @@
+"""Compressed binary storage of features calculated with ``nm.Stream``.
+
+Features of one recording are saved as ``<folder_name>_FEATURES.npz`` with
+one compressed float32 array per feature column, so that columns can be
+loaded selectively. The time column is kept as float64. The channel and
+frequency band of every column are stored as column metadata.
+
+A manifest (``<folder_name>_MANIFEST.json``) next to the features records
+content hashes of the inputs they were computed from, so that features
+that are up to date need not be recomputed.
+"""
+from __future__ import annotations
+
+import json
+import pathlib
+import re
+import shutil
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+import motor_intention.decoding_times_helpers
+
+SUFFIX = "_FEATURES.npz"
+MANIFEST_SUFFIX = "_MANIFEST.json"
+PROJECTION = "projection.json"
+TIME = "time"
+FEATURE_KINDS = (
+    "fft",
+    "stft",
+    "bandpass",
+    "sharpwave",
+    "raw_hjorth",
+    "fooof",
+    "bursts",
+    "coh",
+    "nolds",
+    "linelength",
+)
+_COLUMN = re.compile(
+    rf"^(?P<channel>.+?)_(?P<kind>{'|'.join(FEATURE_KINDS)})_?(?P<band>.*)$"
+)
+_META = ("__columns__", "__channels__", "__bands__")
+
+
+def column_metadata(columns: Sequence[str]) -> pd.DataFrame:
+    """Return channel and frequency band of feature columns.
+
+    Columns that are not features (e.g. time and label channels) have the
+    column name as channel and an empty band.
+    """
+    rows = []
+    for column in columns:
+        match = _COLUMN.match(column)
+        if match is None:
+            rows.append((column, column, ""))
+        else:
+            rows.append((column, match["channel"], match["band"]))
+    return pd.DataFrame(rows, columns=["column", "channel", "band"])
+
+
+def write_features(features: pd.DataFrame, path: pathlib.Path) -> None:
+    """Write features of single recording to compressed binary file."""
+    columns = features.columns.astype(str).to_list()
+    metadata = column_metadata(columns)
+    arrays = {
+        f"col{idx}": features[column].to_numpy(
+            dtype=np.float64 if column == TIME else np.float32
+        )
+        for idx, column in enumerate(columns)
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        path,
+        __columns__=np.array(columns),
+        __channels__=metadata["channel"].to_numpy(dtype=str),
+        __bands__=metadata["band"].to_numpy(dtype=str),
+        **arrays,
+    )
+
+
+def read_metadata(path: pathlib.Path) -> pd.DataFrame:
+    """Read column metadata of feature file without loading features."""
+    with np.load(path) as npz:
+        columns, channels, bands = (npz[key] for key in _META)
+    return pd.DataFrame(
+        {"column": columns, "channel": channels, "band": bands}
+    )
+
+
+def read_features(
+    path: pathlib.Path,
+    keywords: Sequence[str] | None = None,
+    columns: Sequence[str] = (TIME,),
+) -> pd.DataFrame:
+    """Read features from binary file, loading only the selected columns.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Feature file written by ``write_features``.
+    keywords : Sequence[str] | None
+        Columns containing any of these keywords are loaded, e.g.
+        ``["fft_theta", "fft_alpha"]``. If None, all columns are loaded.
+    columns : Sequence[str]
+        Further columns to load if present, e.g. time and label channels.
+    """
+    with np.load(path) as npz:
+        all_columns = npz["__columns__"].tolist()
+        picks = [
+            idx
+            for idx, column in enumerate(all_columns)
+            if keywords is None
+            or column in columns
+            or any(keyword in column for keyword in keywords)
+        ]
+        return pd.DataFrame(
+            {all_columns[idx]: npz[f"col{idx}"] for idx in picks}
+        )
+
+
+def project_features(
+    files: Sequence[pathlib.Path],
+    out_root: pathlib.Path,
+    keywords: Sequence[str],
+    columns: Sequence[str] = (TIME,),
+) -> list[pathlib.Path]:
+    """Write selected columns of binary feature files as FEATURES.csv.
+
+    Every feature folder is recreated in ``out_root`` with its other files
+    (settings, channels and sidecar) copied, so that the returned files can
+    be passed to ``pte_decode`` in place of full feature tables. Folders
+    that were already projected from the same feature file with the same
+    columns are kept as they are.
+    """
+    out_files = []
+    for file in files:
+        folder = file.parent
+        out_folder = out_root / folder.name
+        out_file = out_folder / file.name.replace(SUFFIX, "_FEATURES.csv")
+        out_files.append(out_file)
+        projection = {
+            "source": str(file.resolve()),
+            "mtime_ns": file.stat().st_mtime_ns,
+            "keywords": list(keywords),
+            "columns": list(columns),
+        }
+        projection_file = out_folder / PROJECTION
+        if out_file.is_file() and projection_file.is_file():
+            with projection_file.open(encoding="utf-8") as f:
+                if json.load(f) == projection:
+                    continue
+        out_folder.mkdir(parents=True, exist_ok=True)
+        for other in folder.iterdir():
+            if (
+                other.is_file()
+                and "_FEATURES." not in other.name
+                and not other.name.endswith(MANIFEST_SUFFIX)
+            ):
+                shutil.copy2(other, out_folder / other.name)
+        read_features(path=file, keywords=keywords, columns=columns).to_csv(
+            out_file, index=False
+        )
+        with projection_file.open("w", encoding="utf-8") as f:
+            json.dump(projection, f, indent=4)
+    return out_files
+
+
+def input_hashes(inputs: Mapping[str, pathlib.Path]) -> dict[str, str]:
+    """Return content hashes of input files, keyed by input name and file.
+
+    Files sharing the stem of an input (e.g. the ``.eeg`` and ``.vmrk``
+    files of a BrainVision header) are hashed as part of that input.
+    """
+    hashes = {}
+    for name, path in inputs.items():
+        for file in sorted(path.parent.glob(f"{path.stem}.*")):
+            hashes[
+                f"{name}:{file.name}"
+            ] = motor_intention.decoding_times_helpers.hash_file(file)
+    return hashes
+
+
+def is_up_to_date(folder: pathlib.Path, hashes: Mapping[str, str]) -> bool:
+    """Return True if features in folder were computed from these inputs."""
+    manifest = folder / (folder.name + MANIFEST_SUFFIX)
+    if not (folder / (folder.name + SUFFIX)).is_file():
+        return False
+    if not manifest.is_file():
+        return False
+    with manifest.open(encoding="utf-8") as file:
+        return json.load(file) == dict(hashes)
+
+
+def write_manifest(folder: pathlib.Path, hashes: Mapping[str, str]) -> None:
+    """Record hashes of inputs that features in folder were computed from."""
+    with (folder / (folder.name + MANIFEST_SUFFIX)).open(
+        "w", encoding="utf-8"
+    ) as file:
+        json.dump(dict(hashes), file, indent=4, sort_keys=True)
@@ -0,0 +1,236 @@
+"""Blockwise feature computation for ``nm.Stream``.
+
+``nm.Stream.run`` expects the whole recording as one array. The functions
+here reproduce its offline loop, but read the raw data in overlapping
+blocks of feature windows, so that peak memory is bounded by the block
+size instead of the recording length.
+"""
+from __future__ import annotations
+
+import math
+import pathlib
+import warnings
+from collections.abc import Callable, Iterator
+
+import mne
+import numpy as np
+import pandas as pd
+import pte_neuromodulation as nm
+
+import motor_intention.instrumentation
+
+
+def make_stream(
+    raw: mne.io.BaseRaw,
+    path_settings: str | pathlib.Path,
+    path_nm_channels: str | pathlib.Path,
+) -> nm.Stream:
+    """Set up stream for raw data from settings and channels files."""
+    coord_list, coord_names = nm.io.get_coord_list(raw)
+    settings = nm.io.read_settings(str(path_settings))
+    nm_channels = nm.io.load_nm_channels(str(path_nm_channels))
+    return nm.Stream(
+        sfreq=raw.info["sfreq"],
+        nm_channels=nm_channels,
+        settings=settings,
+        line_noise=int(raw.info["line_freq"]),
+        coord_list=coord_list,
+        coord_names=coord_names,
+        verbose=False,
+    )
+
+
+def window_bounds(
+    batch_indices: np.ndarray,
+    sfreq: float,
+    segment_length_ms: float,
+    sfreq_features: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return start and stop samples of feature windows with given indices.
+
+    Windows are identical to those of ``nm_generator.raw_data_generator``.
+    """
+    sfreq = math.floor(sfreq)
+    offset_start = segment_length_ms / 1000 * sfreq
+    ratio = sfreq / sfreq_features
+    if ratio < 1:
+        msg = (
+            "Sampling rate of features must not exceed sampling rate of data."
+            f" Got: {sfreq_features = }, {sfreq = }."
+        )
+        raise ValueError(msg)
+    thresholds = ratio * np.asarray(batch_indices)
+    # First sample at which the generator yields window k
+    stops = np.ceil(offset_start + thresholds)
+    stops = np.where(stops - 1 - offset_start >= thresholds, stops - 1, stops)
+    stops = np.where(stops - offset_start < thresholds, stops + 1, stops)
+    starts = np.floor(stops - offset_start)
+    return starts.astype(int), stops.astype(int)
+
+
+def batch_bounds(
+    n_samples: int,
+    sfreq: float,
+    segment_length_ms: float,
+    sfreq_features: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return start and stop samples of all feature windows of recording."""
+    offset_start = segment_length_ms / 1000 * math.floor(sfreq)
+    ratio = math.floor(sfreq) / sfreq_features
+    n_batches = max(0, math.ceil((n_samples - offset_start) / ratio))
+    starts, stops = window_bounds(
+        batch_indices=np.arange(n_batches),
+        sfreq=sfreq,
+        segment_length_ms=segment_length_ms,
+        sfreq_features=sfreq_features,
+    )
+    keep = stops < n_samples
+    return starts[keep], stops[keep]
+
+
+def iter_batches(
+    get_data: Callable[[int, int], np.ndarray],
+    starts: np.ndarray,
+    stops: np.ndarray,
+    batches_per_block: int = 1000,
+) -> Iterator[np.ndarray]:
+    """Yield feature windows, reading data in blocks of windows.
+
+    Parameters
+    ----------
+    get_data : Callable[[int, int], np.ndarray]
+        Function returning data of shape (channels, samples) between a start
+        and a stop sample.
+    starts, stops : np.ndarray
+        Start and stop samples of windows, as returned by ``batch_bounds``.
+    batches_per_block : int
+        Number of windows read at once. Consecutive blocks overlap by one
+        window.
+    """
+    for first in range(0, len(stops), batches_per_block):
+        last = min(first + batches_per_block, len(stops))
+        block_start = starts[first]
+        block = get_data(block_start, stops[last - 1])
+        for start, stop in zip(
+            starts[first:last], stops[first:last], strict=True
+        ):
+            yield block[:, start - block_start : stop - block_start]
+
+
+def instrument_features(
+    stream: nm.Stream, timer: motor_intention.instrumentation.StageTimer
+) -> None:
+    """Time feature kernels of stream, with one stage per feature type.
+
+    Kernels are found at ``stream.run_analysis.features.features``. If the
+    stream has no kernels there, a warning is issued and the stage
+    "features" is recorded as untimed, instead of silently reporting no
+    feature timings.
+    """
+    features = getattr(
+        getattr(stream.run_analysis, "features", None), "features", None
+    )
+    if features is None:
+        msg = (
+            "Feature kernels not found at stream.run_analysis.features"
+            ".features. Feature kernels are not timed."
+        )
+        warnings.warn(msg, stacklevel=2)
+        timer.untimed("features")
+        return
+    for feature in features:
+        feature.calc_feature = timer.wrap(
+            f"features_{type(feature).__name__}", feature.calc_feature
+        )
+
+
+def run_blockwise(
+    stream: nm.Stream,
+    raw: mne.io.BaseRaw,
+    out_path_root: str | pathlib.Path,
+    folder_name: str,
+    batches_per_block: int = 1000,
+    timer: motor_intention.instrumentation.StageTimer | None = None,
+) -> pd.DataFrame:
+    """Calculate features of raw data block by block and save them.
+
+    Equivalent to ``stream.run(data=raw.get_data(), ...)``, but only one
+    block of data is held in memory at a time. Only the public feature
+    kernel (``stream.run_analysis.process``) and ``stream.save_after_stream``
+    of the stream are used. Time stamps (in ms) and labels are added here:
+    every feature row is labeled with the target channels at the sample of
+    its time stamp. Reading, processing (incl. feature kernels) and saving
+    are timed with ``timer``.
+    """
+    if timer is None:
+        timer = motor_intention.instrumentation.StageTimer()
+    settings = stream.settings
+    sfreq = stream.sfreq
+    starts, stops = batch_bounds(
+        n_samples=raw.n_times,
+        sfreq=sfreq,
+        segment_length_ms=settings["segment_length_features_ms"],
+        sfreq_features=settings["sampling_rate_features_hz"],
+    )
+    sample_add = int(sfreq / settings["sampling_rate_features_hz"])
+    cnt_samples = np.ceil(
+        settings["segment_length_features_ms"] / 1000 * sfreq
+    ).astype(int)
+
+    features = []
+    samples = []
+    for batch in iter_batches(
+        get_data=timer.wrap(
+            "read", lambda start, stop: raw.get_data(start=start, stop=stop)
+        ),
+        starts=starts,
+        stops=stops,
+        batches_per_block=batches_per_block,
+    ):
+        with timer.stage("process"):
+            feature_series = stream.run_analysis.process(
+                batch.astype(np.float64)
+            )
+        feature_series["time"] = cnt_samples * 1000 / sfreq
+        features.append(feature_series)
+        samples.append(cnt_samples)
+        cnt_samples += sample_add
+
+    feature_df = pd.DataFrame(features)
+    with timer.stage("read"):
+        labels = _labels(
+            stream=stream,
+            raw=raw,
+            samples=np.asarray(samples, dtype=int),
+            batches_per_block=batches_per_block,
+        )
+    for name, values in labels.items():
+        feature_df[name] = values
+    with timer.stage("save"):
+        stream.save_after_stream(out_path_root, folder_name, feature_df)
+    return feature_df
+
+
+def _labels(
+    stream: nm.Stream,
+    raw: mne.io.BaseRaw,
+    samples: np.ndarray,
+    batches_per_block: int,
+) -> dict[str, np.ndarray]:
+    """Return target channels at given samples, by channel name.
+
+    Target channels are read block by block, so only one block of them is
+    held in memory at a time.
+    """
+    nm_channels = stream.nm_channels
+    targets = nm_channels["name"][nm_channels["target"] == 1].to_list()
+    samples = np.minimum(samples, raw.n_times - 1)
+    labels = np.empty((len(targets), len(samples)))
+    if targets:
+        for first in range(0, len(samples), batches_per_block):
+            block = samples[first : first + batches_per_block]
+            data = raw.get_data(
+                picks=targets, start=block[0], stop=block[-1] + 1
+            )
+            labels[:, first : first + len(block)] = data[:, block - block[0]]
+    return dict(zip(targets, labels, strict=True))
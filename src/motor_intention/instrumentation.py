@@ -0,0 +1,86 @@
+"""Timing and memory instrumentation of processing stages."""
+from __future__ import annotations
+
+import contextlib
+import functools
+import math
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from typing import Any
+
+import psutil
+
+
+class StageTimer:
+    """Accumulate time per stage and track peak resident memory.
+
+    Resident memory (RSS) of the current process is sampled in a background
+    thread while ``track_memory`` is active, so that peaks within stages are
+    captured.
+
+    Parameters
+    ----------
+    interval : float
+        Sampling interval of resident memory in seconds.
+    """
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.times: defaultdict[str, float] = defaultdict(float)
+        self.peak_rss = 0
+        self._process = psutil.Process()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Add time spent in context to stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] += time.perf_counter() - start
+            self._sample_rss()
+
+    def wrap(self, name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Return function that adds time of every call to stage."""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def untimed(self, name: str) -> None:
+        """Record that stage could not be timed. It is reported as NaN."""
+        self.times[name] = math.nan
+
+    @contextlib.contextmanager
+    def track_memory(self) -> Iterator[None]:
+        """Sample resident memory in background while in context."""
+        stop = threading.Event()
+
+        def _sample() -> None:
+            while not stop.wait(self.interval):
+                self._sample_rss()
+
+        thread = threading.Thread(target=_sample, daemon=True)
+        self._sample_rss()
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+            self._sample_rss()
+
+    def report(self) -> dict[str, float]:
+        """Return seconds per stage and peak resident memory in MB."""
+        return {
+            **{f"time_{name}": value for name, value in self.times.items()},
+            "peak_rss_mb": self.peak_rss / 2**20,
+        }
+
+    def _sample_rss(self) -> None:
+        self.peak_rss = max(self.peak_rss, self._process.memory_info().rss)
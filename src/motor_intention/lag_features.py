@@ -0,0 +1,273 @@
+"""Time-lagged features without copying the feature matrix.
+
+With ``use_times`` > 1, every time point is decoded from its features and
+those of the ``use_times - 1`` preceding samples. Row ``i`` of the lagged
+design matrix holds samples ``i`` to ``i + use_times - 1`` (latest last),
+so it corresponds to sample ``i + use_times - 1`` of the recording. These
+rows are consecutive in a C-contiguous feature matrix, so the design matrix
+is a strided view of it instead of ``use_times`` copies.
+
+With ``normalization_mode="by_latest_sample"``, preceding samples are
+expressed relative to the latest sample (``x[t - k] - x[t]``), which is
+not a view. LDA fitting and prediction therefore never build the design
+matrix. Fitting accumulates class statistics over chunks of rows, and the
+decision function is computed as a sum of one product per lag over slices
+of the original features. Where rows are needed, e.g. the test samples of
+one fold for permutation importance, only these are copied with
+``design_rows``.
+"""
+from __future__ import annotations
+
+import functools
+from collections.abc import Iterator
+from typing import Literal
+
+import numpy as np
+
+import motor_intention.lda_batch
+
+NormalizationMode = Literal["by_latest_sample"] | None
+
+
+def lag_view(features: np.ndarray, use_times: int) -> np.ndarray:
+    """Return lagged design matrix as read-only view of features.
+
+    Parameters
+    ----------
+    features : np.ndarray
+        Features of shape (samples, features).
+    use_times : int
+        Number of samples used per time point.
+
+    Returns
+    -------
+    np.ndarray
+        View of shape (samples - use_times + 1, use_times * features).
+    """
+    features = _check(features, use_times)
+    n_samples, n_features = features.shape
+    return np.lib.stride_tricks.as_strided(
+        features,
+        shape=(n_samples - use_times + 1, use_times * n_features),
+        strides=(features.strides[0], features.strides[1]),
+        writeable=False,
+    )
+
+
+def iter_design(
+    features: np.ndarray,
+    use_times: int,
+    normalization_mode: NormalizationMode = None,
+    chunk_size: int = 10_000,
+) -> Iterator[tuple[slice, np.ndarray]]:
+    """Yield rows of lagged design matrix in chunks.
+
+    Chunks are views if no normalization is applied, and float64 arrays of
+    ``chunk_size`` rows otherwise.
+    """
+    design = lag_view(features, use_times)
+    for start in range(0, len(design), chunk_size):
+        rows = slice(start, min(start + chunk_size, len(design)))
+        yield rows, _normalize(
+            design[rows],
+            n_features=np.shape(features)[1],
+            use_times=use_times,
+            normalization_mode=normalization_mode,
+        )
+
+
+def design_rows(
+    features: np.ndarray,
+    rows: np.ndarray,
+    use_times: int,
+    normalization_mode: NormalizationMode = None,
+) -> np.ndarray:
+    """Return selected rows of lagged design matrix.
+
+    Only the selected rows are copied, e.g. the test samples of one fold,
+    instead of the whole design matrix.
+
+    Parameters
+    ----------
+    features : np.ndarray
+        Features of shape (samples, features).
+    rows : np.ndarray
+        Indices or boolean mask of rows of the design matrix.
+    use_times : int
+        Number of samples used per time point.
+    normalization_mode : {"by_latest_sample", None}
+        Normalization of preceding samples.
+
+    Returns
+    -------
+    np.ndarray
+        Rows of shape (rows, use_times * features).
+    """
+    return _normalize(
+        lag_view(features, use_times)[rows],
+        n_features=np.shape(features)[1],
+        use_times=use_times,
+        normalization_mode=normalization_mode,
+    )
+
+
+def fit_lda(
+    features: np.ndarray,
+    y: np.ndarray,
+    train: np.ndarray,
+    use_times: int,
+    normalization_mode: NormalizationMode = None,
+    priors: np.ndarray | None = None,
+    chunk_size: int = 10_000,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Fit binary LDA models of all folds on lagged features.
+
+    Parameters
+    ----------
+    features : np.ndarray
+        Features of shape (samples, features).
+    y : np.ndarray
+        Binary labels of rows of the design matrix, of shape
+        (samples - use_times + 1,).
+    train : np.ndarray
+        Boolean masks of training rows of shape
+        (folds, samples - use_times + 1).
+    use_times : int
+        Number of samples used per time point.
+    normalization_mode : {"by_latest_sample", None}
+        Normalization of preceding samples.
+    priors : np.ndarray | None
+        Class priors of shape (2,). If None, class proportions are used.
+    chunk_size : int
+        Number of design matrix rows processed at once.
+
+    Returns
+    -------
+    coef : np.ndarray
+        Coefficients of shape (folds, use_times * features).
+    intercept : np.ndarray
+        Intercepts of shape (folds,).
+    """
+    y = np.asarray(y).astype(bool)
+    train = np.atleast_2d(np.asarray(train, dtype=bool))
+    weights = np.stack([train & ~y, train & y]).astype(np.float64)
+    n_design = use_times * np.shape(features)[1]
+    chunks = functools.partial(
+        iter_design,
+        features=features,
+        use_times=use_times,
+        normalization_mode=normalization_mode,
+        chunk_size=chunk_size,
+    )
+    # Shift by the mean for numerical stability of the sums of squares
+    shift = np.zeros(n_design)
+    n_rows = 0
+    for _, chunk in chunks():
+        shift += chunk.sum(axis=0, dtype=np.float64)
+        n_rows += len(chunk)
+    shift /= n_rows
+    counts = weights.sum(axis=-1)
+    sums = np.zeros((*counts.shape, n_design))
+    sq_sums = np.zeros((*counts.shape, n_design, n_design))
+    for rows, chunk in chunks():
+        centered = chunk - shift
+        weights_chunk = weights[..., rows]
+        sums += weights_chunk @ centered
+        sq_sums += np.einsum(
+            "kfn,nd,ne->kfde", weights_chunk, centered, centered, optimize=True
+        )
+    coef, intercept = motor_intention.lda_batch.fit_from_sums(
+        counts=counts,
+        sums=sums[:, None],
+        sq_sums=sq_sums[:, None],
+        shift=shift[None, None],
+        priors=priors,
+    )
+    return coef[0], intercept[0]
+
+
+def decision_function(
+    features: np.ndarray,
+    coef: np.ndarray,
+    intercept: np.ndarray,
+    use_times: int,
+    normalization_mode: NormalizationMode = None,
+) -> np.ndarray:
+    """Return decision function of lagged features of all folds.
+
+    Parameters
+    ----------
+    features : np.ndarray
+        Features of shape (samples, features).
+    coef : np.ndarray
+        Coefficients of shape (folds, use_times * features).
+    intercept : np.ndarray
+        Intercepts of shape (folds,).
+
+    Returns
+    -------
+    np.ndarray
+        Decision function of shape (folds, samples - use_times + 1).
+    """
+    features = _check(features, use_times)
+    n_rows = features.shape[0] - use_times + 1
+    weights = np.asarray(coef, dtype=np.float64).reshape(
+        len(coef), use_times, features.shape[1]
+    )
+    if normalization_mode == "by_latest_sample":
+        # Subtracting the latest sample moves weight onto the latest lag
+        weights = weights.copy()
+        weights[:, -1] -= weights[:, :-1].sum(axis=1)
+    elif normalization_mode is not None:
+        msg = (
+            f"Unknown normalization mode: {normalization_mode}. Must be"
+            " 'by_latest_sample' or None."
+        )
+        raise ValueError(msg)
+    result = np.repeat(
+        np.asarray(intercept, dtype=np.float64)[:, None], n_rows, axis=1
+    )
+    for lag in range(use_times):
+        result += weights[:, lag] @ features[lag : lag + n_rows].T
+    return result
+
+
+def _normalize(
+    design: np.ndarray,
+    n_features: int,
+    use_times: int,
+    normalization_mode: NormalizationMode,
+) -> np.ndarray:
+    if normalization_mode is None:
+        return design
+    if normalization_mode != "by_latest_sample":
+        msg = (
+            f"Unknown normalization mode: {normalization_mode}. Must be"
+            " 'by_latest_sample' or None."
+        )
+        raise ValueError(msg)
+    design = design.astype(np.float64)
+    latest = design[:, -n_features:]
+    for lag in range(use_times - 1):
+        design[:, lag * n_features : (lag + 1) * n_features] -= latest
+    return design
+
+
+def _check(features: np.ndarray, use_times: int) -> np.ndarray:
+    features = np.asarray(features)
+    if features.ndim != 2:
+        msg = (
+            "Features must be of shape (samples, features). Got:"
+            f" {features.shape}."
+        )
+        raise ValueError(msg)
+    if not 1 <= use_times <= len(features):
+        msg = (
+            "use_times must be between 1 and the number of samples. Got:"
+            f" {use_times=}, {len(features)=}."
+        )
+        raise ValueError(msg)
+    if not features.flags.c_contiguous:
+        # Rows of a lag window are only adjacent in C order
+        features = np.ascontiguousarray(features)
+    return features
@@ -0,0 +1,103 @@
+"""Memory-mapped cube of trial-averaged predictions across subjects.
+
+The cube consolidates the prediction stores of all decoding pipelines into
+one float32 array (``cube.npy``) of shape (recordings, times), a shared time
+axis (``times.npy``) and an index table (``index.csv``) with one row per
+recording. Rows are sorted by pipeline, channel type, medication,
+stimulation and subject, so that selecting a condition returns a contiguous
+block that can be sliced from the memory map without copying.
+"""
+from __future__ import annotations
+
+import pathlib
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+import motor_intention.prediction_store
+
+CUBE = "cube.npy"
+TIMES = "times.npy"
+INDEX = "index.csv"
+SORT_BY = ["Pipeline", "ChannelType", "Medication", "Stimulation", "Subject"]
+
+
+def write_prediction_cube(
+    store_dirs: Mapping[tuple[str, str], pathlib.Path],
+    cube_dir: pathlib.Path,
+    baseline: tuple[float | None, float | None] | None = (-3.0, -2.0),
+    baseline_mode: str = "zscore",
+) -> pd.DataFrame:
+    """Write prediction cube from prediction stores and return its index.
+
+    Parameters
+    ----------
+    store_dirs : Mapping[tuple[str, str], pathlib.Path]
+        Prediction stores, keyed by pipeline and channel type.
+    cube_dir : pathlib.Path
+        Directory of the cube.
+    baseline : tuple | None
+        Baseline in seconds applied to the predictions before averaging.
+    baseline_mode : str
+        Baseline mode passed to ``pte_stats.baseline_correct``.
+    """
+    data_list = []
+    for (pipeline, ch_type), store_dir in store_dirs.items():
+        data = motor_intention.prediction_store.read_prediction_store(
+            store_dir=store_dir,
+            columns=("Predictions", "times"),
+            baseline=baseline,
+            baseline_mode=baseline_mode,
+            baseline_trialwise=False,
+            average_predictions=True,
+        )
+        data["Pipeline"] = pipeline
+        data["ChannelType"] = ch_type
+        data_list.append(data)
+    data = pd.concat(data_list, ignore_index=True)
+    data = data.sort_values(by=SORT_BY, kind="stable", ignore_index=True)
+
+    times = np.asarray(data["times"].iloc[0])
+    for times_rec in data["times"]:
+        if not np.array_equal(times_rec, times):
+            msg = "Predictions must share the same time axis to form a cube."
+            raise ValueError(msg)
+    cube = np.stack(data["Predictions"].to_list()).astype(np.float32)
+
+    cube_dir.mkdir(parents=True, exist_ok=True)
+    np.save(cube_dir / CUBE, cube)
+    np.save(cube_dir / TIMES, times)
+    index = data.drop(columns=["Predictions", "times"])
+    index.to_csv(cube_dir / INDEX, index=False)
+    return index
+
+
+def read_prediction_cube(
+    cube_dir: pathlib.Path,
+) -> tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+    """Read index table, memory-mapped cube and times of prediction cube."""
+    index = pd.read_csv(cube_dir / INDEX, dtype={"Subject": str})
+    cube = np.load(cube_dir / CUBE, mmap_mode="r")
+    times = np.load(cube_dir / TIMES)
+    return index, cube, times
+
+
+def select(
+    index: pd.DataFrame,
+    cube: np.ndarray,
+    query: str,
+    sort_by: Sequence[str] = ("Subject",),
+) -> tuple[pd.DataFrame, np.ndarray]:
+    """Select recordings from cube with a query of the index table.
+
+    Returns the selected rows of the index table, sorted by ``sort_by``, and
+    the corresponding predictions of shape (recordings, times). Predictions
+    are a view of the cube if the selected rows are contiguous and already
+    sorted, which is the case for any single condition.
+    """
+    selected = index.query(query).sort_values(by=list(sort_by), kind="stable")
+    rows = selected.index.to_numpy()
+    if rows.size and np.array_equal(rows, np.arange(rows[0], rows[-1] + 1)):
+        return selected, cube[rows[0] : rows[-1] + 1]
+    return selected, cube[rows]
@@ -0,0 +1,222 @@
+"""Binary columnar store for timelocked decoding predictions.
+
+A store is a directory that consolidates many ``*PredTimelocked.json`` files.
+It contains an index table (``index.csv``) with one row per recording and the
+recording metadata (e.g. subject, medication, stimulation and channel), and
+one flat binary array per column (``predictions.npy`` as float32,
+``times.npy`` and ``trial_ids.npy``). Arrays are memory-mapped on read, so
+only the selected recordings and columns are loaded.
+"""
+from __future__ import annotations
+
+import contextlib
+import pathlib
+from collections.abc import Sequence
+from typing import BinaryIO
+
+import numpy as np
+import pandas as pd
+import pte_decode
+import pte_stats
+
+import motor_intention.decoding_times_helpers
+import motor_intention.result_loaders
+
+INDEX = "index.csv"
+ARRAY_COLUMNS = {
+    "Predictions": ("predictions.npy", np.float32),
+    "times": ("times.npy", np.float64),
+    "trial_ids": ("trial_ids.npy", np.int64),
+}
+
+
+def write_prediction_store(
+    files: Sequence[pathlib.Path | str], store_dir: pathlib.Path
+) -> pd.DataFrame:
+    """Convert prediction files to a store and return its index table.
+
+    Predictions are read without baseline correction, so that any baseline
+    can be applied on read. Files are read in a thread pool and appended to
+    the arrays as they arrive, so only recordings that arrived ahead of
+    their turn are held in memory. Recordings are stored in order of files.
+    """
+    store_dir.mkdir(parents=True, exist_ok=True)
+    rows: list[pd.DataFrame] = []
+    offsets = {column: [] for column in ARRAY_COLUMNS}
+    sizes = dict.fromkeys(ARRAY_COLUMNS, 0)
+    pending: dict[int, tuple[pd.DataFrame, str]] = {}
+    with contextlib.ExitStack() as stack:
+        handles = {
+            column: stack.enter_context(open(store_dir / fname, "wb"))
+            for column, (fname, _) in ARRAY_COLUMNS.items()
+        }
+        for column, handle in handles.items():
+            _write_header(handle, column=column, size=0)
+        for idx, result in motor_intention.result_loaders.iter_files(
+            files=files, load_file=_load_file
+        ):
+            pending[idx] = result
+            # Append in order of files, so the store is deterministic
+            while len(rows) in pending:
+                data, file_hash = pending.pop(len(rows))
+                arrays = {
+                    column: np.asarray(data[column].iloc[0])
+                    for column in ARRAY_COLUMNS
+                }
+                for column, (_, dtype) in ARRAY_COLUMNS.items():
+                    offsets[column].append(sizes[column])
+                    sizes[column] += arrays[column].size
+                    handles[column].write(
+                        np.ascontiguousarray(
+                            arrays[column], dtype=dtype
+                        ).tobytes()
+                    )
+                rows.append(
+                    data.drop(columns=list(ARRAY_COLUMNS)).assign(
+                        fname=pathlib.Path(files[len(rows)]).name,
+                        file_hash=file_hash,
+                        n_trials=arrays["Predictions"].shape[0],
+                        n_times=arrays["Predictions"].shape[-1],
+                    )
+                )
+        for column, handle in handles.items():
+            handle.seek(0)
+            _write_header(handle, column=column, size=sizes[column])
+
+    index = (
+        pd.concat(rows, ignore_index=True)
+        if rows
+        else pd.DataFrame(
+            columns=["fname", "file_hash", "n_trials", "n_times"]
+        )
+    )
+    for column in ARRAY_COLUMNS:
+        index[f"offset_{column}"] = np.asarray(offsets[column], dtype=np.int64)
+    index.to_csv(store_dir / INDEX, index=False)
+    return index
+
+
+def _load_file(file: pathlib.Path | str) -> tuple[pd.DataFrame, str]:
+    """Load predictions of a single file and hash of file."""
+    data = pte_decode.load_predictions(
+        files=[file], baseline=None, average_predictions=False
+    )
+    return data, motor_intention.decoding_times_helpers.hash_file(file)
+
+
+def _write_header(handle: BinaryIO, column: str, size: int) -> None:
+    """Write header of flat ``.npy`` array of given size.
+
+    Headers are padded to a length that doesn't depend on the size, so the
+    final header can overwrite the placeholder written before the data.
+    """
+    np.lib.format.write_array_header_1_0(
+        handle,
+        {
+            "descr": np.lib.format.dtype_to_descr(
+                np.dtype(ARRAY_COLUMNS[column][1])
+            ),
+            "fortran_order": False,
+            "shape": (size,),
+        },
+    )
+
+
+def read_prediction_index(store_dir: pathlib.Path) -> pd.DataFrame:
+    """Read index table of prediction store."""
+    return pd.read_csv(store_dir / INDEX, dtype={"Subject": str})
+
+
+def read_prediction_store(
+    store_dir: pathlib.Path,
+    query: str | None = None,
+    columns: Sequence[str] = ("Predictions", "times", "trial_ids"),
+    baseline: tuple[float | None, float | None] | None = None,
+    baseline_mode: str = "zscore",
+    baseline_trialwise: bool = False,
+    average_predictions: bool = False,
+) -> pd.DataFrame:
+    """Load predictions from store in the format of ``load_predictions``.
+
+    Parameters
+    ----------
+    store_dir : pathlib.Path
+        Directory of the store.
+    query : str | None
+        Query of the index table (see ``pd.DataFrame.query``) selecting the
+        recordings to load, e.g. ``"Medication == 'OFF'"``.
+    columns : Sequence[str]
+        Array columns to load. Metadata columns are always returned.
+    baseline : tuple | None
+        Baseline in seconds. If given, predictions are baseline corrected on
+        read with ``pte_stats.baseline_correct``.
+    baseline_mode : str
+        Baseline mode passed to ``pte_stats.baseline_correct``.
+    baseline_trialwise : bool
+        Whether to baseline correct each trial separately.
+    average_predictions : bool
+        Whether to average predictions over trials.
+    """
+    unknown = set(columns) - set(ARRAY_COLUMNS)
+    if unknown:
+        msg = (
+            f"Unknown columns: {sorted(unknown)}. Must be any of"
+            f" {list(ARRAY_COLUMNS)}."
+        )
+        raise ValueError(msg)
+    index = read_prediction_index(store_dir)
+    if query is not None:
+        index = index.query(query)
+    # Times are needed to baseline correct predictions
+    columns_loaded = list(columns)
+    if baseline is not None and "times" not in columns_loaded:
+        columns_loaded.append("times")
+
+    arrays = {
+        column: np.load(store_dir / ARRAY_COLUMNS[column][0], mmap_mode="r")
+        for column in columns_loaded
+    }
+    results: dict[str, list[np.ndarray]] = {
+        column: [] for column in columns_loaded
+    }
+    for _, row in index.iterrows():
+        n_trials, n_times = int(row["n_trials"]), int(row["n_times"])
+        sizes = {
+            "Predictions": n_trials * n_times,
+            "times": n_times,
+            "trial_ids": n_trials,
+        }
+        for column in columns_loaded:
+            start = int(row[f"offset_{column}"])
+            results[column].append(
+                np.asarray(arrays[column][start : start + sizes[column]])
+            )
+        if "Predictions" in results:
+            pred = results["Predictions"][-1].reshape(n_trials, n_times)
+            if baseline is not None:
+                base_start, base_end = pte_stats.handle_baseline_bytimes(
+                    baseline=baseline, times=results["times"][-1]
+                )
+                pred = pte_stats.baseline_correct(
+                    data=pred.astype(np.float64),
+                    baseline_mode=baseline_mode,
+                    base_start=base_start,
+                    base_end=base_end,
+                    baseline_trialwise=baseline_trialwise,
+                )
+            if average_predictions:
+                pred = pred.mean(axis=0)
+            results["Predictions"][-1] = pred
+
+    data = index.drop(
+        columns=[
+            "fname",
+            "file_hash",
+            "n_trials",
+            "n_times",
+            *(f"offset_{column}" for column in ARRAY_COLUMNS),
+        ]
+    ).reset_index(drop=True)
+    for column in columns:
+        data[column] = pd.Series(results[column], dtype=object)
+    return data
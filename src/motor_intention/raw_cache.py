@@ -0,0 +1,114 @@
+"""Cache of notch-filtered (and optionally resampled) raw recordings.
+
+Filtered recordings are saved as double precision FIF files, keyed by the
+content hash of the raw recording and the filter parameters. Cached
+recordings are opened without preloading, so that data can be read in
+blocks.
+"""
+from __future__ import annotations
+
+import json
+import pathlib
+import shutil
+from collections.abc import Mapping, Sequence
+
+import mne
+import mne_bids
+import numpy as np
+
+import motor_intention.decoding_times_helpers
+import motor_intention.feature_store
+import motor_intention.instrumentation
+
+FNAME = "filtered_raw.fif"
+
+
+def stim_notch_parameters() -> tuple[np.ndarray, np.ndarray]:
+    """Return frequencies and widths of notch filter for DBS artifacts."""
+    freqs = np.arange(130, 512, 130)
+    notch_widths = (freqs * 0.2).clip(26)
+    return freqs, notch_widths
+
+
+def load_filtered_raw(
+    bids_path: mne_bids.BIDSPath,
+    cache_dir: pathlib.Path,
+    notch_freqs: Sequence[float] | np.ndarray,
+    notch_widths: Sequence[float] | np.ndarray,
+    picks: Sequence[str] = ("ecog", "dbs"),
+    resample_freq: float | None = None,
+    raw_hashes: Mapping[str, str] | None = None,
+    timer: motor_intention.instrumentation.StageTimer | None = None,
+) -> mne.io.BaseRaw:
+    """Return notch-filtered raw recording, filtering it only once.
+
+    Parameters
+    ----------
+    bids_path : mne_bids.BIDSPath
+        Raw recording.
+    cache_dir : pathlib.Path
+        Directory of cached recordings.
+    notch_freqs, notch_widths : Sequence[float] | np.ndarray
+        Frequencies and widths of the notch filter.
+    picks : Sequence[str]
+        Channels to filter.
+    resample_freq : float | None
+        Sampling frequency to resample to after filtering. If None, the
+        recording is not resampled.
+    raw_hashes : Mapping[str, str] | None
+        Content hashes of the raw recording, if already known (see
+        ``feature_store.input_hashes``).
+    timer : StageTimer | None
+        Times reading, filtering and writing of the recording.
+    """
+    if timer is None:
+        timer = motor_intention.instrumentation.StageTimer()
+    if raw_hashes is None:
+        raw_hashes = motor_intention.feature_store.input_hashes(
+            {"raw": pathlib.Path(bids_path.fpath)}
+        )
+    parameters = {
+        "notch_freqs": np.asarray(notch_freqs, dtype=float).tolist(),
+        "notch_widths": np.asarray(notch_widths, dtype=float).tolist(),
+        "picks": list(picks),
+        "resample_freq": resample_freq,
+    }
+    key = motor_intention.decoding_times_helpers.cache_key(
+        file_hash=json.dumps(dict(raw_hashes), sort_keys=True),
+        parameters=parameters,
+    )
+    entry = cache_dir / key
+    if (entry / FNAME).is_file():
+        print(f"Reading filtered raw from cache: {entry}")
+        return mne.io.read_raw_fif(entry / FNAME, preload=False, verbose=0)
+
+    with timer.stage("read"):
+        raw = mne_bids.read_raw_bids(bids_path, extra_params={"verbose": 0})
+        raw.load_data()
+    with timer.stage("notch_filter"):
+        raw.notch_filter(
+            freqs=notch_freqs,
+            picks=list(picks),
+            notch_widths=notch_widths,
+            verbose=True,
+        )
+    if resample_freq is not None:
+        with timer.stage("resample"):
+            raw.resample(resample_freq)
+
+    # Write to temporary directory first, so that entries are complete
+    tmp_entry = cache_dir / f"{key}.tmp"
+    if tmp_entry.is_dir():
+        shutil.rmtree(tmp_entry)
+    tmp_entry.mkdir(parents=True)
+    with timer.stage("cache_write"):
+        raw.save(tmp_entry / FNAME, fmt="double", overwrite=True, verbose=0)
+    with (tmp_entry / "parameters.json").open("w", encoding="utf-8") as f:
+        json.dump({"raw": str(bids_path.fpath), **parameters}, f, indent=4)
+    del raw
+    try:
+        tmp_entry.replace(entry)
+    except OSError:
+        # Another process has cached the same recording in the meantime
+        shutil.rmtree(tmp_entry)
+    return mne.io.read_raw_fif(entry / FNAME, preload=False, verbose=0)
@@ -0,0 +1,196 @@
+"""Online decoding of motor intention from streamed raw data.
+
+Raw ECoG and STN-LFP samples arrive in chunks from a replayed recording.
+Features are computed with the same ``nm_settings.json`` and nm_channels
+as offline, on the same windows as ``nm.Stream.run``, and passed to a
+linear decoder. The latency of every prediction is measured from the
+arrival of the chunk that completed its feature window.
+"""
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+
+import mne
+import mne_bids
+import numpy as np
+import pandas as pd
+import pte_neuromodulation as nm
+
+import motor_intention.decoders
+import motor_intention.feature_stream
+
+
+def replay_raw(
+    raw: mne.io.BaseRaw,
+    chunk_size: int,
+    realtime: bool = True,
+) -> Iterator[tuple[float, np.ndarray]]:
+    """Yield arrival time and chunks of raw data of shape (channels, samples).
+
+    If realtime is True, each chunk is released when its last sample would
+    have been recorded.
+    """
+    data = raw.get_data()
+    sfreq = raw.info["sfreq"]
+    start = time.perf_counter()
+    for first in range(0, data.shape[1], chunk_size):
+        last = min(first + chunk_size, data.shape[1])
+        if realtime:
+            delay = start + last / sfreq - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield time.perf_counter(), data[:, first:last]
+
+
+class OnlineDecoder:
+    """Compute features and predictions from chunks of raw data.
+
+    Parameters
+    ----------
+    stream : nm.Stream
+        Stream set up with the settings and nm_channels used offline.
+    decoder : LinearDecoder
+        Decoder fitted on features of the same stream configuration.
+    """
+
+    def __init__(
+        self,
+        stream: nm.Stream,
+        decoder: motor_intention.decoders.LinearDecoder,
+    ) -> None:
+        self.stream = stream
+        self.decoder = decoder
+        self._n_batches = 0
+        self._n_received = 0
+        self._next_start, self._next_stop = self._bounds(0)
+        start_1, stop_1 = self._bounds(1)
+        # Holds the longest window plus the samples between two windows
+        self._capacity = max(
+            self._next_stop - self._next_start, stop_1 - start_1
+        ) + (stop_1 - self._next_stop + 1)
+        self._buffer = np.empty((len(stream.nm_channels), self._capacity))
+
+    def _bounds(self, batch_idx: int) -> tuple[int, int]:
+        starts, stops = motor_intention.feature_stream.window_bounds(
+            batch_indices=np.array([batch_idx]),
+            sfreq=self.stream.sfreq,
+            segment_length_ms=self.stream.settings[
+                "segment_length_features_ms"
+            ],
+            sfreq_features=self.stream.settings["sampling_rate_features_hz"],
+        )
+        return int(starts[0]), int(stops[0])
+
+    def _write(self, data: np.ndarray) -> None:
+        """Write samples to ring buffer, wrapping around at its end."""
+        first = self._n_received % self._capacity
+        n_head = min(data.shape[1], self._capacity - first)
+        self._buffer[:, first : first + n_head] = data[:, :n_head]
+        self._buffer[:, : data.shape[1] - n_head] = data[:, n_head:]
+        self._n_received += data.shape[1]
+
+    def _read(self, start: int, stop: int) -> np.ndarray:
+        """Return samples between start and stop from ring buffer."""
+        first = start % self._capacity
+        if first + stop - start <= self._capacity:
+            return self._buffer[:, first : first + stop - start]
+        return np.concatenate(
+            [
+                self._buffer[:, first:],
+                self._buffer[:, : (stop - start) - (self._capacity - first)],
+            ],
+            axis=1,
+        )
+
+    def push(
+        self, chunk: np.ndarray, arrival: float
+    ) -> list[dict[str, float]]:
+        """Add chunk of raw data and return predictions it completed."""
+        results = []
+        offset = 0
+        while offset < chunk.shape[1]:
+            # Write at most up to the next window stop, so that samples of
+            # pending windows are never overwritten
+            n_samples = min(
+                chunk.shape[1] - offset, self._next_stop - self._n_received
+            )
+            self._write(chunk[:, offset : offset + n_samples])
+            offset += n_samples
+            # Window k is complete once its last sample (stop - 1) is in
+            while self._next_stop <= self._n_received:
+                window = self._read(self._next_start, self._next_stop)
+                features = self.stream.run_analysis.process(window)
+                value = self.decoder.decision_function(features)
+                results.append(
+                    {
+                        "sample": self._next_stop,
+                        "time": self._next_stop / self.stream.sfreq,
+                        "prediction": float(value),
+                        "latency_ms": (time.perf_counter() - arrival) * 1000,
+                    }
+                )
+                self._n_batches += 1
+                self._next_start, self._next_stop = self._bounds(
+                    self._n_batches
+                )
+        return results
+
+
+def benchmark_latency(
+    bids_path: mne_bids.BIDSPath,
+    decoder: motor_intention.decoders.LinearDecoder,
+    path_settings: str,
+    path_nm_channels: str,
+    chunk_size: int = 1,
+    realtime: bool = True,
+    duration: float | None = None,
+) -> pd.DataFrame:
+    """Replay recording through online decoder and measure latencies.
+
+    Parameters
+    ----------
+    bids_path : mne_bids.BIDSPath
+        Recording to replay.
+    decoder : LinearDecoder
+        Decoder to predict with.
+    path_settings, path_nm_channels : str
+        Settings and nm_channels files of the decoder's features.
+    chunk_size : int
+        Number of samples per chunk delivered by the replay.
+    realtime : bool
+        Whether to replay at recording speed. If False, chunks are delivered
+        as fast as possible, which measures throughput instead.
+    duration : float | None
+        Seconds of the recording to replay. If None, replay all.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per prediction with sample, time, prediction and latency.
+    """
+    raw = mne_bids.read_raw_bids(bids_path, extra_params={"verbose": 0})
+    if duration is not None:
+        raw.crop(tmax=min(duration, raw.times[-1]))
+    raw.load_data()
+    stream = motor_intention.feature_stream.make_stream(
+        raw=raw, path_settings=path_settings, path_nm_channels=path_nm_channels
+    )
+    online = OnlineDecoder(stream=stream, decoder=decoder)
+    results = []
+    for arrival, chunk in replay_raw(
+        raw=raw, chunk_size=chunk_size, realtime=realtime
+    ):
+        results.extend(online.push(chunk=chunk, arrival=arrival))
+    results = pd.DataFrame(results)
+
+    interval_ms = 1000 / stream.settings["sampling_rate_features_hz"]
+    latency = results["latency_ms"]
+    print(
+        f"Predictions: {len(results)}. Latency [ms]: median"
+        f" {latency.median():.2f}, 95th percentile"
+        f" {latency.quantile(0.95):.2f}, max {latency.max():.2f}."
+        f" Feature interval: {interval_ms:.0f} ms."
+        f" Within interval: {(latency < interval_ms).mean():.1%}."
+    )
+    return results
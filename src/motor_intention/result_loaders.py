@@ -0,0 +1,104 @@
+"""Parallel, streaming loaders for decoding result files.
+
+Reading many small ``Scores.csv`` and ``PredTimelocked.json`` files is
+dominated by the cost of opening each file, which is high on network shares.
+The loaders here read and parse files in a thread pool and yield results as
+they arrive, so that downstream aggregation can start before the last file
+is read.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import functools
+import pathlib
+from collections.abc import Callable, Iterator, Sequence
+from typing import TypeVar
+
+import pandas as pd
+import pte_decode
+
+T = TypeVar("T")
+
+# File reads are I/O bound, so more threads than cores pay off
+MAX_WORKERS = 16
+
+
+def iter_files(
+    files: Sequence[pathlib.Path | str],
+    load_file: Callable[[pathlib.Path | str], T],
+    max_workers: int = MAX_WORKERS,
+) -> Iterator[tuple[int, T]]:
+    """Load files in a thread pool and yield results as they arrive.
+
+    Parameters
+    ----------
+    files : Sequence[pathlib.Path | str]
+        Files to load.
+    load_file : Callable
+        Function that loads a single file.
+    max_workers : int
+        Number of threads reading files concurrently.
+
+    Yields
+    ------
+    index : int
+        Position of the file in ``files``.
+    result : T
+        Return value of ``load_file``.
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            executor.submit(load_file, file): idx
+            for idx, file in enumerate(files)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # Don't read remaining files if the consumer stops early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def load_files(
+    files: Sequence[pathlib.Path | str],
+    load_file: Callable[[pathlib.Path | str], T],
+    max_workers: int = MAX_WORKERS,
+) -> list[T]:
+    """Load files in a thread pool and return results in order of files."""
+    results: list[T | None] = [None] * len(files)
+    for idx, result in iter_files(
+        files=files, load_file=load_file, max_workers=max_workers
+    ):
+        results[idx] = result
+    return results  # type: ignore[return-value]
+
+
+def load_scores(
+    files: Sequence[pathlib.Path | str],
+    max_workers: int = MAX_WORKERS,
+    **kwargs,
+) -> pd.DataFrame:
+    """Parallel version of ``pte_decode.load_scores`` for unaveraged runs."""
+    if kwargs.get("average_runs", False):
+        msg = "Averaging runs is not supported when loading files in parallel."
+        raise ValueError(msg)
+    return _concat(
+        files=files,
+        load=functools.partial(pte_decode.load_scores, **kwargs),
+        max_workers=max_workers,
+    )
+
+
+def _concat(
+    files: Sequence[pathlib.Path | str],
+    load: Callable[..., pd.DataFrame],
+    max_workers: int,
+) -> pd.DataFrame:
+    if not files:
+        return load(files=files)
+    data = load_files(
+        files=files,
+        load_file=lambda file: load(files=[file]),
+        max_workers=max_workers,
+    )
+    return pd.concat(data, ignore_index=True)
@@ -0,0 +1,30 @@
+"""Consolidate bad epochs files of all recordings into one table."""
+from __future__ import annotations
+
+import pathlib
+from typing import Annotated
+
+from pytask import Product
+
+import motor_intention.bad_epochs
+
+
+def task_bad_epochs_table(
+    in_path: pathlib.Path = motor_intention.bad_epochs.BAD_EPOCHS_DIR,
+    out_path: Annotated[
+        pathlib.Path, Product
+    ] = motor_intention.bad_epochs.BAD_EPOCHS_TABLE,
+) -> None:
+    """Main function of this script."""
+    table = motor_intention.bad_epochs.build_table(bad_epochs_dir=in_path)
+    motor_intention.bad_epochs.write_table(table=table, path=out_path)
+    event_ids = table.index.get_level_values("event_id")
+    n_bad = (event_ids != motor_intention.bad_epochs.NO_EVENT).sum()
+    print(
+        f"Bad epochs: {n_bad}"
+        f" of {table.index.get_level_values(0).nunique()} recordings."
+    )
+
+
+if __name__ == "__main__":
+    task_bad_epochs_table()
@@ -8,12 +8,17 @@ from typing import Annotated, Literal
 
 import mne_bids
 import numpy as np
+import pandas as pd
 import pte.filetools
-import pte_neuromodulation as nm
-from joblib import Parallel, delayed
+from joblib import Parallel, delayed, effective_n_jobs
 from pytask import Product
 
+import motor_intention.feature_scheduling
+import motor_intention.feature_store
+import motor_intention.feature_stream
+import motor_intention.instrumentation
 import motor_intention.project_constants as constants
+import motor_intention.raw_cache
 
 OUT_PATHS = {
     stim: constants.DERIVATIVES / "features" / f"stim_{stim.lower()}"
@@ -32,6 +37,12 @@ def compute_features(
     NM_CHANNELS_PATH = constants.DATA / "nm_channels" / f"bip_{PIPELINE}"
 
     N_JOBS = -1
+    # Read raw data in blocks of this many feature windows, so that memory
+    # per worker does not grow with recording length. Set to None to pass
+    # whole recordings to nm.Stream.run.
+    BATCHES_PER_BLOCK: int | None = 1000
+    # Cost of notch filtering per sample and channel, relative to features
+    NOTCH_COST = 1.0
 
     file_finder = pte.filetools.BIDSFinder(hemispheres=constants.ECOG_HEMISPHERES)
     file_finder.find_files(
@@ -44,24 +55,101 @@ def compute_features(
     print(file_finder)
     files = file_finder.files
 
+    # Skip files whose features were computed from identical inputs
+    path_settings = constants.DATA / "nm_settings.json"
+    files_todo = []
+    hashes = []
+    for file in files:
+        basename = file.copy().update(extension=None).basename
+        file_hashes = motor_intention.feature_store.input_hashes(
+            {
+                "raw": pathlib.Path(file.fpath),
+                "nm_channels": NM_CHANNELS_PATH
+                / (basename + "_nm_channels.csv"),
+                "settings": path_settings,
+            }
+        )
+        if motor_intention.feature_store.is_up_to_date(
+            folder=OUT_DIR / basename, hashes=file_hashes
+        ):
+            continue
+        files_todo.append(file)
+        hashes.append(file_hashes)
+    print(
+        f"Files up to date (skipped): {len(files) - len(files_todo)}."
+        f" Files to compute: {len(files_todo)}."
+    )
+    files = files_todo
+
+    # Submit most expensive files first, so that no large file starts last
+    costs = np.array(
+        [
+            motor_intention.feature_scheduling.estimate_cost(
+                fname=file, stimulation=stimulation, notch_cost=NOTCH_COST
+            )
+            for file in files
+        ]
+    )
+    order = motor_intention.feature_scheduling.longest_first(costs)
+    files = [files[idx] for idx in order]
+    hashes = [hashes[idx] for idx in order]
+
     kwargs = {
         "root_nm_channels": NM_CHANNELS_PATH,
-        "path_settings": str(constants.DATA / "nm_settings.json"),
+        "path_settings": str(path_settings),
         "path_out": str(OUT_DIR),
         "stimulation": stimulation,
+        "batches_per_block": BATCHES_PER_BLOCK,
     }
 
     start = time.perf_counter()
 
     if N_JOBS != 1:
-        Parallel(n_jobs=N_JOBS, verbose=1)(
-            delayed(run)(fname=file, **kwargs) for file in files
+        timings = Parallel(n_jobs=N_JOBS, verbose=1, batch_size=1)(
+            delayed(run)(fname=file, input_hashes=file_hashes, **kwargs)
+            for file, file_hashes in zip(files, hashes, strict=True)
         )
     else:
-        for file in files:
-            run(fname=file, **kwargs)
+        timings = [
+            run(fname=file, input_hashes=file_hashes, **kwargs)
+            for file, file_hashes in zip(files, hashes, strict=True)
+        ]
+
+    elapsed = time.perf_counter() - start
+    print(f"Time elapsed: {(elapsed/60):.0f} minutes")
 
-    print(f"Time elapsed: {((time.perf_counter()-start)/60):.0f} minutes")
+    # Seconds per stage and peak memory of every file
+    timings = pd.DataFrame(timings)
+    if not timings.empty:
+        timings.to_csv(OUT_DIR / "feature_timings.csv", index=False)
+        # Stages of feature kernels are part of "process" or "stream_run",
+        # and all stages are part of "total"
+        stage_times = timings.filter(like="time_").sum(min_count=1)
+        total_time = stage_times.pop("time_total")
+        kernel_times = stage_times.filter(like="time_features")
+        print("Seconds per stage:")
+        print(stage_times.drop(kernel_times.index).round(1))
+        print("Seconds per feature kernel (included in stages above):")
+        print(kernel_times.round(1))
+        print(f"Seconds in total: {total_time:.1f}")
+        print(f"Peak RSS per worker: {timings['peak_rss_mb'].max():.0f} MB")
+    durations = timings.get("time_total", pd.Series(dtype=float))
+
+    # Convert costs to seconds with the measured throughput
+    n_workers = effective_n_jobs(N_JOBS)
+    seconds_per_cost = sum(durations) / max(costs.sum(), 1.0)
+    for name, costs_ordered in (
+        ("directory order", costs),
+        ("longest first", costs[order]),
+    ):
+        predicted = motor_intention.feature_scheduling.makespan(
+            costs=costs_ordered, n_workers=n_workers
+        )
+        print(
+            f"Predicted makespan ({name}):"
+            f" {(predicted * seconds_per_cost / 60):.0f} minutes"
+        )
+    print(f"Actual makespan (longest first): {(elapsed/60):.0f} minutes")
 
 
 def run(
@@ -70,46 +158,119 @@ def run(
     path_settings: str,
     path_out: str,
     stimulation: Literal["Off", "On"],
-) -> None:
-    """Calculate features for single file."""
+    batches_per_block: int | None = None,
+    input_hashes: dict[str, str] | None = None,
+) -> dict[str, str | float | bool]:
+    """Calculate features for single file and return timings.
+
+    If input hashes are given, they are recorded in a manifest once the
+    features are written. Timings contain seconds per stage and the peak
+    resident memory of the worker.
+    """
+    timer = motor_intention.instrumentation.StageTimer()
+    with timer.track_memory(), timer.stage("total"):
+        computed = _run_file(
+            fname=fname,
+            root_nm_channels=root_nm_channels,
+            path_settings=path_settings,
+            path_out=path_out,
+            stimulation=stimulation,
+            batches_per_block=batches_per_block,
+            input_hashes=input_hashes,
+            timer=timer,
+        )
+    return {
+        "file": fname.basename,
+        "computed": computed,
+        **timer.report(),
+    }
+
+
+def _run_file(
+    fname: mne_bids.BIDSPath,
+    root_nm_channels: Path,
+    path_settings: str,
+    path_out: str,
+    stimulation: Literal["Off", "On"],
+    batches_per_block: int | None,
+    input_hashes: dict[str, str] | None,
+    timer: motor_intention.instrumentation.StageTimer,
+) -> bool:
     path_nm_channels = (
         root_nm_channels
         / (fname.copy().update(extension=None).basename + "_nm_channels.csv")
     ).resolve()
     if not path_nm_channels.is_file():
         print(f"No nm_channel found. Skipping file: {fname.fpath}")
-        return
+        return False
     print(f"Reading file: {fname.fpath}")
     path_nm_channels = str(path_nm_channels)
-    raw = mne_bids.read_raw_bids(fname, extra_params={"verbose": 0})
-    coord_list, coord_names = nm.io.get_coord_list(raw)
     if stimulation == "On":
-        raw.load_data()
-        freqs = np.arange(130, 512, 130)
-        notch_widths = (freqs * 0.2).clip(26)
-        raw.notch_filter(
-            freqs=freqs,
-            picks=["ecog", "dbs"],
+        freqs, notch_widths = (
+            motor_intention.raw_cache.stim_notch_parameters()
+        )
+        raw = motor_intention.raw_cache.load_filtered_raw(
+            bids_path=fname,
+            cache_dir=constants.DERIVATIVES / "raw_filtered",
+            notch_freqs=freqs,
             notch_widths=notch_widths,
-            verbose=True,
+            picks=["ecog", "dbs"],
+            raw_hashes=None
+            if input_hashes is None
+            else {
+                key: value
+                for key, value in input_hashes.items()
+                if key.startswith("raw:")
+            },
+            timer=timer,
         )
-    settings = nm.io.read_settings(path_settings)
-    nm_channels = nm.io.load_nm_channels(path_nm_channels)
-
-    stream = nm.Stream(
-        sfreq=raw.info["sfreq"],
-        nm_channels=nm_channels,
-        settings=settings,
-        line_noise=int(raw.info["line_freq"]),
-        coord_list=coord_list,
-        coord_names=coord_names,
-        verbose=False,
-    )
-    stream.run(
-        data=raw.get_data(),
-        out_path_root=path_out,
-        folder_name=fname.copy().update(extension=None).basename,
-    )
+    else:
+        with timer.stage("read"):
+            raw = mne_bids.read_raw_bids(
+                fname, extra_params={"verbose": 0}
+            )
+    with timer.stage("stream_setup"):
+        stream = motor_intention.feature_stream.make_stream(
+            raw=raw,
+            path_settings=path_settings,
+            path_nm_channels=path_nm_channels,
+        )
+        motor_intention.feature_stream.instrument_features(
+            stream=stream, timer=timer
+        )
+    folder_name = fname.copy().update(extension=None).basename
+    if batches_per_block is None:
+        with timer.stage("read"):
+            data = raw.get_data()
+        with timer.stage("stream_run"):
+            features = stream.run(
+                data=data,
+                out_path_root=path_out,
+                folder_name=folder_name,
+            )
+    else:
+        features = motor_intention.feature_stream.run_blockwise(
+            stream=stream,
+            raw=raw,
+            out_path_root=path_out,
+            folder_name=folder_name,
+            batches_per_block=batches_per_block,
+            timer=timer,
+        )
+    # Replace text feature table by compressed binary feature file
+    folder = Path(path_out) / folder_name
+    with timer.stage("save"):
+        motor_intention.feature_store.write_features(
+            features=features,
+            path=folder
+            / (folder_name + motor_intention.feature_store.SUFFIX),
+        )
+        (folder / f"{folder_name}_FEATURES.csv").unlink(missing_ok=True)
+    if input_hashes is not None:
+        motor_intention.feature_store.write_manifest(
+            folder=folder, hashes=input_hashes
+        )
+    return True
 
 
 def task_compute_features_stimoff(
@@ -8,8 +8,12 @@ from typing import Annotated, Literal
 
 import pte
 import pte_decode
+from joblib import Parallel, delayed
 from pytask import Product
 
+import motor_intention.bad_epochs
+import motor_intention.batched_decode
+import motor_intention.feature_store
 import motor_intention.project_constants as constants
 
 PATHS_STIM_OFF = tuple(
@@ -25,48 +29,71 @@ PATHS_STIM_ON_SINGLE_CHS = tuple(
     constants.DERIVATIVES / "decode" / "stim_on_single_chs" / ch for ch in ("ecog",)
 )
 
+# Parameters of the decoding pipeline used by batched_decode.decode_file
+BATCHED_PARAMETERS = (
+    "out_root",
+    "channels_used",
+    "types_used",
+    "feature_keywords",
+    "label_channels",
+    "target_begin",
+    "rest_begin",
+    "rest_end",
+    "dist_end",
+    "use_times",
+    "normalization_mode",
+)
+
 
 def task_decode_stimoff(
     in_path: pathlib.Path = constants.DERIVATIVES / "features" / "stim_off",
     out_paths: Sequence[Annotated[pathlib.Path, Product]] = PATHS_STIM_OFF,
+    bad_epochs_table: pathlib.Path = motor_intention.bad_epochs.BAD_EPOCHS_TABLE,
 ) -> None:
     decode(
         channels_used="all",
         in_path=in_path,
         out_paths=out_paths,
+        bad_epochs_table=bad_epochs_table,
     )
 
 
 def task_decode_stimon(
     in_path: pathlib.Path = constants.DERIVATIVES / "features" / "stim_on",
     out_paths: Sequence[Annotated[pathlib.Path, Product]] = PATHS_STIM_ON,
+    bad_epochs_table: pathlib.Path = motor_intention.bad_epochs.BAD_EPOCHS_TABLE,
 ) -> None:
     decode(
         channels_used="all",
         in_path=in_path,
         out_paths=out_paths,
+        bad_epochs_table=bad_epochs_table,
     )
 
 
 def task_decode_single_ch_stimoff(
     in_path: pathlib.Path = constants.DERIVATIVES / "features" / "stim_off",
     out_paths: Sequence[Annotated[pathlib.Path, Product]] = PATHS_STIM_OFF_SINGLE_CHS,
+    bad_epochs_table: pathlib.Path = motor_intention.bad_epochs.BAD_EPOCHS_TABLE,
 ) -> None:
     decode(
         channels_used="single",
         in_path=in_path,
         out_paths=out_paths,
+        bad_epochs_table=bad_epochs_table,
     )
 
 
 def task_decode_single_ch_stimon(
     in_path: pathlib.Path = constants.DERIVATIVES / "features" / "stim_on",
     out_paths: Sequence[Annotated[pathlib.Path, Product]] = PATHS_STIM_ON_SINGLE_CHS,
+    bad_epochs_table: pathlib.Path = motor_intention.bad_epochs.BAD_EPOCHS_TABLE,
 ) -> None:
     decode(
         channels_used="single",
         in_path=in_path,
         out_paths=out_paths,
+        bad_epochs_table=bad_epochs_table,
     )
 
 
@@ -74,6 +101,7 @@ def decode(
     channels_used: Literal["all", "single"],
     in_path: pathlib.Path,
     out_paths: Sequence[pathlib.Path],
+    bad_epochs_table: pathlib.Path = motor_intention.bad_epochs.BAD_EPOCHS_TABLE,
 ) -> None:
     out_paths_map = {path.name: path for path in out_paths}
 
@@ -101,6 +129,19 @@ def decode(
         "fft_high frequency activity",
     ]
     calculate_feature_importance = True  # Must be True, False or an Integer
+    # Also fit the fold models of LDA pipelines in batches with
+    # motor_intention.batched_decode and save their out-of-fold predictions.
+    # These are written to separate _Batched* files. Scores.csv and
+    # PredTimelocked.json, also of single-channel decoding, still come from
+    # pte_decode, which fits one model per channel and fold.
+    batched_decoding = True
+    # Feature importance of the batched fold models. It belongs to the batched
+    # scores saved with it, not to the scores of pte_decode.
+    batched_importance = True
+    # Save decoders of the batched fold models for predict-only runs
+    save_decoders = True
+    # Columns permuted together: "column", "band" or "channel"
+    importance_by = "column"
     # How many previous samples are used at each time point. Set to [1] to only
     # use the current time point.
     timepoint_features = range(1, 2)  # range(1, 2) is equal to [1]
@@ -120,7 +161,7 @@ def decode(
         "SQUARED_ROTATION",
     ]
 
-    PATH_BAD_EPOCHS = constants.DATA / "bad_epochs"
+    PATH_BAD_EPOCHS = motor_intention.bad_epochs.BAD_EPOCHS_DIR
     if not PATH_BAD_EPOCHS.is_dir():
         msg = f"Directory not found: {PATH_BAD_EPOCHS}"
         raise ValueError(msg)
@@ -131,71 +172,135 @@ def decode(
     file_finder = pte.filetools.DefaultFinder()
     file_finder.find_files(
         directory=in_path,
-        extensions="FEATURES.csv",
+        extensions="FEATURES.npz",
         stimulation=None,
         exclude=None,
     )
     print(file_finder)
-    feature_files = file_finder.files[-1::-1]
+    # Only the columns used for decoding are parsed by pte_decode. Feature
+    # files are projected once and shared by all tasks decoding them.
+    feature_root = constants.DERIVATIVES / "features_decode" / in_path.name
+    feature_files = motor_intention.feature_store.project_features(
+        files=[pathlib.Path(file) for file in file_finder.files[-1::-1]],
+        out_root=feature_root,
+        keywords=feature_keywords,
+        columns=[
+            motor_intention.feature_store.TIME,
+            *label_channels,
+            *targets_for_plotting,
+        ],
+    )
 
+    # Expand all combinations of parameters and feature files into one job
+    # list, so that no combination waits for the slowest file of another
+    jobs = []
+    batched_jobs = []
     for CLASSIFIER in classifier_parameters:
         classifier, balancing, optimize = CLASSIFIER.values()
         for target_begin, target_end in targets:
             for types_used, out_path in out_paths_map.items():
                 for use_times in timepoint_features:
-                    feature_normalization_mode = (
-                        None if use_times == 1 else feature_normalization_mode
-                    )
-                    print(
-                        "\n",
-                        classifier,
-                        balancing,
-                        optimize,
-                        target_begin,
-                        target_end,
-                        types_used,
-                        use_times,
-                    )
                     out_path.mkdir(exist_ok=True)
-                    pte_decode.run_pipeline_multiproc(
-                        pipeline_steps=[
+                    batched = (
+                        batched_decoding
+                        and classifier == "lda"
+                        and balancing == "balance_weights"
+                        and not optimize
+                        and target_end == "trial_onset"
+                    )
+                    parameters = {
+                        "pipeline_steps": [
                             "engineer",
                             "select",
                             "decode",
                         ],
-                        feature_root=in_path,
-                        filepaths_features=feature_files,
-                        n_jobs=n_jobs,
-                        classifier=classifier,
-                        label_channels=label_channels,
-                        target_begin=target_begin,
-                        target_end=target_end,
-                        optimize=optimize,
-                        balancing=balancing,
-                        out_root=out_path,
-                        channels_used=channels_used,
-                        types_used=types_used,
-                        hemispheres_used=hemispheres_used,
-                        feature_keywords=feature_keywords,
-                        n_splits_outer=n_splits_outer,
-                        scoring=scoring,
-                        feature_importance=calculate_feature_importance,
-                        plotting_target_channels=targets_for_plotting,
-                        prediction_mode=prediction_mode,
-                        use_times=use_times,
-                        normalization_mode=feature_normalization_mode,
-                        bad_epochs_path=PATH_BAD_EPOCHS,
-                        rest_begin=-3.0,
-                        rest_end=-2.0,
-                        dist_end=1.0,
-                        verbose=False,
-                        n_splits_inner=n_splits_inner,
-                        side="auto",
-                    )
+                        "feature_root": feature_root,
+                        "classifier": classifier,
+                        "label_channels": label_channels,
+                        "target_begin": target_begin,
+                        "target_end": target_end,
+                        "optimize": optimize,
+                        "balancing": balancing,
+                        "out_root": out_path,
+                        "channels_used": channels_used,
+                        "types_used": types_used,
+                        "hemispheres_used": hemispheres_used,
+                        "feature_keywords": feature_keywords,
+                        "n_splits_outer": n_splits_outer,
+                        "scoring": scoring,
+                        "feature_importance": calculate_feature_importance,
+                        "plotting_target_channels": targets_for_plotting,
+                        "prediction_mode": prediction_mode,
+                        "use_times": use_times,
+                        "normalization_mode": (
+                            None
+                            if use_times == 1
+                            else feature_normalization_mode
+                        ),
+                        "bad_epochs_path": PATH_BAD_EPOCHS,
+                        "rest_begin": -3.0,
+                        "rest_end": -2.0,
+                        "dist_end": 1.0,
+                        "verbose": False,
+                        "n_splits_inner": n_splits_inner,
+                        "side": "auto",
+                    }
+                    jobs.extend((file, parameters) for file in feature_files)
+                    if batched:
+                        batched_jobs.extend(
+                            (file, parameters) for file in feature_files
+                        )
+    # Largest feature files first, so that none of them starts last
+    jobs.sort(key=lambda job: job[0].stat().st_size, reverse=True)
+    print("Decoding jobs:", len(jobs))
+
+    Parallel(n_jobs=n_jobs, verbose=1, batch_size=1)(
+        delayed(decode_file)(file=file, **parameters)
+        for file, parameters in jobs
+    )
+
+    if batched_jobs:
+        bad_epochs = motor_intention.bad_epochs.read_table(bad_epochs_table)
+        print("Batched decoding jobs:", len(batched_jobs))
+        Parallel(n_jobs=n_jobs, verbose=1, batch_size=1)(
+            delayed(motor_intention.batched_decode.decode_file)(
+                file=file,
+                bad_epochs=bad_epochs,
+                feature_importance=batched_importance
+                and calculate_feature_importance is not False,
+                save_decoders=save_decoders,
+                importance_by=importance_by,
+                **{key: parameters[key] for key in BATCHED_PARAMETERS},
+            )
+            for file, parameters in batched_jobs
+        )
 
     print(f"Time elapsed: {(time.perf_counter()-start)/60:.2f} minutes")
 
 
+def decode_file(file: pathlib.Path, **parameters) -> None:
+    """Run decoding pipeline for single feature file."""
+    print(
+        "\n",
+        file.name,
+        *(
+            parameters[key]
+            for key in (
+                "classifier",
+                "balancing",
+                "optimize",
+                "target_begin",
+                "target_end",
+                "types_used",
+                "use_times",
+            )
+        ),
+    )
+    pte_decode.run_pipeline_multiproc(
+        filepaths_features=[file], n_jobs=1, **parameters
+    )
+
+
 if __name__ == "__main__":
     task_decode_stimoff()
     task_decode_stimon()
@@ -6,10 +6,10 @@ from collections.abc import Sequence
 from typing import Annotated
 
 import pte
-import pte_decode
 from pytask import Product
 
 import motor_intention.project_constants as constants
+import motor_intention.result_loaders
 
 CHANNELS = ("ecog", "dbs")
 INPATHS_STIM_OFF = tuple(
@@ -62,7 +62,9 @@ def write_accuracies(
         print(file_finder)
         print("Number of files found:", len(file_finder.files))
 
-        data = pte_decode.load_scores(files=file_finder.files, average_runs=False)
+        data = motor_intention.result_loaders.load_scores(
+            files=file_finder.files, average_runs=False
+        )
         out_path.parent.mkdir(parents=True, exist_ok=True)
         data.to_csv(out_path, index=False)
 
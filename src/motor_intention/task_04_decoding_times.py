@@ -2,25 +2,24 @@
 from __future__ import annotations
 
 import pathlib
+import shutil
 import time
 from collections.abc import Sequence
 from typing import Annotated, Literal
 
 import numpy as np
-import pte
+import pandas as pd
 import pte_decode
 from joblib import Parallel, delayed
 from pytask import Product
 
+import motor_intention.decoding_times_helpers as helpers
+import motor_intention.prediction_store as prediction_store
 import motor_intention.project_constants as constants
 
 CHANNELS = ("ecog", "dbs")
 
 
-INPATHS_STIM_OFF = {
-    (ch, "stim_off"): constants.DERIVATIVES / "decode" / "stim_off" / ch
-    for ch in CHANNELS
-}
 OUTPATHS_STIM_OFF = {
     (ch, "stim_off"): constants.RESULTS
     / "decode"
@@ -29,21 +28,10 @@ OUTPATHS_STIM_OFF = {
     / "decodingtimes.csv"
     for ch in CHANNELS
 }
-INPATHS_STIM_ON = {
-    (ch, "stim_on"): constants.DERIVATIVES / "decode" / "stim_on" / ch
-    for ch in CHANNELS
-}
 OUTPATHS_STIM_ON = {
     (ch, "stim_on"): constants.RESULTS / "decode" / "stim_on" / ch / "decodingtimes.csv"
     for ch in CHANNELS
 }
-INPATHS_SINGLE_STIM_OFF = {
-    (ch, "stim_off_single_chs"): constants.DERIVATIVES
-    / "decode"
-    / "stim_off_single_chs"
-    / ch
-    for ch in ("ecog",)
-}
 OUTPATHS_SINGLE_STIM_OFF = {
     (ch, "stim_off_single_chs"): constants.RESULTS
     / "decode"
@@ -52,13 +40,6 @@ OUTPATHS_SINGLE_STIM_OFF = {
     / "decodingtimes.csv"
     for ch in ("ecog",)
 }
-INPATHS_SINGLE_STIM_ON = {
-    (ch, "stim_on_single_chs"): constants.DERIVATIVES
-    / "decode"
-    / "stim_off_single_chs"
-    / ch
-    for ch in ("ecog",)
-}
 OUTPATHS_SINGLE_STIM_ON = {
     (ch, "stim_on_single_chs"): constants.RESULTS
     / "decode"
@@ -69,60 +50,59 @@ OUTPATHS_SINGLE_STIM_ON = {
 }
 
 
-def task_decoding_times_stimoff(
-    in_paths: dict[
-        tuple[Literal["ecog", "dbs"], Literal["stim_on", "stim_off"]],
-        Sequence[pathlib.Path],
-    ] = INPATHS_STIM_OFF,
-    out_paths: Sequence[Annotated[pathlib.Path, Product]] = OUTPATHS_STIM_OFF,
-) -> None:
-    calculate_decoding_times(stimulation="Off", in_paths=in_paths, out_paths=out_paths)
-
-
-def task_decoding_times_stimon(
-    in_paths: dict[
-        tuple[Literal["ecog", "dbs"], Literal["stim_on", "stim_off"]],
-        Sequence[pathlib.Path],
-    ]
-    | None = None,
-    out_paths: dict[str, Annotated[pathlib.Path, Product]] | None = None,
-) -> None:
-    calculate_decoding_times(stimulation="On")
-
-
-def task_decoding_times_single_ch(
-    in_paths: dict[
-        tuple[Literal["ecog", "dbs"], Literal["stim_on", "stim_off"]],
-        Sequence[pathlib.Path],
-    ]
-    | None = None,
-    out_paths: dict[str, Literal["ecog", "dbs"][pathlib.Path, Product]] | None = None,
-) -> None:
-    calculate_decoding_times(stimulation="Off", channels_used="single")
+OUTPATHS = {
+    **OUTPATHS_STIM_OFF,
+    **OUTPATHS_STIM_ON,
+    **OUTPATHS_SINGLE_STIM_OFF,
+    **OUTPATHS_SINGLE_STIM_ON,
+}
+INPATHS = {
+    (ch, pipeline): constants.DERIVATIVES
+    / "prediction_store"
+    / pipeline
+    / ch
+    / prediction_store.INDEX
+    for ch, pipeline in OUTPATHS
+}
 
 
-def task_decoding_times_single_ch_stimon(
-    in_paths: dict[
-        tuple[Literal["ecog", "dbs"], Literal["stim_on", "stim_off"]],
-        Sequence[pathlib.Path],
-    ]
-    | None = None,
-    out_paths: dict[str, Annotated[pathlib.Path, Product]] | None = None,
+def task_decoding_times(
+    in_paths: dict[tuple[str, str], pathlib.Path] = INPATHS,
+    out_paths: dict[
+        tuple[str, str], Annotated[pathlib.Path, Product]
+    ] = OUTPATHS,
 ) -> None:
-    calculate_decoding_times(stimulation="On", channels_used="single")
+    """Calculate decoding times of all pipelines on one work queue."""
+    calculate_decoding_times(
+        pipelines=[
+            ("Off", "all"),
+            ("On", "all"),
+            ("Off", "single"),
+            ("On", "single"),
+        ]
+    )
 
 
 def calculate_decoding_times(
-    stimulation: Literal["Off", "On"],
-    channels_used: Literal["all", "single"],
-    inpaths: dict[
-        tuple[Literal["ecog", "dbs"], Literal["stim_on", "stim_off"]],
-        Sequence[pathlib.Path],
-    ],
-    outpaths: Sequence[pathlib.Path],
+    pipelines: Sequence[tuple[Literal["Off", "On"], Literal["all", "single"]]],
 ) -> None:
-    """Main function of this script"""
+    """Main function of this script
+
+    Pipelines are given as tuples of stimulation and channels used. If
+    ENGINE is "batched", chunks of iterations of all recordings of all
+    pipelines are scheduled on one work queue, and every decodingtimes.csv
+    is written as soon as its recordings are complete. Otherwise recordings
+    are processed one after another.
+    """
     N_JOBS = -1
+    # "batched" computes all iterations of a recording as one array
+    # operation, "pte_decode" runs single iterations in parallel.
+    ENGINE: Literal["batched", "pte_decode"] = "batched"
+    CHUNK_SIZE = 50  # Iterations per array operation if ENGINE == "batched"
+    SEED = 1
+    # Reuse seeded trial resamples and permutations for all recordings with
+    # the same number of trials if ENGINE == "batched"
+    INDEX_BANKS = True
 
     RESAMPLE_TRIALS = 50
 
@@ -131,6 +111,12 @@ def calculate_decoding_times(
     CORRECTION_METHOD = "cluster_pvals"
 
     N_ITERATIONS = 500
+    # Set to a standard error (in seconds) to stop iterating once the mean
+    # earliest timepoint has converged. N_ITERATIONS is then the maximum.
+    # Convergence is checked after MIN_ITERATIONS and then after every
+    # further CHUNK_SIZE iterations. Only used if ENGINE == "batched".
+    TOLERANCE: float | None = None
+    MIN_ITERATIONS = 100
 
     BASELINE = (-3.0, -2.0)
     THRESHOLD = 0
@@ -138,99 +124,230 @@ def calculate_decoding_times(
     TIME_LIMS = (-3.0, 2.0)  # seconds
 
     def _single_timepoint(
-        default_value: int | float, **kwargs
+        default_value: int | float,
+        data: np.ndarray | pathlib.Path,
+        **kwargs,
     ) -> tuple[int | float, int]:
-        timepoint, trials_used = pte_decode.get_earliest_timepoint(**kwargs)
+        if isinstance(data, pathlib.Path):
+            data = helpers.load_shared_array(data)
+        timepoint, trials_used = pte_decode.get_earliest_timepoint(
+            data=data, **kwargs
+        )
         if timepoint is None:
             return default_value, trials_used
         return timepoint, trials_used
 
-    PIPELINE = f"stim_{stimulation.lower()}"
+    def _write_results(
+        data: pd.DataFrame,
+        out_path: pathlib.Path,
+        results: list[dict[str, float | int]],
+    ) -> None:
+        data = data.copy()
+        for column in ("Earliest Timepoint", "trials_used", "iterations_used"):
+            data[column] = [result[column] for result in results]
+        data = data.drop(columns=["Predictions", "times", "trial_ids"])
+
+        data.to_csv(out_path, na_rep="n/a", index=False)
+        print(f"Results written to: {out_path}")
+
+    # Every parameter that changes the results invalidates cached results
+    PARAMETERS = {
+        "engine": ENGINE,
+        # Sign flips drawn per timepoint, as in pte_stats
+        "sign_flips": "per_timepoint",
+        "chunk_size": CHUNK_SIZE,
+        "seed": SEED,
+        "index_banks": INDEX_BANKS,
+        "resample_trials": RESAMPLE_TRIALS,
+        "alpha": ALPHA,
+        "n_perm": N_PERM,
+        "correction_method": CORRECTION_METHOD,
+        "n_iterations": N_ITERATIONS,
+        "tolerance": TOLERANCE,
+        "min_iterations": MIN_ITERATIONS,
+        "baseline": BASELINE,
+        "threshold": THRESHOLD,
+        "time_lims": TIME_LIMS,
+        "min_cluster_size": 2,
+    }
+    CACHE_DIR = constants.DERIVATIVES / "decodingtimes_cache"
+    # Finished chunks of iterations are saved here, so that killed runs can
+    # resume within recordings. Set RESUME to False to discard checkpoints.
+    CHECKPOINT_DIR = constants.DERIVATIVES / "decodingtimes_checkpoints"
+    RESUME = True
+    if not RESUME and CHECKPOINT_DIR.is_dir():
+        shutil.rmtree(CHECKPOINT_DIR)
 
-    if channels_used == "single":
-        PIPELINE = f"{PIPELINE}_single_chs"
+    start = time.time()
 
-    stimulation = "On" if stimulation == "On" else "Off"
+    groups = []
+    for stimulation, channels_used in pipelines:
+        PIPELINE = f"stim_{stimulation.lower()}"
 
-    medication = None if stimulation == "Off" else "Off"
+        if channels_used == "single":
+            PIPELINE = f"{PIPELINE}_single_chs"
 
-    channel_types = ("dbs", "ecog") if channels_used == "all" else ("ecog",)
+        query = None if stimulation == "Off" else "Medication == 'OFF'"
 
-    file_finder = pte.filetools.DefaultFinder()
-    start = time.time()
-    for channel in channel_types:
-        INPUT_PATH = constants.DERIVATIVES / "decode" / PIPELINE / channel
-        OUTPUT_PATH = constants.RESULTS / "decode" / PIPELINE / channel
-        OUTPUT_PATH.mkdir(exist_ok=True, parents=True)
-
-        file_finder.find_files(
-            directory=INPUT_PATH,
-            extensions=["PredTimelocked.json"],
-            medication=medication,
+        channel_types = (
+            ("dbs", "ecog") if channels_used == "all" else ("ecog",)
         )
-        print(file_finder)
-        print("Files found:", len(file_finder.files))
-
-        data = pte_decode.load_predictions(
-            files=file_finder.files,
-            baseline=BASELINE,
-            baseline_mode="zscore",
-            baseline_trialwise=False,
-            average_predictions=False,
+        for channel in channel_types:
+            STORE_DIR = (
+                constants.DERIVATIVES / "prediction_store" / PIPELINE / channel
+            )
+            OUTPUT_PATH = constants.RESULTS / "decode" / PIPELINE / channel
+            OUTPUT_PATH.mkdir(exist_ok=True, parents=True)
+
+            data = prediction_store.read_prediction_store(
+                store_dir=STORE_DIR,
+                query=query,
+                baseline=BASELINE,
+                baseline_mode="zscore",
+                baseline_trialwise=False,
+                average_predictions=False,
+            )
+            index = prediction_store.read_prediction_index(STORE_DIR)
+            if query is not None:
+                index = index.query(query)
+            print(f"Recordings loaded from {STORE_DIR}:", len(data))
+            # Rows of store and index table are in the same order
+            file_hashes = index["file_hash"].to_list()
+            times = np.array(data.loc[:, "times"].iloc[0])
+            TIME_SLICE = (TIME_LIMS[0] <= times) & (times <= TIME_LIMS[1])
+            groups.append(
+                (
+                    OUTPUT_PATH / "decodingtimes.csv",
+                    data,
+                    file_hashes,
+                    TIME_SLICE,
+                    times[TIME_SLICE],
+                )
+            )
+
+    # Look up cached results, keyed by file contents and parameters
+    results: list[dict[int, dict[str, float | int]]] = [{} for _ in groups]
+    recordings = {}
+    for group_idx, (_, data, file_hashes, TIME_SLICE, TIMES_USED) in enumerate(
+        groups
+    ):
+        for rec_idx, (sample, file_hash) in enumerate(
+            zip(data["Predictions"].to_numpy(), file_hashes, strict=True)
+        ):
+            key = helpers.cache_key(file_hash=file_hash, parameters=PARAMETERS)
+            cached = helpers.load_cached(cache_dir=CACHE_DIR, key=key)
+            if cached is not None:
+                results[group_idx][rec_idx] = cached
+                continue
+            recordings[(group_idx, rec_idx)] = (
+                sample[..., TIME_SLICE],
+                {
+                    "times": TIMES_USED,
+                    "default_value": TIMES_USED[-1],
+                    # Seed depends on the recording only, so that results do
+                    # not change when other recordings are added or removed
+                    "rng": [SEED, int(file_hash[:16], 16)],
+                    "checkpoint_name": key,
+                },
+            )
+    n_cached = sum(len(results_group) for results_group in results)
+    print(f"Cached results used: {n_cached}. To compute: {len(recordings)}.")
+
+    def _finish(group_idx: int) -> None:
+        out_path, data, *_ = groups[group_idx]
+        if len(results[group_idx]) == len(data):
+            _write_results(
+                data=data,
+                out_path=out_path,
+                results=[results[group_idx][idx] for idx in range(len(data))],
+            )
+
+    def _store(
+        group_idx: int,
+        rec_idx: int,
+        timepoints_singlesub: np.ndarray | Sequence[float],
+        trials: int,
+    ) -> None:
+        result = {
+            "Earliest Timepoint": float(np.mean(timepoints_singlesub)),
+            "trials_used": int(trials),
+            "iterations_used": len(timepoints_singlesub),
+        }
+        print(
+            f"timepoint_avg = {result['Earliest Timepoint']:.2f},"
+            f" n_iterations = {result['iterations_used']}"
         )
-        times = np.array(data.loc[:, "times"].iloc[0])
-        TIME_SLICE = (TIME_LIMS[0] <= times) & (times <= TIME_LIMS[1])
-        TIMES_USED = times[TIME_SLICE]
-
-        timepoints = []
-        trials_used = []
-
-        for sample in data["Predictions"].to_numpy():
-            samples_used = sample[..., TIME_SLICE]
-
-            kwargs = {
-                "default_value": TIMES_USED[-1],
-                "data": samples_used,
-                "times": TIMES_USED,
-                "threshold": THRESHOLD,
-                "n_perm": N_PERM,
-                "alpha": ALPHA,
-                "correction_method": CORRECTION_METHOD,
-                "min_cluster_size": 2,
-                "resample_trials": RESAMPLE_TRIALS,
-                "verbose": False,
-            }
-            if N_JOBS == 1 or N_ITERATIONS == 1:
-                timepoints_singlesub = []
-                for _ in range(N_ITERATIONS):
-                    tp, trials = _single_timepoint(**kwargs)
-                    timepoints_singlesub.append(tp)
-                timepoint_avg = np.mean(timepoints_singlesub)
-            else:
-                timepoint_avg, trials = np.array(
-                    Parallel(n_jobs=N_JOBS, verbose=1)(
+        helpers.save_cached(
+            cache_dir=CACHE_DIR,
+            key=recordings[(group_idx, rec_idx)][1]["checkpoint_name"],
+            result=result,
+        )
+        results[group_idx][rec_idx] = result
+
+    if ENGINE == "batched":
+        for group_idx in range(len(groups)):
+            _finish(group_idx)
+        for (
+            (group_idx, rec_idx),
+            timepoints_singlesub,
+            trials,
+        ) in helpers.schedule_timepoints(
+            recordings=recordings,
+            n_iterations=N_ITERATIONS,
+            chunk_size=CHUNK_SIZE,
+            n_jobs=N_JOBS,
+            checkpoint_dir=CHECKPOINT_DIR,
+            index_bank_seed=SEED if INDEX_BANKS else None,
+            tolerance=TOLERANCE,
+            min_iterations=MIN_ITERATIONS,
+            threshold=THRESHOLD,
+            n_perm=N_PERM,
+            alpha=ALPHA,
+            correction_method=CORRECTION_METHOD,
+            min_cluster_size=2,
+            resample_trials=RESAMPLE_TRIALS,
+        ):
+            _store(group_idx, rec_idx, timepoints_singlesub, trials)
+            _finish(group_idx)
+        print(f"Time elapsed: {(time.time() - start) / 60:.1f} minutes")
+        return
+
+    for (group_idx, rec_idx), (samples_used, kwargs_rec) in recordings.items():
+        TIMES_USED = kwargs_rec["times"]
+        kwargs = {
+            "default_value": TIMES_USED[-1],
+            "data": samples_used,
+            "times": TIMES_USED,
+            "threshold": THRESHOLD,
+            "n_perm": N_PERM,
+            "alpha": ALPHA,
+            "correction_method": CORRECTION_METHOD,
+            "min_cluster_size": 2,
+            "resample_trials": RESAMPLE_TRIALS,
+            "verbose": False,
+        }
+        if N_JOBS == 1 or N_ITERATIONS == 1:
+            timepoints_singlesub = []
+            for _ in range(N_ITERATIONS):
+                tp, trials = _single_timepoint(**kwargs)
+                timepoints_singlesub.append(tp)
+        else:
+            # Publish predictions once so that tasks only pickle the path
+            with helpers.shared_array(samples_used) as path:
+                kwargs["data"] = path
+                timepoints_singlesub, trials_singlesub = zip(
+                    *Parallel(n_jobs=N_JOBS, verbose=1)(
                         delayed(_single_timepoint)(**kwargs)
                         for _ in range(N_ITERATIONS)
-                    )
-                ).mean(axis=0)
-            print(f"{timepoint_avg = :.2f}")
-            timepoints.append(timepoint_avg)
-            trials_used.append(int(trials))  # type: ignore  # noqa: PGH003
-
-        data["Earliest Timepoint"] = timepoints
-        data["trials_used"] = trials_used
-        data = data.drop(columns=["Predictions", "times", "trial_ids"])
-
-        data.to_csv(
-            OUTPUT_PATH / "decodingtimes.csv",
-            na_rep="n/a",
-            index=False,
-        )
+                    ),
+                    strict=True,
+                )
+                trials = np.mean(trials_singlesub)
+        _store(group_idx, rec_idx, timepoints_singlesub, trials)
+    for group_idx in range(len(groups)):
+        _finish(group_idx)
     print(f"Time elapsed: {(time.time() - start) / 60:.1f} minutes")
 
 
 if __name__ == "__main__":
-    task_decoding_times_stimoff()
-    task_decoding_times_stimon()
-    task_decoding_times_single_ch()
-    task_decoding_times_single_ch_stimon()
+    task_decoding_times()
@@ -8,6 +8,7 @@ import numpy as np
 import pte
 from pytask import Product
 
+import motor_intention.bad_epochs
 import motor_intention.project_constants as constants
 
 STIM = ("Off", "On")
@@ -28,7 +29,7 @@ def task_compute_tfr(
             KEYWORDS = constants.STIM_PAIRED_SUBS
             MEDICATION = "Off"
 
-        PATH_BAD_EPOCHS = constants.DATA / "bad_epochs"
+        PATH_BAD_EPOCHS = motor_intention.bad_epochs.BAD_EPOCHS_DIR
         if not PATH_BAD_EPOCHS.is_dir():
             msg = f"Directory not found: {PATH_BAD_EPOCHS}"
             raise ValueError(msg)
@@ -7,13 +7,13 @@ from typing import Annotated, Literal
 
 import mne
 import mne_bids
-import numpy as np
 import pandas as pd
 import pte
 from matplotlib import figure
 from matplotlib import pyplot as plt
 from pytask import Product
 
+import motor_intention.bad_epochs
 import motor_intention.project_constants as constants
 
 STIM = ("Off", "On")
@@ -29,8 +29,10 @@ OUT_DIRS = {
 def task_compute_rp_ecog(
     out_dirs: dict[Literal["Off", "On"], Annotated[Path, Product]] = OUT_DIRS,
     show_plots: bool = False,
+    bad_epochs_table: Path = motor_intention.bad_epochs.BAD_EPOCHS_TABLE,
 ) -> None:
     """Main function of this script."""
+    bad_epochs = motor_intention.bad_epochs.read_table(bad_epochs_table)
     for stimulation, OUT_DIR in out_dirs.items():
         if stimulation == "Off":
             KEYWORDS = None
@@ -50,8 +52,6 @@ def task_compute_rp_ecog(
 
         NM_CHANNELS_DIR = constants.DATA / "nm_channels" / f"unip_{PIPELINE}"
 
-        BAD_EPOCHS_DIR = constants.DATA / "bad_epochs"
-
         # parameters for analysis
         RESAMPLE_FREQ = 100
         HIGH_PASS = 0.1
@@ -131,20 +131,13 @@ def task_compute_rp_ecog(
             )
             del raw
 
-            bad_epochs_df = pte.filetools.get_bad_epochs(
-                filename=bids_path,
-                bad_epochs_dir=BAD_EPOCHS_DIR,
-            )
-            if bad_epochs_df is not None:
-                bad_epochs = bad_epochs_df.event_id.to_numpy()
-                bad_indices = np.array(
-                    [
-                        idx
-                        for idx, event in enumerate(epochs.selection)
-                        if event in bad_epochs
-                    ]
+            epochs = epochs.drop(
+                indices=motor_intention.bad_epochs.bad_mask(
+                    table=bad_epochs,
+                    filename=bids_path,
+                    selection=epochs.selection,
                 )
-                epochs = epochs.drop(indices=bad_indices)
+            )
 
             reject_criteria = {"ecog": 1e-3}  # 1 mV
             epochs.load_data().drop_bad(reject=reject_criteria)
@@ -7,12 +7,12 @@ from typing import Annotated, Literal
 
 import mne
 import mne_bids
-import numpy as np
 import pandas as pd
 import pte
 from matplotlib import pyplot as plt
 from pytask import Product
 
+import motor_intention.bad_epochs
 import motor_intention.project_constants as constants
 
 STIM = ("Off", "On")
@@ -28,8 +28,10 @@ OUT_DIRS = {
 def task_compute_rp_stn(
     out_dirs: dict[Literal["Off", "On"], Annotated[Path, Product]] = OUT_DIRS,
     show_plots: bool = False,
+    bad_epochs_table: Path = motor_intention.bad_epochs.BAD_EPOCHS_TABLE,
 ) -> None:
     """Main function of this script."""
+    bad_epochs = motor_intention.bad_epochs.read_table(bad_epochs_table)
     for stimulation, OUT_DIR in out_dirs.items():
         if stimulation == "Off":
             KEYWORDS = None
@@ -53,8 +55,6 @@ def task_compute_rp_stn(
             / f"unip_{PIPELINE}"  # f"bip_{PIPELINE}"
         )  #
 
-        BAD_EPOCHS_DIR = constants.DATA / "bad_epochs"
-
         # parameters for analysis
         RESAMPLE_FREQ = 100
         HIGH_PASS = 0.1
@@ -143,23 +143,18 @@ def task_compute_rp_stn(
             continue
             del raw
 
-            bad_epochs_df = pte.filetools.get_bad_epochs(
-                filename=bids_path,
-                bad_epochs_dir=BAD_EPOCHS_DIR,
-            )
-            if bad_epochs_df is not None:
-                bad_epochs = bad_epochs_df.event_id.to_numpy()
-                bad_indices = np.array(
-                    [
-                        idx
-                        for idx, event in enumerate(epochs.selection)
-                        if event in bad_epochs
-                    ]
-                )
-                epochs = epochs.drop(indices=bad_indices)
-            else:
+            if not motor_intention.bad_epochs.has_recording(
+                bad_epochs, bids_path
+            ):
                 msg = "No bad epochs file found."
                 raise ValueError(msg)
+            epochs = epochs.drop(
+                indices=motor_intention.bad_epochs.bad_mask(
+                    table=bad_epochs,
+                    filename=bids_path,
+                    selection=epochs.selection,
+                )
+            )
 
             reject_criteria = {"dbs": 1e-3}  # 1 mV
             epochs.load_data().crop(tmin=-3.0, tmax=2.0).drop_bad(
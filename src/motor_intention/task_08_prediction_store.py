@@ -0,0 +1,76 @@
+"""Consolidate timelocked predictions into prediction stores and a cube."""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Annotated
+
+import pte
+from pytask import Product
+
+import motor_intention.prediction_cube
+import motor_intention.prediction_store
+import motor_intention.project_constants as constants
+
+DECODE = "decode"
+PIPELINE_CHANNELS = {
+    "stim_off": ("dbs", "ecog"),
+    "stim_on": ("dbs", "ecog"),
+    "stim_off_single_chs": ("ecog",),
+    "stim_on_single_chs": ("ecog",),
+}
+IN_PATHS = {
+    (pipeline, ch): constants.DERIVATIVES / DECODE / pipeline / ch
+    for pipeline, channels in PIPELINE_CHANNELS.items()
+    for ch in channels
+}
+OUT_PATHS = {
+    (pipeline, ch): constants.DERIVATIVES
+    / "prediction_store"
+    / pipeline
+    / ch
+    / motor_intention.prediction_store.INDEX
+    for pipeline, channels in PIPELINE_CHANNELS.items()
+    for ch in channels
+}
+
+
+def task_write_prediction_stores(
+    in_paths: dict[tuple[str, str], Path] = IN_PATHS,
+    out_paths: dict[tuple[str, str], Annotated[Path, Product]] = OUT_PATHS,
+) -> None:
+    """Main function of this script."""
+    file_finder = pte.filetools.DefaultFinder()
+    for key, in_path in in_paths.items():
+        file_finder.find_files(
+            directory=in_path,
+            extensions=["PredTimelocked.json"],
+        )
+        print(file_finder)
+        print("Files found:", len(file_finder.files))
+        motor_intention.prediction_store.write_prediction_store(
+            files=file_finder.files, store_dir=out_paths[key].parent
+        )
+
+
+CUBE_PATH = constants.DERIVATIVES / "prediction_cube" / "index.csv"
+
+
+def task_write_prediction_cube(
+    in_paths: dict[tuple[str, str], Path] = OUT_PATHS,
+    out_path: Annotated[Path, Product] = CUBE_PATH,
+) -> None:
+    """Write trial-averaged predictions of all pipelines to one cube."""
+    BASELINE = (-3.0, -2.0)
+    BASELINE_MODE = "zscore"
+
+    motor_intention.prediction_cube.write_prediction_cube(
+        store_dirs={key: path.parent for key, path in in_paths.items()},
+        cube_dir=out_path.parent,
+        baseline=BASELINE,
+        baseline_mode=BASELINE_MODE,
+    )
+
+
+if __name__ == "__main__":
+    task_write_prediction_stores()
+    task_write_prediction_cube()
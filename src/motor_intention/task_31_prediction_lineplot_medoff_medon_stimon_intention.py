@@ -3,16 +3,15 @@ from __future__ import annotations
 
 import json
 from pathlib import Path
-from typing import Annotated, Literal
+from typing import Annotated
 
 import matplotlib as mpl
-import numpy as np
-import pte
 import pte_decode
 from matplotlib import pyplot as plt
 from pytask import Product
 
 import motor_intention.plotting_settings
+import motor_intention.prediction_cube
 import motor_intention.project_constants as constants
 
 DECODE = "decode"
@@ -23,17 +22,11 @@ BASENAME = "prediction_lineplot_ecogvslfp"
 
 CH_TYPES = ("ecog", "dbs")
 STIM = ("Off", "On")
-IN_PATHS = {
-    (ch_type, stim): constants.DERIVATIVES / DECODE / f"stim_{stim.lower()}" / ch_type
-    for ch_type in CH_TYPES
-    for stim in STIM
-}
+IN_PATH = constants.DERIVATIVES / "prediction_cube" / "index.csv"
 
 
 def task_prediction_lineplot_ecogvslfp(
-    in_paths: dict[
-        tuple[Literal["ecog", "dbs"], Literal["Off", "On"]], Path
-    ] = IN_PATHS,
+    in_path: Path = IN_PATH,
     plot_path: Annotated[Path, Product] = PLOT_PATH / (BASENAME + ".svg"),
     cluster_path: Annotated[Path, Product] = PLOT_PATH / f"{BASENAME}_clusters.json",
 ) -> None:
@@ -42,12 +35,14 @@ def task_prediction_lineplot_ecogvslfp(
     motor_intention.plotting_settings.medoff_medon_stimon()
 
     N_PERM = 10000
-    BASELINE = (-3.0, -2.0)
     CORRECTION_METHOD = "cluster_pvals"
     ALPHA = 0.05
     Y_LIMS = (-0.6, 4.5)
 
-    file_finder = pte.filetools.DefaultFinder()
+    # Predictions are z-scored to a baseline of (-3, -2) s in the cube
+    index, cube, times = motor_intention.prediction_cube.read_prediction_cube(
+        in_path.parent
+    )
 
     fig, axs = plt.subplots(3, 1, sharex=True, figsize=(2.3, 3.4), sharey=True)
     i = 0
@@ -56,40 +51,28 @@ def task_prediction_lineplot_ecogvslfp(
     for stimulation in STIM:
         conds_med = ("OFF", "ON") if stimulation == "Off" else ("OFF",)
         for med in conds_med:
+            pipeline = f"stim_{stimulation.lower()}"
             data_map = {}
             for ch_type in CH_TYPES:
-                in_path = in_paths[(ch_type, stimulation)]
-
-                file_finder.find_files(
-                    directory=in_path,
-                    keywords=None,
-                    exclude=None,
-                    extensions=["PredTimelocked.json"],
-                    medication=med,
-                    stimulation=stimulation,
-                )
-                print(file_finder)
-                print("Files found:", len(file_finder.files))
-
-                data = pte_decode.load_predictions(
-                    files=file_finder.files,
-                    baseline=BASELINE,
-                    baseline_mode="zscore",
-                    baseline_trialwise=False,
-                    average_predictions=True,
+                selected, data_map[ch_type] = (
+                    motor_intention.prediction_cube.select(
+                        index=index,
+                        cube=cube,
+                        query=(
+                            f"Pipeline == '{pipeline}'"
+                            f" and ChannelType == '{ch_type}'"
+                            f" and Medication == '{med}'"
+                            f" and Stimulation == '{stimulation.upper()}'"
+                        ),
+                        sort_by=["Subject"],
+                    )
                 )
-                data_map[ch_type] = data
-
-            with Path(file_finder.files[0]).open("w", encoding="utf-8") as f:
-                pred_data = json.load(f)
-            times = np.array(pred_data["times"])
+                print(f"Recordings found ({ch_type}):", selected.shape[0])
 
-            ecog = data_map["ecog"].sort_values(by=["Subject"])
-            lfp = data_map["dbs"].sort_values(by=["Subject"])
-            ecog_data = np.stack(ecog.loc[:, "Predictions"].to_list()).squeeze().T
-            lfp_data = np.stack(lfp.loc[:, "Predictions"].to_list()).squeeze().T
+            ecog_data = data_map["ecog"].T
+            lfp_data = data_map["dbs"].T
             assert ecog_data.shape == lfp_data.shape
-            print("Subjects used:", ecog.shape[0])
+            print("Subjects used:", ecog_data.shape[1])
 
             colors = (
                 mpl.rcParams["axes.prop_cycle"].by_key()["color"][i],
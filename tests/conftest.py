@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import types
+from collections.abc import Callable, Sequence
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture()
+def stream() -> types.SimpleNamespace:
+    """Stand-in for the parts of ``nm.Stream`` used by this package.
+
+    Features of a window are its first and last sample of the first channel
+    and its length. The last channel is a target channel. Feature tables
+    passed to ``save_after_stream`` are kept in ``saved`` by folder name.
+    """
+
+    def process(window: np.ndarray) -> pd.Series:
+        return pd.Series(
+            {
+                "first": window[0, 0],
+                "last": window[0, -1],
+                "length": window.shape[1],
+            }
+        )
+
+    saved = {}
+    return types.SimpleNamespace(
+        sfreq=1000.0,
+        settings={
+            "segment_length_features_ms": 100,
+            "sampling_rate_features_hz": 10,
+        },
+        nm_channels=pd.DataFrame(
+            {
+                "name": ["ECOG_L_1", "ECOG_L_2", "SQUARED_EMG"],
+                "target": [0, 0, 1],
+            }
+        ),
+        run_analysis=types.SimpleNamespace(process=process),
+        save_after_stream=lambda root, folder, features: saved.update(
+            {folder: features}
+        ),
+        saved=saved,
+    )
+
+
+@pytest.fixture()
+def make_data() -> Callable[..., tuple[np.ndarray, np.ndarray]]:
+    """Return function drawing normal features and binary labels.
+
+    ``effects`` (one per feature) are added to samples of the positive
+    class. If ``n_channels`` is given, features have shape (channels,
+    samples, features), otherwise (samples, features).
+    """
+
+    def _make_data(
+        rng: np.random.Generator,
+        n_samples: int,
+        effects: Sequence[float],
+        n_channels: int | None = None,
+        p_positive: float = 0.5,
+        offset: float = 0.0,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        y = rng.random(n_samples) < p_positive
+        shape = (n_samples, len(effects))
+        if n_channels is not None:
+            shape = (n_channels, *shape)
+        X = rng.normal(size=shape) + y[:, None] * np.asarray(effects) + offset
+        return X, y
+
+    return _make_data
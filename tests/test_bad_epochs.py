@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from motor_intention import bad_epochs
+
+
+def _write_files(directory):
+    pd.DataFrame({"event_id": [7, 3], "reason": ["emg", "artifact"]}).to_csv(
+        directory / "sub-EL002_run-1_bad_epochs.csv"
+    )
+    pd.DataFrame({"event_id": pd.Series(dtype=int)}).to_csv(
+        directory / "sub-EL003_run-1_bad_epochs.csv"
+    )
+    (directory / "sub-EL004_run-1_bad_epochs.csv").touch()
+
+
+def test_bad_mask(tmp_path):
+    _write_files(tmp_path)
+    table = bad_epochs.build_table(tmp_path)
+
+    mask = bad_epochs.bad_mask(
+        table=table,
+        filename="sub-EL002_run-1_ieeg.vhdr",
+        selection=np.array([0, 3, 5, 7]),
+    )
+
+    np.testing.assert_array_equal(mask, [False, True, False, True])
+
+
+def test_empty_file_is_annotated(tmp_path):
+    _write_files(tmp_path)
+    bad_epochs.write_table(
+        table=bad_epochs.build_table(tmp_path), path=tmp_path / "table.csv"
+    )
+    table = bad_epochs.read_table(tmp_path / "table.csv")
+
+    for basename in ("sub-EL003_run-1", "sub-EL004_run-1"):
+        filename = f"{basename}_ieeg.vhdr"
+        assert bad_epochs.has_recording(table, filename)
+        assert bad_epochs.get_event_ids(table, filename).size == 0
+        assert not bad_epochs.bad_mask(
+            table=table, filename=filename, selection=np.arange(10)
+        ).any()
+    assert not bad_epochs.has_recording(table, "sub-EL005_run-1_ieeg.vhdr")
@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+
+from motor_intention import (
+    bad_epochs,
+    batched_decode,
+    decoders,
+    decoding_times_helpers,
+)
+
+BASENAME = "sub-EL002_ses-EcogLfpMedOff01_task-SelfpacedRotationR_run-1_ieeg"
+PARAMETERS = {
+    "feature_keywords": ["fft_theta", "fft_alpha"],
+    "label_channels": ["SQUARED_EMG", "SQUARED_INTERPOLATED_EMG"],
+    "target_begin": -1.0,
+    "rest_begin": -3.0,
+    "rest_end": -2.0,
+    "dist_end": 1.0,
+}
+
+
+def _write_features(directory) -> tuple:
+    """Write features of 12 trials, one every 8 s at 10 Hz.
+
+    Theta of ECOG_L_1 rises before every movement, all else is noise.
+    """
+    rng = np.random.default_rng(0)
+    times = np.arange(0, 100, 0.1)
+    onsets = np.arange(5, 97, 8)
+    label = np.zeros(times.size)
+    intention = np.zeros(times.size)
+    for onset in onsets:
+        label[(times >= onset) & (times < onset + 1)] = 1.0
+        intention[(times >= onset - 1) & (times < onset)] = 1.0
+    features = pd.DataFrame({"time": times * 1000, "SQUARED_EMG": label})
+    for channel in ("ECOG_L_1_SMC_AT", "ECOG_L_2_SMC_AT", "ECOG_R_1_SMC_AT"):
+        for band in ("theta", "alpha"):
+            features[f"{channel}_fft_{band}"] = rng.normal(size=times.size)
+    features["ECOG_L_1_SMC_AT_fft_theta"] += 3 * intention
+    folder = directory / BASENAME
+    folder.mkdir()
+    file = folder / f"{BASENAME}_FEATURES.csv"
+    features.to_csv(file, index=False)
+    return file, onsets
+
+
+def test_trial_labels():
+    times = np.arange(0, 30, 0.5)
+    label = np.zeros(times.size)
+    # Second trial starts too soon after the end of the first one
+    for onset, end in ((5.0, 6.0), (9.0, 10.0), (20.0, 21.0)):
+        label[(times >= onset) & (times < end)] = 1.0
+
+    labels, trials = batched_decode.trial_labels(
+        label=label,
+        times=times,
+        target_begin=-1.0,
+        rest_begin=-3.0,
+        rest_end=-2.0,
+        dist_end=1.0,
+    )
+
+    np.testing.assert_array_equal(
+        times[trials == 0], [2.0, 2.5, 3.0, 4.0, 4.5]
+    )
+    np.testing.assert_array_equal(times[labels & (trials == 0)], [4.0, 4.5])
+    assert not (trials == 1).any()
+    np.testing.assert_array_equal(
+        times[trials == 2], [17.0, 17.5, 18.0, 19.0, 19.5]
+    )
+
+
+def test_decode_file_single_channels(tmp_path):
+    file, onsets = _write_features(tmp_path)
+
+    importance = batched_decode.decode_file(
+        file=file,
+        out_root=tmp_path / "decode",
+        channels_used="single",
+        types_used="ecog",
+        **PARAMETERS,
+    )
+
+    # Ipsilateral channels are not used
+    assert list(importance["channel"].unique()) == [
+        "ECOG_L_1_SMC_AT",
+        "ECOG_L_2_SMC_AT",
+    ]
+    assert sorted(importance["fold"].unique()) == list(range(len(onsets)))
+    mean = importance.groupby("group")["importance_mean"].mean()
+    assert mean.idxmax() == "ECOG_L_1_SMC_AT_fft_theta"
+    saved = pd.read_csv(
+        tmp_path
+        / "decode"
+        / BASENAME
+        / f"{BASENAME}_use_times-1{batched_decode.IMPORTANCE_SUFFIX}"
+    )
+    pd.testing.assert_frame_equal(saved, importance)
+
+
+def test_decode_file_saves_out_of_fold_predictions(tmp_path):
+    file, onsets = _write_features(tmp_path)
+    out_dir = tmp_path / "decode" / BASENAME
+
+    batched_decode.decode_file(
+        file=file,
+        out_root=tmp_path / "decode",
+        channels_used="single",
+        types_used="ecog",
+        **PARAMETERS,
+    )
+    predictions = pd.read_csv(
+        out_dir / f"{BASENAME}_use_times-1{batched_decode.PREDICTIONS_SUFFIX}"
+    )
+    scores = pd.read_csv(
+        out_dir
+        / f"{BASENAME}_use_times-1{batched_decode.BATCHED_SCORES_SUFFIX}"
+    )
+
+    features = pd.read_csv(file)
+    columns = ["ECOG_L_1_SMC_AT_fft_theta", "ECOG_L_1_SMC_AT_fft_alpha"]
+    rows = np.searchsorted(
+        features["time"].round(6), (predictions["time"] * 1000).round(6)
+    )
+    X = features.loc[rows, columns].to_numpy()
+    y = predictions["label"].to_numpy()
+    for trial in range(len(onsets)):
+        test = predictions["trial"].to_numpy() == trial
+        model = LinearDiscriminantAnalysis(solver="lsqr", priors=[0.5, 0.5])
+        model.fit(X[~test], y[~test])
+        np.testing.assert_allclose(
+            predictions.loc[test, "ECOG_L_1_SMC_AT"],
+            model.decision_function(X[test]),
+        )
+    assert sorted(scores["fold"].unique()) == list(range(len(onsets)))
+    accuracy = scores.groupby("channel")["balanced_accuracy"].mean()
+    assert accuracy["ECOG_L_1_SMC_AT"] > 0.8
+    assert accuracy["ECOG_L_1_SMC_AT"] > accuracy["ECOG_L_2_SMC_AT"]
+
+
+def test_importance_by_band_uses_folds_of_scores(tmp_path):
+    file, onsets = _write_features(tmp_path)
+    out_dir = tmp_path / "decode" / BASENAME
+    (tmp_path / "bad_epochs").mkdir()
+    pd.DataFrame({"event_id": [3]}).to_csv(
+        tmp_path
+        / "bad_epochs"
+        / f"{BASENAME.removesuffix('_ieeg')}{bad_epochs.SUFFIX}"
+    )
+
+    importance = batched_decode.decode_file(
+        file=file,
+        out_root=tmp_path / "decode",
+        channels_used="all",
+        types_used="ecog",
+        bad_epochs=bad_epochs.build_table(tmp_path / "bad_epochs"),
+        importance_by="band",
+        **PARAMETERS,
+    )
+    scores = pd.read_csv(
+        out_dir
+        / f"{BASENAME}_use_times-1{batched_decode.BATCHED_SCORES_SUFFIX}"
+    )
+
+    assert sorted(importance["group"].unique()) == ["alpha", "theta"]
+    assert sorted(importance["fold"].unique()) == scores["fold"].tolist()
+    mean = importance.groupby("group")["importance_mean"].mean()
+    assert mean["theta"] > mean["alpha"]
+
+
+def test_decode_file_excludes_bad_epochs(tmp_path):
+    file, onsets = _write_features(tmp_path)
+    (tmp_path / "bad_epochs").mkdir()
+    pd.DataFrame({"event_id": [2, 5]}).to_csv(
+        tmp_path
+        / "bad_epochs"
+        / f"{BASENAME.removesuffix('_ieeg')}{bad_epochs.SUFFIX}"
+    )
+
+    importance = batched_decode.decode_file(
+        file=file,
+        out_root=tmp_path / "decode",
+        channels_used="all",
+        types_used="ecog",
+        bad_epochs=bad_epochs.build_table(tmp_path / "bad_epochs"),
+        **PARAMETERS,
+    )
+
+    assert list(importance["channel"].unique()) == ["all"]
+    assert sorted(importance["fold"].unique()) == [
+        fold for fold in range(len(onsets)) if fold not in (2, 5)
+    ]
+
+
+def test_decode_file_lagged(tmp_path):
+    file, onsets = _write_features(tmp_path)
+
+    importance = batched_decode.decode_file(
+        file=file,
+        out_root=tmp_path / "decode",
+        channels_used="all",
+        types_used="ecog",
+        use_times=3,
+        normalization_mode="by_latest_sample",
+        **PARAMETERS,
+    )
+
+    # Lags of a column are permuted as one group
+    assert len(importance) == len(onsets) * 4
+    mean = importance.groupby("group")["importance_mean"].mean()
+    assert mean.idxmax() == "ECOG_L_1_SMC_AT_fft_theta"
+    assert (
+        tmp_path
+        / "decode"
+        / BASENAME
+        / f"{BASENAME}_use_times-3{batched_decode.IMPORTANCE_SUFFIX}"
+    ).is_file()
+
+
+def test_decode_file_saves_decoders_of_predictions(tmp_path):
+    file, onsets = _write_features(tmp_path)
+    out_dir = tmp_path / "decode" / BASENAME
+
+    batched_decode.decode_file(
+        file=file,
+        out_root=tmp_path / "decode",
+        channels_used="single",
+        types_used="ecog",
+        **PARAMETERS,
+    )
+    loaded, metadata = decoders.load_decoders(
+        out_dir / f"{BASENAME}_ECOG_L_1_SMC_AT{batched_decode.DECODERS_SUFFIX}"
+    )
+
+    assert metadata["channel"] == "ECOG_L_1_SMC_AT"
+    assert metadata["feature_hash"] == decoding_times_helpers.hash_file(file)
+    assert list(loaded) == [
+        *(f"fold_{fold}" for fold in range(len(onsets))),
+        decoders.FULL,
+    ]
+    assert loaded[decoders.FULL].columns == (
+        "ECOG_L_1_SMC_AT_fft_theta",
+        "ECOG_L_1_SMC_AT_fft_alpha",
+    )
+    # Decoder of every fold reproduces the saved predictions of its trial
+    saved = pd.read_csv(out_dir / metadata["predictions"])
+    predictions = decoders.predict_file(file, loaded)
+    rows = np.searchsorted(
+        (predictions["time"] / 1000).round(6), saved["time"].round(6)
+    )
+    for trial in range(len(onsets)):
+        test = saved["trial"].to_numpy() == trial
+        np.testing.assert_allclose(
+            predictions.loc[rows[test], f"fold_{trial}"],
+            saved.loc[test, "ECOG_L_1_SMC_AT"],
+        )
+    # Decoder of all samples gives higher decision function before movements
+    time = predictions["time"].to_numpy() / 1000
+    before = np.zeros(len(time), dtype=bool)
+    for onset in onsets:
+        before |= (time >= onset - 1) & (time < onset)
+    assert (
+        predictions[decoders.FULL][before].mean()
+        > predictions[decoders.FULL][~before].mean()
+    )
+
+
+def test_decode_file_saves_decoders_without_importance(tmp_path):
+    file, _ = _write_features(tmp_path)
+    out_dir = tmp_path / "decode" / BASENAME
+
+    importance = batched_decode.decode_file(
+        file=file,
+        out_root=tmp_path / "decode",
+        channels_used="all",
+        types_used="ecog",
+        feature_importance=False,
+        **PARAMETERS,
+    )
+
+    assert importance is None
+    assert (
+        out_dir / f"{BASENAME}_all{batched_decode.DECODERS_SUFFIX}"
+    ).is_file()
+    assert not (
+        out_dir / f"{BASENAME}_use_times-1{batched_decode.IMPORTANCE_SUFFIX}"
+    ).exists()
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from motor_intention import decoders
+
+COLUMNS = ("ECOG_L_1_fft_theta", "ECOG_L_1_fft_alpha")
+
+
+def _features(rng: np.random.Generator) -> pd.DataFrame:
+    features = pd.DataFrame(rng.normal(size=(60, 2)), columns=list(COLUMNS))
+    features.insert(0, "time", np.arange(60) * 100.0)
+    return features
+
+
+def _decoders(rng: np.random.Generator) -> dict[str, decoders.LinearDecoder]:
+    features = _features(rng)
+    labels = features[COLUMNS[0]].to_numpy() + rng.normal(size=60) > 0
+    return decoders.fit_lda(
+        features=features,
+        columns=COLUMNS,
+        labels=labels,
+        folds=np.repeat(np.arange(3), 20),
+    )
+
+
+def test_save_load_round_trip(tmp_path):
+    fitted = _decoders(np.random.default_rng(0))
+    metadata = {"feature_file": "sub-EL002_FEATURES.npz", "use_times": 1}
+
+    decoders.save_decoders(
+        path=tmp_path / "decoders.npz", decoders=fitted, metadata=metadata
+    )
+    loaded, loaded_metadata = decoders.load_decoders(tmp_path / "decoders.npz")
+
+    assert loaded_metadata == metadata
+    assert list(loaded) == ["fold_0", "fold_1", "fold_2", decoders.FULL]
+    for name, decoder in fitted.items():
+        assert loaded[name].columns == COLUMNS
+        np.testing.assert_array_equal(loaded[name].coef, decoder.coef)
+        assert loaded[name].intercept == decoder.intercept
+    np.testing.assert_array_equal(
+        decoders.load_decoder(tmp_path / "decoders.npz").coef,
+        fitted[decoders.FULL].coef,
+    )
+
+
+def test_unknown_format_version_is_rejected(tmp_path):
+    decoder = _decoders(np.random.default_rng(1))[decoders.FULL]
+    decoder.save(tmp_path / "decoder.npz")
+    with np.load(tmp_path / "decoder.npz") as npz:
+        content = dict(npz)
+    content["version"] = decoders.FORMAT_VERSION + 1
+    np.savez_compressed(tmp_path / "decoder.npz", **content)
+
+    with pytest.raises(ValueError, match="Unsupported decoder format version"):
+        decoders.load_decoders(tmp_path / "decoder.npz")
+
+
+def test_predict_file_matches_decision_function(tmp_path):
+    rng = np.random.default_rng(2)
+    fitted = _decoders(rng)
+    features = _features(rng)
+    features["SQUARED_EMG"] = 0.0
+    features.to_csv(tmp_path / "sub-EL002_FEATURES.csv", index=False)
+
+    predictions = decoders.predict_file(
+        path=tmp_path / "sub-EL002_FEATURES.csv", decoders=fitted
+    )
+
+    np.testing.assert_array_equal(predictions["time"], features["time"])
+    for name, decoder in fitted.items():
+        np.testing.assert_allclose(
+            predictions[name], decoder.decision_function(features)
+        )
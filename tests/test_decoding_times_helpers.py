@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import pathlib
+
+import joblib
+import numba
+import numpy as np
+import pte_stats
+import pytest
+from scipy import stats
+
+from motor_intention import decoding_times_helpers as helpers
+
+N_PERM = 200
+ALPHA = 0.05
+MIN_CLUSTER_SIZE = 2
+RESAMPLE_TRIALS = 20
+
+
+@numba.njit
+def _seed_numba(seed: int) -> None:
+    np.random.seed(seed)
+
+
+def _toy_data(rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Predictions of 30 trials that rise above zero from 0.2 s on."""
+    times = np.linspace(-1.0, 1.0, 41)
+    signal = np.clip(times - 0.2, 0, None)
+    return signal + rng.normal(scale=0.8, size=(30, times.size)), times
+
+
+def _earliest_timepoint_reference(
+    data: np.ndarray, times: np.ndarray, rng: np.random.Generator
+) -> float:
+    """Earliest timepoint of one iteration computed with pte_stats."""
+    trials = rng.choice(len(data), size=RESAMPLE_TRIALS, replace=False)
+    p_vals = pte_stats.timeseries_pvals(
+        x=data[trials].T, y=0, n_perm=N_PERM, two_tailed=False
+    )
+    clusters, cluster_count = pte_stats.clusters_from_pvals(
+        p_vals=p_vals,
+        correction_method="cluster_pvals",
+        alpha=ALPHA,
+        n_perm=N_PERM,
+        min_cluster_size=MIN_CLUSTER_SIZE,
+    )
+    if cluster_count == 0:
+        return times[-1]
+    return times[np.flatnonzero(np.asarray(clusters))[0]]
+
+
+def test_sign_flips_are_drawn_per_timepoint():
+    rng = np.random.default_rng(0)
+    # All timepoints hold the same values, so shared signs give equal p-values
+    zeroed = np.repeat(rng.normal(size=(1, 20, 1)), 30, axis=2)
+
+    p_vals = helpers._pvals_onesample(
+        zeroed=zeroed, sign_seeds=np.array([1]), n_perm=N_PERM
+    )
+
+    assert np.unique(p_vals).size > 1
+
+
+def test_pvals_do_not_depend_on_permutation_chunks():
+    rng = np.random.default_rng(0)
+    zeroed = rng.normal(size=(3, 20, 30))
+    sign_seeds = np.array([1, 2, 3])
+
+    p_vals = [
+        helpers._pvals_onesample(
+            zeroed=zeroed,
+            sign_seeds=sign_seeds,
+            n_perm=N_PERM,
+            max_elements=max_elements,
+        )
+        for max_elements in (20 * 30, 7 * 20 * 30, 2**22)
+    ]
+
+    np.testing.assert_array_equal(p_vals[0], p_vals[1])
+    np.testing.assert_array_equal(p_vals[0], p_vals[2])
+
+
+def test_earliest_timepoints_match_pte_stats():
+    rng = np.random.default_rng(42)
+    data, times = _toy_data(rng)
+    n_iterations = 300
+
+    batched, trials_used = helpers.earliest_timepoints_batched(
+        data=data,
+        times=times,
+        n_iterations=n_iterations,
+        n_perm=N_PERM,
+        alpha=ALPHA,
+        min_cluster_size=MIN_CLUSTER_SIZE,
+        resample_trials=RESAMPLE_TRIALS,
+        rng=1,
+    )
+    np.random.seed(2)
+    _seed_numba(2)
+    reference = np.array(
+        [
+            _earliest_timepoint_reference(data=data, times=times, rng=rng)
+            for _ in range(n_iterations)
+        ]
+    )
+
+    assert trials_used == RESAMPLE_TRIALS
+    standard_error = np.sqrt(
+        (batched.var(ddof=1) + reference.var(ddof=1)) / n_iterations
+    )
+    assert abs(batched.mean() - reference.mean()) < 3 * standard_error
+    assert stats.ks_2samp(batched, reference).pvalue > 0.01
+
+
+def test_index_banks_are_built_once_per_shape(monkeypatch):
+    rng = np.random.default_rng(0)
+    times = np.linspace(-1.0, 1.0, 11)
+    # Six trial counts, two recordings each
+    recordings = {
+        (n_trials, rec): (rng.normal(size=(n_trials, times.size)), {})
+        for n_trials in range(10, 16)
+        for rec in range(2)
+    }
+    built = []
+    get_index_bank = helpers.get_index_bank
+
+    def _get_index_bank(**kwargs):
+        built.append(kwargs["n_trials"])
+        return get_index_bank(**kwargs)
+
+    monkeypatch.setattr(helpers, "get_index_bank", _get_index_bank)
+    results = {
+        n_jobs: {
+            key: timepoints
+            for key, timepoints, _ in helpers.schedule_timepoints(
+                recordings=recordings,
+                n_iterations=20,
+                chunk_size=5,
+                n_jobs=n_jobs,
+                index_bank_seed=1,
+                times=times,
+                n_perm=50,
+            )
+        }
+        for n_jobs in (1, 2)
+    }
+
+    assert sorted(built) == sorted(2 * list(range(10, 16)))
+    assert results[1].keys() == recordings.keys()
+    for key in recordings:
+        np.testing.assert_array_equal(results[1][key], results[2][key])
+
+
+def test_adaptive_iterations_stop_once_converged():
+    rng = np.random.default_rng(0)
+    times = np.linspace(-1.0, 1.0, 11)
+    # Predictions above zero everywhere, so every iteration finds times[0]
+    data = 5.0 + rng.normal(scale=0.1, size=(20, times.size))
+    kwargs = {"times": times, "n_perm": 50, "resample_trials": 10, "rng": 1}
+
+    results = {
+        n_jobs: helpers.earliest_timepoints_adaptive(
+            data=data,
+            tolerance=0.01,
+            max_iterations=200,
+            min_iterations=40,
+            check_interval=20,
+            n_jobs=n_jobs,
+            chunk_size=10,
+            **kwargs,
+        )
+        for n_jobs in (1, 2)
+    }
+    ((_, full, _),) = helpers.schedule_timepoints(
+        recordings={"rec": (data, {})},
+        n_iterations=200,
+        chunk_size=10,
+        n_jobs=1,
+        **kwargs,
+    )
+
+    timepoints, trials_used = results[1]
+    assert timepoints.size == 40
+    assert trials_used == 10
+    np.testing.assert_array_equal(timepoints, results[2][0])
+    np.testing.assert_array_equal(timepoints, full[:40])
+
+
+def test_adaptive_iterations_continue_until_converged():
+    rng = np.random.default_rng(42)
+    data, times = _toy_data(rng)
+
+    timepoints, _ = helpers.earliest_timepoints_adaptive(
+        data=data,
+        tolerance=0.0,
+        max_iterations=60,
+        min_iterations=20,
+        check_interval=20,
+        chunk_size=10,
+        times=times,
+        n_perm=50,
+        resample_trials=RESAMPLE_TRIALS,
+        rng=1,
+    )
+
+    assert timepoints.size == 60
+
+
+def _shared_view(path: pathlib.Path) -> tuple[bool, str, bool, float]:
+    array = helpers.load_shared_array(path)
+    return (
+        isinstance(array, np.memmap),
+        str(array.filename),
+        array.flags.writeable,
+        float(array.sum()),
+    )
+
+
+def test_workers_memory_map_shared_array(tmp_path):
+    array = np.arange(12.0).reshape(3, 4)
+
+    with helpers.shared_array(array, temp_dir=tmp_path) as path:
+        views = joblib.Parallel(n_jobs=2)(
+            joblib.delayed(_shared_view)(path) for _ in range(2)
+        )
+
+    assert not path.exists()
+    for is_memmap, filename, writeable, total in views:
+        assert is_memmap
+        assert filename == str(path)
+        assert not writeable
+        assert total == array.sum()
+
+
+def test_scheduled_units_receive_shared_array_paths(monkeypatch):
+    rng = np.random.default_rng(0)
+    data, times = _toy_data(rng)
+    sources = []
+    schedule_unit = helpers._schedule_unit
+
+    def _schedule_unit(source, **kwargs):
+        sources.append(source)
+        return schedule_unit(source=source, **kwargs)
+
+    monkeypatch.setattr(helpers, "_schedule_unit", _schedule_unit)
+    # Threads share the patched function, but get the same arguments as
+    # processes would
+    with joblib.parallel_config(backend="threading"):
+        list(
+            helpers.schedule_timepoints(
+                recordings={"rec": (data, {})},
+                n_iterations=10,
+                chunk_size=5,
+                n_jobs=2,
+                times=times,
+                n_perm=20,
+            )
+        )
+
+    assert len(sources) == 2
+    assert all(isinstance(source, pathlib.Path) for source in sources)
+
+
+def test_cache_misses_changed_input_or_parameters(tmp_path):
+    recording = tmp_path / "predictions.npy"
+    np.save(recording, np.zeros(3))
+    parameters = {"n_perm": 500, "alpha": 0.05}
+    key = helpers.cache_key(
+        file_hash=helpers.hash_file(recording), parameters=parameters
+    )
+    helpers.save_cached(
+        cache_dir=tmp_path / "cache", key=key, result={"trials_used": 3}
+    )
+    np.save(recording, np.ones(3))
+
+    changed_input = helpers.cache_key(
+        file_hash=helpers.hash_file(recording), parameters=parameters
+    )
+    changed_parameters = helpers.cache_key(
+        file_hash=helpers.hash_file(recording),
+        parameters={**parameters, "n_perm": 1000},
+    )
+
+    assert helpers.load_cached(tmp_path / "cache", key) == {"trials_used": 3}
+    assert changed_input != key
+    assert changed_parameters not in (key, changed_input)
+    for missed in (changed_input, changed_parameters):
+        assert helpers.load_cached(tmp_path / "cache", missed) is None
+
+
+def test_interrupted_schedule_resumes_from_checkpoint(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    data, times = _toy_data(rng)
+    kwargs = {
+        "recordings": {"rec": (data, {"checkpoint_name": "rec"})},
+        "n_iterations": 20,
+        "chunk_size": 5,
+        "n_jobs": 1,
+        "rng": 1,
+        "checkpoint_dir": tmp_path,
+        "times": times,
+        "n_perm": 20,
+    }
+    ((_, expected, _),) = helpers.schedule_timepoints(
+        **{**kwargs, "checkpoint_dir": None}
+    )
+    computed = []
+    limit = [2]
+    schedule_unit = helpers._schedule_unit
+
+    def _schedule_unit(chunk_idx, **kwargs):
+        if len(computed) == limit[0]:
+            msg = "Interrupted"
+            raise KeyboardInterrupt(msg)
+        computed.append(chunk_idx)
+        return schedule_unit(chunk_idx=chunk_idx, **kwargs)
+
+    monkeypatch.setattr(helpers, "_schedule_unit", _schedule_unit)
+    with pytest.raises(KeyboardInterrupt, match="Interrupted"):
+        list(helpers.schedule_timepoints(**kwargs))
+    interrupted = computed.copy()
+    computed.clear()
+    limit[0] = None
+    ((_, resumed, _),) = helpers.schedule_timepoints(**kwargs)
+
+    assert len(interrupted) == 2
+    assert sorted(interrupted + computed) == [0, 1, 2, 3]
+    np.testing.assert_array_equal(resumed, expected)
+    assert not (tmp_path / "rec.json").exists()
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from motor_intention import feature_importance
+
+COLUMNS = [
+    "ECOG_L_1_fft_theta",
+    "ECOG_L_1_fft_alpha",
+    "ECOG_L_2_fft_theta",
+    "ECOG_L_2_fft_alpha",
+]
+
+
+DATA = {"n_samples": 300, "effects": [2.0, 0.0, 0.0, -1.0]}
+
+
+def _importance_loop(
+    X: np.ndarray,
+    y: np.ndarray,
+    groups: dict[str, np.ndarray],
+    coef: np.ndarray,
+    intercept: float,
+    n_repeats: int,
+    random_state: int,
+) -> np.ndarray:
+    """Permute one group at a time and re-predict, as a reference."""
+    rng = np.random.default_rng(random_state)
+    baseline = feature_importance.balanced_accuracy(
+        y, X @ coef + intercept > 0
+    )
+    decreases = np.empty((n_repeats, len(groups)))
+    for repeat in range(n_repeats):
+        permutation = rng.permutation(len(X))
+        for idx, columns in enumerate(groups.values()):
+            permuted = X.copy()
+            permuted[:, columns] = X[permutation][:, columns]
+            decreases[repeat, idx] = baseline - (
+                feature_importance.balanced_accuracy(
+                    y, permuted @ coef + intercept > 0
+                )
+            )
+    return decreases.mean(axis=0)
+
+
+@pytest.mark.parametrize("by", ["column", "band", "channel"])
+def test_linear_fast_path_matches_loop(make_data, by):
+    rng = np.random.default_rng(0)
+    X, y = make_data(rng, **DATA)
+    coef = np.array([1.0, 0.2, -0.1, -0.5])
+    groups = feature_importance.feature_groups(COLUMNS, by=by)
+
+    importance = feature_importance.permutation_importance(
+        X=X,
+        y=y,
+        groups=groups,
+        coef=coef,
+        intercept=-1.0,
+        n_repeats=4,
+        random_state=1,
+    )
+
+    np.testing.assert_allclose(
+        importance["importance_mean"],
+        _importance_loop(
+            X=X,
+            y=y,
+            groups=groups,
+            coef=coef,
+            intercept=-1.0,
+            n_repeats=4,
+            random_state=1,
+        ),
+    )
+
+
+def test_decision_function_path_matches_linear_path(make_data):
+    rng = np.random.default_rng(1)
+    X, y = make_data(rng, **DATA)
+    coef = np.array([1.0, 0.2, -0.1, -0.5])
+    groups = feature_importance.feature_groups(COLUMNS, by="band")
+    kwargs = {"X": X, "y": y, "groups": groups, "random_state": 2}
+
+    linear = feature_importance.permutation_importance(
+        coef=coef, intercept=-1.0, **kwargs
+    )
+    stacked = feature_importance.permutation_importance(
+        decision_function=lambda features: features @ coef - 1.0, **kwargs
+    )
+
+    np.testing.assert_allclose(
+        linear["importance_mean"], stacked["importance_mean"]
+    )
+
+
+def test_fold_importances_ranks_informative_column_first(make_data):
+    rng = np.random.default_rng(2)
+    X, y = make_data(rng, **DATA)
+    folds = np.repeat(np.arange(3), 100)
+    coef = np.tile([2.0, 0.0, 0.0, -1.0], (3, 1))
+
+    importance = feature_importance.fold_importances(
+        X=X,
+        y=y,
+        folds=folds,
+        coef=coef,
+        intercept=np.full(3, -1.0),
+        groups=feature_importance.feature_groups(COLUMNS),
+        random_state=0,
+        n_jobs=1,
+    )
+
+    assert sorted(importance["fold"].unique()) == [0, 1, 2]
+    mean = importance.groupby("group")["importance_mean"].mean()
+    assert mean.idxmax() == COLUMNS[0]
+    assert mean[COLUMNS[1]] == 0
+
+
+def test_fold_importances_of_rows_function_match_array(make_data):
+    rng = np.random.default_rng(2)
+    X, y = make_data(rng, **DATA)
+    folds = np.repeat(np.arange(3), 100)
+    parameters = {
+        "y": y,
+        "folds": folds,
+        "coef": np.tile([2.0, 0.0, 0.0, -1.0], (3, 1)),
+        "intercept": np.full(3, -1.0),
+        "groups": feature_importance.feature_groups(COLUMNS),
+        "random_state": 0,
+        "n_jobs": 1,
+    }
+    masks = []
+
+    def rows(mask):
+        masks.append(mask)
+        return X[mask]
+
+    expected = feature_importance.fold_importances(X=X, **parameters)
+    importance = feature_importance.fold_importances(X=rows, **parameters)
+
+    pd.testing.assert_frame_equal(importance, expected)
+    # Rows are requested per fold
+    assert [mask.sum() for mask in masks] == [100, 100, 100]
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from motor_intention import feature_scheduling
+
+
+def test_longest_first_orders_by_decreasing_cost():
+    costs = [2.0, 8.0, 1.0, 8.0, 5.0]
+
+    order = feature_scheduling.longest_first(costs)
+
+    # Ties keep the order of the files
+    assert order.tolist() == [1, 3, 4, 0, 2]
+
+
+def test_longest_first_reduces_makespan():
+    costs = [1.0, 1.0, 1.0, 1.0, 4.0]
+    ordered = [costs[idx] for idx in feature_scheduling.longest_first(costs)]
+
+    assert feature_scheduling.makespan(costs, n_workers=2) == 6.0
+    assert feature_scheduling.makespan(ordered, n_workers=2) == 4.0
+    assert feature_scheduling.makespan(costs, n_workers=1) == sum(costs)
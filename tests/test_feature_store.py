@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from motor_intention import feature_store
+
+
+def _features(rng: np.random.Generator) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "ECOG_L_1_SMC_AT_fft_theta": rng.normal(size=10),
+            "ECOG_L_1_SMC_AT_fft_high beta": rng.normal(size=10),
+            "LFP_R_1_STN_MT_bandpass_alpha": rng.normal(size=10),
+            "time": np.arange(10) * 100.0 + 0.1,
+            "SQUARED_ROTATION": rng.normal(size=10),
+        }
+    )
+
+
+def test_features_round_trip(tmp_path):
+    features = _features(np.random.default_rng(0))
+    path = tmp_path / "sub_FEATURES.npz"
+
+    feature_store.write_features(features, path)
+    loaded = feature_store.read_features(path, keywords=None)
+    metadata = feature_store.read_metadata(path)
+
+    pd.testing.assert_frame_equal(
+        loaded, features, check_dtype=False, rtol=1e-6
+    )
+    assert loaded["time"].dtype == np.float64
+    np.testing.assert_array_equal(loaded["time"], features["time"])
+    assert (loaded.drop(columns="time").dtypes == np.float32).all()
+    assert metadata.to_dict("list") == {
+        "column": features.columns.tolist(),
+        "channel": [
+            "ECOG_L_1_SMC_AT",
+            "ECOG_L_1_SMC_AT",
+            "LFP_R_1_STN_MT",
+            "time",
+            "SQUARED_ROTATION",
+        ],
+        "band": ["theta", "high beta", "alpha", "", ""],
+    }
+
+
+def test_read_features_selects_columns(tmp_path):
+    features = _features(np.random.default_rng(0))
+    path = tmp_path / "sub_FEATURES.npz"
+    feature_store.write_features(features, path)
+
+    loaded = feature_store.read_features(
+        path, keywords=["fft_theta"], columns=["time", "SQUARED_ROTATION"]
+    )
+
+    assert loaded.columns.tolist() == [
+        "ECOG_L_1_SMC_AT_fft_theta",
+        "time",
+        "SQUARED_ROTATION",
+    ]
+
+
+def test_manifest_skips_and_invalidates(tmp_path):
+    raw = tmp_path / "raw" / "sub_run-1_ieeg.vhdr"
+    raw.parent.mkdir()
+    raw.write_text("header")
+    raw.with_suffix(".eeg").write_bytes(b"data")
+    settings = tmp_path / "settings.json"
+    settings.write_text("{}")
+    inputs = {"raw": raw, "settings": settings}
+    folder = tmp_path / "features" / "sub_run-1"
+    hashes = feature_store.input_hashes(inputs)
+
+    assert sorted(hashes) == [
+        "raw:sub_run-1_ieeg.eeg",
+        "raw:sub_run-1_ieeg.vhdr",
+        "settings:settings.json",
+    ]
+    # Features must exist besides the manifest
+    folder.mkdir(parents=True)
+    feature_store.write_manifest(folder, hashes)
+    assert not feature_store.is_up_to_date(folder, hashes)
+    feature_store.write_features(
+        _features(np.random.default_rng(0)),
+        folder / f"{folder.name}{feature_store.SUFFIX}",
+    )
+    assert feature_store.is_up_to_date(folder, hashes)
+
+    raw.with_suffix(".eeg").write_bytes(b"changed")
+    assert not feature_store.is_up_to_date(
+        folder, feature_store.input_hashes(inputs)
+    )
+    settings.write_text('{"changed": true}')
+    raw.with_suffix(".eeg").write_bytes(b"data")
+    assert not feature_store.is_up_to_date(
+        folder, feature_store.input_hashes(inputs)
+    )
+
+
+def test_projection_is_reused_until_source_changes(tmp_path):
+    folder = tmp_path / "features" / "sub_run-1"
+    file = folder / f"{folder.name}{feature_store.SUFFIX}"
+    feature_store.write_features(_features(np.random.default_rng(0)), file)
+    (folder / f"{folder.name}_SETTINGS.json").write_text("{}")
+    kwargs = {"out_root": tmp_path / "projected", "keywords": ["fft_theta"]}
+
+    (out_file,) = feature_store.project_features(files=[file], **kwargs)
+    mtime = out_file.stat().st_mtime_ns
+    feature_store.project_features(files=[file], **kwargs)
+    reused = out_file.stat().st_mtime_ns == mtime
+    feature_store.write_features(_features(np.random.default_rng(1)), file)
+    feature_store.project_features(files=[file], **kwargs)
+
+    assert reused
+    assert (out_file.parent / f"{folder.name}_SETTINGS.json").is_file()
+    assert pd.read_csv(out_file).columns.tolist() == [
+        "ECOG_L_1_SMC_AT_fft_theta",
+        "time",
+    ]
+    np.testing.assert_allclose(
+        pd.read_csv(out_file)["ECOG_L_1_SMC_AT_fft_theta"],
+        _features(np.random.default_rng(1))["ECOG_L_1_SMC_AT_fft_theta"],
+        rtol=1e-6,
+    )
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from motor_intention import feature_stream, instrumentation
+
+
+class _Raw:
+    """Raw recording that records the shape of every read."""
+
+    def __init__(self, data: np.ndarray, names: list[str]) -> None:
+        self.data = data
+        self.names = names
+        self.n_times = data.shape[1]
+        self.reads: list[tuple[int, int]] = []
+
+    def get_data(self, picks=None, start=0, stop=None) -> np.ndarray:
+        rows = (
+            slice(None)
+            if picks is None
+            else [self.names.index(name) for name in picks]
+        )
+        data = self.data[rows, start:stop]
+        self.reads.append(data.shape)
+        return data
+
+
+def _raw(stream, rng: np.random.Generator, n_times: int) -> _Raw:
+    names = stream.nm_channels["name"].to_list()
+    return _Raw(rng.normal(size=(len(names), n_times)), names=names)
+
+
+def test_run_blockwise_matches_windows_and_labels(stream):
+    raw = _raw(stream, np.random.default_rng(0), n_times=5000)
+
+    features = feature_stream.run_blockwise(
+        stream=stream,
+        raw=raw,
+        out_path_root="out",
+        folder_name="sub-EL002",
+        batches_per_block=7,
+    )
+
+    starts, stops = feature_stream.batch_bounds(
+        n_samples=raw.n_times,
+        sfreq=stream.sfreq,
+        segment_length_ms=stream.settings["segment_length_features_ms"],
+        sfreq_features=stream.settings["sampling_rate_features_hz"],
+    )
+    assert stream.saved["sub-EL002"] is features
+    np.testing.assert_array_equal(features["first"], raw.data[0, starts])
+    np.testing.assert_array_equal(features["last"], raw.data[0, stops - 1])
+    samples = (features["time"].to_numpy() * stream.sfreq / 1000).astype(int)
+    np.testing.assert_array_equal(samples, stops)
+    np.testing.assert_array_equal(
+        features["SQUARED_EMG"], raw.data[2, samples]
+    )
+    # Label channels are read block by block, not for the whole recording
+    assert max(n_samples for _, n_samples in raw.reads) < 1000
+
+
+class _Kernel:
+    def calc_feature(self, data: np.ndarray, features: dict) -> dict:
+        features["kernel"] = data.mean()
+        return features
+
+
+def test_instrumented_run_records_feature_timings(stream):
+    raw = _raw(stream, np.random.default_rng(1), n_times=2000)
+    kernels = [_Kernel(), _Kernel()]
+
+    def process(window: np.ndarray) -> pd.Series:
+        features = {}
+        for kernel in kernels:
+            features = kernel.calc_feature(window, features)
+        return pd.Series(features)
+
+    stream.run_analysis = types.SimpleNamespace(
+        process=process,
+        features=types.SimpleNamespace(features=kernels),
+    )
+    timer = instrumentation.StageTimer()
+
+    feature_stream.instrument_features(stream=stream, timer=timer)
+    feature_stream.run_blockwise(
+        stream=stream,
+        raw=raw,
+        out_path_root="out",
+        folder_name="sub-EL002",
+        timer=timer,
+    )
+
+    report = timer.report()
+    assert report["time_features__Kernel"] > 0
+    assert report["time_process"] >= report["time_features__Kernel"]
+    assert {"time_read", "time_save"} <= report.keys()
+
+
+def test_instrument_features_without_kernels_records_untimed_stage(stream):
+    timer = instrumentation.StageTimer()
+
+    with pytest.warns(UserWarning, match="Feature kernels not found"):
+        feature_stream.instrument_features(stream=stream, timer=timer)
+
+    assert np.isnan(timer.report()["time_features"])
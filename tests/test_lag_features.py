@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+
+from motor_intention import lag_features
+
+USE_TIMES = 3
+
+
+def _lag_matrix(
+    features: np.ndarray, use_times: int, normalization_mode=None
+) -> np.ndarray:
+    """Lagged design matrix built explicitly, one copy per lag."""
+    n_rows = len(features) - use_times + 1
+    lags = [features[lag : lag + n_rows] for lag in range(use_times)]
+    if normalization_mode == "by_latest_sample":
+        lags = [lag - lags[-1] for lag in lags[:-1]] + [lags[-1]]
+    return np.hstack(lags)
+
+
+def _data(
+    rng: np.random.Generator,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    features = rng.normal(size=(120, 4))
+    y = rng.random(120 - USE_TIMES + 1) < 0.5
+    features[USE_TIMES - 1 :, 0] += y
+    train = np.stack([np.arange(len(y)) % 4 != fold for fold in range(4)])
+    return features, y, train
+
+
+def test_lag_view_shares_memory():
+    features = np.arange(40.0).reshape(10, 4)
+
+    design = lag_features.lag_view(features, use_times=USE_TIMES)
+
+    assert np.shares_memory(design, features)
+    assert not design.flags.writeable
+    np.testing.assert_array_equal(
+        design, _lag_matrix(features, use_times=USE_TIMES)
+    )
+
+
+def test_lag_view_of_non_contiguous_features():
+    features = np.arange(80.0).reshape(10, 8)[:, ::2]
+
+    design = lag_features.lag_view(features, use_times=USE_TIMES)
+
+    np.testing.assert_array_equal(
+        design, _lag_matrix(features, use_times=USE_TIMES)
+    )
+
+
+@pytest.mark.parametrize("normalization_mode", [None, "by_latest_sample"])
+def test_iter_design_matches_lag_matrix(normalization_mode):
+    features = np.random.default_rng(0).normal(size=(50, 4))
+
+    chunks = list(
+        lag_features.iter_design(
+            features=features,
+            use_times=USE_TIMES,
+            normalization_mode=normalization_mode,
+            chunk_size=7,
+        )
+    )
+
+    if normalization_mode is None:
+        assert all(np.shares_memory(chunk, features) for _, chunk in chunks)
+    np.testing.assert_array_equal(
+        np.concatenate([chunk for _, chunk in chunks]),
+        _lag_matrix(features, USE_TIMES, normalization_mode),
+    )
+
+
+@pytest.mark.parametrize("normalization_mode", [None, "by_latest_sample"])
+def test_design_rows_match_lag_matrix(normalization_mode):
+    features = np.random.default_rng(0).normal(size=(50, 4))
+    rows = np.array([3, 4, 20, 47])
+
+    design = lag_features.design_rows(
+        features=features,
+        rows=rows,
+        use_times=USE_TIMES,
+        normalization_mode=normalization_mode,
+    )
+
+    assert not np.shares_memory(design, features)
+    np.testing.assert_array_equal(
+        design, _lag_matrix(features, USE_TIMES, normalization_mode)[rows]
+    )
+
+
+@pytest.mark.parametrize("normalization_mode", [None, "by_latest_sample"])
+def test_fit_lda_matches_sklearn(normalization_mode):
+    features, y, train = _data(np.random.default_rng(1))
+    design = _lag_matrix(features, USE_TIMES, normalization_mode)
+
+    coef, intercept = lag_features.fit_lda(
+        features=features,
+        y=y,
+        train=train,
+        use_times=USE_TIMES,
+        normalization_mode=normalization_mode,
+        chunk_size=16,
+    )
+    decision = lag_features.decision_function(
+        features=features,
+        coef=coef,
+        intercept=intercept,
+        use_times=USE_TIMES,
+        normalization_mode=normalization_mode,
+    )
+
+    for fold, train_fold in enumerate(train):
+        model = LinearDiscriminantAnalysis(solver="lsqr").fit(
+            design[train_fold], y[train_fold]
+        )
+        np.testing.assert_allclose(coef[fold], model.coef_[0])
+        np.testing.assert_allclose(
+            decision[fold], model.decision_function(design), atol=1e-10
+        )
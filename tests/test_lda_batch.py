@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+
+from motor_intention import lda_batch
+
+# Features of 3 channels with 2 features each, with large offsets to check
+# numerical stability of sums of squares
+DATA = {
+    "n_samples": 200,
+    "effects": [0.5, -0.3],
+    "n_channels": 3,
+    "p_positive": 0.4,
+    "offset": 1e3,
+}
+FOLDS = np.repeat(np.arange(5), 40)
+
+
+def _sklearn_decision_function(
+    X: np.ndarray, y: np.ndarray, folds: np.ndarray
+) -> np.ndarray:
+    predictions = np.full(X.shape[:2], np.nan)
+    for channel, X_channel in enumerate(X):
+        for fold in np.unique(folds):
+            test = folds == fold
+            model = LinearDiscriminantAnalysis(solver="lsqr").fit(
+                X_channel[~test], y[~test]
+            )
+            predictions[channel, test] = model.decision_function(
+                X_channel[test]
+            )
+    return predictions
+
+
+def test_fit_matches_sklearn(make_data):
+    rng = np.random.default_rng(0)
+    X, y = make_data(rng, **DATA)
+    train = np.ones((1, len(y)), dtype=bool)
+
+    coef, intercept = lda_batch.fit(X=X, y=y, train=train)
+
+    for channel, X_channel in enumerate(X):
+        model = LinearDiscriminantAnalysis(solver="lsqr").fit(X_channel, y)
+        np.testing.assert_allclose(coef[channel, 0], model.coef_[0])
+        np.testing.assert_allclose(
+            lda_batch.decision_function(X=X, coef=coef, intercept=intercept)[
+                channel, 0
+            ],
+            model.decision_function(X_channel),
+            atol=1e-8,
+        )
+
+
+@pytest.mark.parametrize("method", ["downdate", "refit"])
+def test_cross_val_decision_function_matches_sklearn(make_data, method):
+    rng = np.random.default_rng(1)
+    X, y = make_data(rng, **DATA)
+    folds = FOLDS.copy()
+
+    predictions = lda_batch.cross_val_decision_function(
+        X=X, y=y, folds=folds, method=method
+    )
+
+    np.testing.assert_allclose(
+        predictions,
+        _sklearn_decision_function(X=X, y=y, folds=folds),
+        atol=1e-8,
+    )
+
+
+def test_negative_folds_are_only_used_for_training(make_data):
+    rng = np.random.default_rng(2)
+    X, y = make_data(rng, **DATA)
+    folds = FOLDS.copy()
+    folds[:40] = -1
+
+    predictions = lda_batch.cross_val_decision_function(X=X, y=y, folds=folds)
+
+    assert np.isnan(predictions[:, :40]).all()
+    assert not np.isnan(predictions[:, 40:]).any()
+
+
+def test_priors_match_sklearn(make_data):
+    rng = np.random.default_rng(3)
+    X, y = make_data(rng, **DATA)
+    train = np.ones((1, len(y)), dtype=bool)
+
+    coef, intercept = lda_batch.fit(
+        X=X, y=y, train=train, priors=np.array([0.5, 0.5])
+    )
+
+    model = LinearDiscriminantAnalysis(solver="lsqr", priors=[0.5, 0.5])
+    model.fit(X[0], y)
+    np.testing.assert_allclose(coef[0, 0], model.coef_[0])
+    np.testing.assert_allclose(intercept[0, 0], model.intercept_[0])
+
+
+def test_fit_folds_downdate_matches_refit(make_data):
+    rng = np.random.default_rng(4)
+    X, y = make_data(rng, **DATA)
+    folds = FOLDS.copy()
+
+    downdate = lda_batch.fit_folds(X=X, y=y, folds=folds, method="downdate")
+    refit = lda_batch.fit_folds(X=X, y=y, folds=folds, method="refit")
+
+    assert downdate[0].shape == (3, 5, 2)
+    np.testing.assert_allclose(downdate[0], refit[0])
+    np.testing.assert_allclose(downdate[1], refit[1])
+
+
+def test_cross_val_decision_function_returns_fold_models(make_data):
+    rng = np.random.default_rng(5)
+    X, y = make_data(rng, **DATA)
+
+    predictions, coef, intercept = lda_batch.cross_val_decision_function(
+        X=X, y=y, folds=FOLDS, return_models=True
+    )
+    expected = lda_batch.fit_folds(X=X, y=y, folds=FOLDS)
+
+    np.testing.assert_array_equal(coef, expected[0])
+    np.testing.assert_array_equal(intercept, expected[1])
+    np.testing.assert_array_equal(
+        predictions,
+        lda_batch.cross_val_decision_function(X=X, y=y, folds=FOLDS),
+    )
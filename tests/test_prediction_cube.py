@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from motor_intention import prediction_cube
+
+
+def _cube(tmp_path):
+    index = pd.DataFrame(
+        {
+            "Pipeline": ["stim_off"] * 4 + ["stim_on"] * 2,
+            "ChannelType": ["ecog"] * 6,
+            "Medication": ["OFF", "OFF", "ON", "ON", "OFF", "OFF"],
+            "Stimulation": ["OFF"] * 4 + ["ON"] * 2,
+            "Subject": ["001", "002", "001", "002", "001", "002"],
+        }
+    )
+    cube = np.arange(6 * 5, dtype=np.float32).reshape(6, 5)
+    index.to_csv(tmp_path / prediction_cube.INDEX, index=False)
+    np.save(tmp_path / prediction_cube.CUBE, cube)
+    np.save(tmp_path / prediction_cube.TIMES, np.linspace(-1, 1, 5))
+    return prediction_cube.read_prediction_cube(tmp_path)
+
+
+def test_select_condition_is_view_of_memory_map(tmp_path):
+    index, cube, _ = _cube(tmp_path)
+
+    selected, predictions = prediction_cube.select(
+        index=index, cube=cube, query="Medication == 'ON'"
+    )
+
+    assert isinstance(cube, np.memmap)
+    assert selected["Subject"].tolist() == ["001", "002"]
+    assert np.shares_memory(predictions, cube)
+    np.testing.assert_array_equal(predictions, cube[2:4])
+
+
+def test_select_across_conditions_copies_rows(tmp_path):
+    index, cube, _ = _cube(tmp_path)
+
+    selected, predictions = prediction_cube.select(
+        index=index, cube=cube, query="Subject == '001'"
+    )
+
+    assert selected.index.tolist() == [0, 2, 4]
+    assert not np.shares_memory(predictions, cube)
+    np.testing.assert_array_equal(predictions, cube[[0, 2, 4]])
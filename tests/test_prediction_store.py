@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import json
+import pathlib
+
+import numpy as np
+import pandas as pd
+import pte_decode
+
+from motor_intention import prediction_store
+
+
+def _load_predictions(files, baseline, average_predictions):
+    (file,) = files
+    content = json.loads(pathlib.Path(file).read_text())
+    return pd.DataFrame(
+        {
+            "Subject": [content["subject"]],
+            "Predictions": [np.asarray(content["predictions"])],
+            "times": [np.asarray(content["times"])],
+            "trial_ids": [np.asarray(content["trial_ids"])],
+        }
+    )
+
+
+def test_store_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        pte_decode, "load_predictions", _load_predictions, raising=False
+    )
+    rng = np.random.default_rng(0)
+    files, expected = [], []
+    for idx, n_trials in enumerate([3, 1, 5, 2, 4]):
+        predictions = rng.normal(size=(n_trials, 7)).astype(np.float32)
+        file = tmp_path / f"sub-{idx:03d}_PredTimelocked.json"
+        file.write_text(
+            json.dumps(
+                {
+                    "subject": f"{idx:03d}",
+                    "predictions": predictions.tolist(),
+                    "times": np.linspace(-1, 1, 7).tolist(),
+                    "trial_ids": list(range(n_trials)),
+                }
+            )
+        )
+        files.append(file)
+        expected.append(predictions)
+
+    index = prediction_store.write_prediction_store(
+        files=files, store_dir=tmp_path / "store"
+    )
+    data = prediction_store.read_prediction_store(tmp_path / "store")
+
+    assert index["fname"].tolist() == [file.name for file in files]
+    assert data["Subject"].tolist() == [f"{idx:03d}" for idx in range(5)]
+    for predictions, loaded in zip(expected, data["Predictions"], strict=True):
+        np.testing.assert_array_equal(loaded, predictions)
+    offsets = index["offset_Predictions"].to_numpy()
+    np.testing.assert_array_equal(
+        offsets, np.cumsum([0, *(p.size for p in expected[:-1])])
+    )
+    stored = np.load(tmp_path / "store" / "predictions.npy")
+    assert stored.shape == (sum(p.size for p in expected),)
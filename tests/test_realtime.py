@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from motor_intention import decoders, feature_stream, realtime
+
+
+def _decoder() -> decoders.LinearDecoder:
+    return decoders.LinearDecoder(
+        columns=("last", "length"), coef=np.array([1.0, 0.0]), intercept=0.0
+    )
+
+
+def test_step_fires_on_last_sample_of_window(stream):
+    n_samples, step = 1000, 437
+    data = np.zeros((len(stream.nm_channels), n_samples))
+    data[:, step:] = 1.0
+    starts, stops = feature_stream.batch_bounds(
+        n_samples=n_samples,
+        sfreq=stream.sfreq,
+        segment_length_ms=stream.settings["segment_length_features_ms"],
+        sfreq_features=stream.settings["sampling_rate_features_hz"],
+    )
+    first_step = np.flatnonzero(stops - 1 >= step)[0]
+
+    online = realtime.OnlineDecoder(stream=stream, decoder=_decoder())
+    fired = {}
+    for sample in range(n_samples):
+        for result in online.push(data[:, sample : sample + 1], arrival=0.0):
+            fired[result["sample"]] = (sample, result["prediction"])
+
+    sample, prediction = fired[stops[first_step]]
+    assert prediction == 1.0
+    # Pushed together with the last sample of its window, not one later
+    assert sample == stops[first_step] - 1
+    assert fired[stops[first_step - 1]][1] == 0.0
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 333, 1000])
+def test_windows_match_offline_bounds(stream, chunk_size):
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(len(stream.nm_channels), 1000))
+    starts, stops = feature_stream.batch_bounds(
+        n_samples=data.shape[1] + 1,
+        sfreq=stream.sfreq,
+        segment_length_ms=stream.settings["segment_length_features_ms"],
+        sfreq_features=stream.settings["sampling_rate_features_hz"],
+    )
+    online = realtime.OnlineDecoder(stream=stream, decoder=_decoder())
+    results = []
+    for first in range(0, data.shape[1], chunk_size):
+        results.extend(
+            online.push(data[:, first : first + chunk_size], arrival=0.0)
+        )
+
+    assert [result["sample"] for result in results] == stops.tolist()
+    np.testing.assert_array_equal(
+        [result["prediction"] for result in results], data[0, stops - 1]
+    )